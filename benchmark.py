@@ -0,0 +1,1718 @@
+"""Benchmarks for the PDF Extraction HUB API.
+
+Usage:
+    python benchmark.py run --corpus bench_corpus --out results.json --markdown results.md
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+    python benchmark.py startup --engines pymupdf,pdfplumber,docling
+    python benchmark.py cache --pages 50
+    python benchmark.py shard --pages 50,200,800
+    python benchmark.py ocr --pages 10,40 --window 2,4,8
+    python benchmark.py auto --pages 50 --scanned-every 5
+    python benchmark.py uploads --clients 32 --memory-mb 32,0
+    python benchmark.py jobs --jobs 20 --pages 40
+    python benchmark.py batch --docs 200 --engines pymupdf,pdfplumber
+    python benchmark.py profile --requests 300
+    python benchmark.py pages --pages 400
+    python benchmark.py tables --pages 200 --table-pages 3
+    python benchmark.py stream --pages 200,1000
+    python benchmark.py thinker --pages 60 --latency 0.5
+    python benchmark.py doctr --batch 1,4,8 --threads 0
+    python benchmark.py preprocess --pages 20 --blank-every 5
+    python benchmark.py pagecache --docs 50 --shared 3 --unique 2
+    python benchmark.py checkpoint --engine tesseract --pages 40 --kill-at 30
+    python benchmark.py layout --pages 200 --engines pymupdf,pdfplumber
+    python benchmark.py admission --scans 8 --texts 8 --budget-mb 900 --limit-mb 1400
+    python benchmark.py sink --docs 2000 --duplicates 0.3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENGINE_ENDPOINTS = {
+    "pymupdf": "/extract/pymupdf",
+    "pdfplumber": "/extract/pdfplumber",
+    "pdfminer": "/extract/pdfminer_full",
+    "tesseract": "/extract/tesseract",
+    "docling": "/extract/docling",
+    "marker": "/extract/marker",
+}
+
+SAMPLE_TEXT = (
+    "This agreement is made between the parties listed below. The supplier agrees to deliver "
+    "the goods described in schedule A on or before the delivery date, and the buyer agrees to "
+    "pay the invoice total within thirty days of receipt."
+)
+
+##################################################################################################################
+# helpers
+
+def make_text_pdf(path: str, pages: int):
+    """Write a digital (text layer) PDF with `pages` pages of sample text."""
+    import fitz
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 72, 540, 760), f"Page {number + 1}\n\n" + (SAMPLE_TEXT + "\n") * 12, fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+def make_mixed_pdf(path: str, pages: int, scanned_every: int = 5, dpi: int = 150):
+    """Write a PDF where every `scanned_every`-th page is an image-only (scanned) copy of a text page."""
+    import fitz
+    source = fitz.open(make_text_pdf(path + ".src.pdf", pages))
+    doc = fitz.open()
+    for number, page in enumerate(source):
+        if scanned_every and number % scanned_every == scanned_every - 1:
+            scanned = doc.new_page(width=page.rect.width, height=page.rect.height)
+            scanned.insert_image(scanned.rect, pixmap=page.get_pixmap(dpi=dpi))
+        else:
+            doc.insert_pdf(source, from_page=number, to_page=number)
+    doc.save(path)
+    doc.close()
+    source.close()
+    os.remove(path + ".src.pdf")
+    return path
+
+@contextmanager
+def app_workdir():
+    """Import main1 inside a fresh temporary working directory, where its logs and output folders land.
+
+    Yields (main1, workdir) and restores the previous working directory on exit. main1 is imported once
+    per interpreter, so settings read at import time must be in os.environ before the first call.
+    """
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            import main1
+            yield main1, workdir
+        finally:
+            os.chdir(cwd)
+
+def run_snippet(snippet: str, *args, cwd=None):
+    """Run a Python snippet in a fresh interpreter with the repo importable and parse its JSON output."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-c", snippet, *args], capture_output=True, text=True, cwd=cwd, env=env)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+class LocalRedis:
+    """In-process stand-in for the subset of redis.Redis used by the result cache and the job queue."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.zsets = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.expiry and self.expiry[key] < time.time():
+                self.data.pop(key, None)
+                self.expiry.pop(key)
+            return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            self.expiry.pop(key, None)
+            if ex:
+                self.expiry[key] = time.time() + ex
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def zadd(self, name, mapping):
+        with self.lock:
+            self.zsets.setdefault(name, {}).update({member.encode(): score for member, score in mapping.items()})
+
+    def zpopmin(self, name, count=1):
+        with self.lock:
+            zset = self.zsets.get(name, {})
+            popped = sorted(zset.items(), key=lambda item: item[1])[:count]
+            for member, _ in popped:
+                del zset[member]
+            return popped
+
+    def zrem(self, name, *members):
+        with self.lock:
+            zset = self.zsets.get(name, {})
+            return sum(zset.pop(member.encode(), None) is not None for member in members)
+
+    def zcard(self, name):
+        return len(self.zsets.get(name, {}))
+
+def markdown_table(rows, columns):
+    """Render rows (list of dicts) as a markdown table."""
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    lines += ["| " + " | ".join(str(row.get(column, "")) for column in columns) + " |" for row in rows]
+    return "\n".join(lines)
+
+def print_table(rows, columns):
+    print(markdown_table(rows, columns))
+
+##################################################################################################################
+# startup: cold import and first-request latency per engine
+
+STARTUP_SNIPPET = """
+import json, os, sys, time
+engine, endpoint, pdf_path = sys.argv[1:4]
+t0 = time.perf_counter()
+import main1
+t1 = time.perf_counter()
+main1.load_engine(engine)
+t2 = time.perf_counter()
+from fastapi.testclient import TestClient
+latencies = []
+with TestClient(main1.app) as client:
+    for _ in range(2):
+        start = time.perf_counter()
+        with open(pdf_path, "rb") as f:
+            response = client.post(endpoint, files={"file": (os.path.basename(pdf_path), f)})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+print(json.dumps({"app_import": t1 - t0, "engine_import": t2 - t1, "first_request": latencies[0], "warm_request": latencies[1]}))
+"""
+
+def cmd_startup(args):
+    engines = [name for name in args.engines.split(",") if name]
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = make_text_pdf(os.path.join(workdir, "sample.pdf"), args.pages)
+        bare = run_snippet("import json, time; t = time.perf_counter(); import main1; print(json.dumps({'app_import': time.perf_counter() - t}))", cwd=workdir)
+        rows = [{"engine": "(none)", **bare}]
+        for engine in engines:
+            result = run_snippet(STARTUP_SNIPPET, engine, ENGINE_ENDPOINTS[engine], pdf_path, cwd=workdir)
+            rows.append({"engine": engine, **result})
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, float):
+                row[key] = round(value, 3)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows, ["engine", "app_import", "engine_import", "first_request", "warm_request", "error"])
+
+##################################################################################################################
+# cache: miss vs hit latency per cache tier, and how many hits still wrote the upload to disk
+
+def cmd_cache(args):
+    with app_workdir() as (main1, workdir):
+        from fastapi.testclient import TestClient
+
+        pdf_path = make_text_pdf(os.path.join(workdir, "sample.pdf"), args.pages)
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        main1.result_cache = main1.ResultCache(64, os.path.join(workdir, "cache"), 64, LocalRedis(), 60)
+        temp_writes = []
+        handle_file_upload = main1.handle_file_upload
+        main1.handle_file_upload = lambda file: temp_writes.append(file.filename) or handle_file_upload(file)
+
+        def timed_post(client, endpoint):
+            start = time.perf_counter()
+            client.post(endpoint, files={"file": ("sample.pdf", pdf_bytes)}).raise_for_status()
+            return time.perf_counter() - start
+
+        rows = []
+        with TestClient(main1.app) as client:
+            for engine in args.engines.split(","):
+                endpoint = ENGINE_ENDPOINTS[engine]
+                miss = timed_post(client, endpoint)
+                writes_before = len(temp_writes)
+                memory_hit = timed_post(client, endpoint)
+                main1.result_cache._memory.clear()
+                disk_hit = timed_post(client, endpoint)
+                main1.result_cache._memory.clear()
+                for entry in main1.result_cache.disk_dir.glob("*/*.json"):
+                    entry.unlink()
+                redis_hit = timed_post(client, endpoint)
+                rows.append({"engine": engine, "miss": round(miss, 4), "memory_hit": round(memory_hit, 4),
+                             "disk_hit": round(disk_hit, 4), "redis_hit": round(redis_hit, 4),
+                             "temp_writes_on_hits": len(temp_writes) - writes_before})
+            stats = main1.result_cache.status()
+    print_table(rows, ["engine", "miss", "memory_hit", "disk_hit", "redis_hit", "temp_writes_on_hits"])
+    print(f"\ncache stats: {json.dumps(stats)}")
+
+##################################################################################################################
+# shard: serial vs page-sharded text extraction as the page count grows
+
+def cmd_shard(args):
+    import asyncio
+    with app_workdir() as (main1, workdir):
+        if args.workers:
+            main1.SHARD_WORKERS = args.workers
+
+        rows = []
+        for pages in (int(p) for p in args.pages.split(",")):
+            pdf_path = make_text_pdf(os.path.join(workdir, f"doc_{pages}.pdf"), pages)
+            for engine in args.engines.split(","):
+                start = time.perf_counter()
+                serial = main1.page_texts(main1.PAGE_ITERATORS[engine], pdf_path)
+                serial_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                sharded = asyncio.run(main1.extract_pages_sharded(engine, pdf_path, min_pages=0))
+                sharded_seconds = time.perf_counter() - start
+                rows.append({"engine": engine, "pages": pages, "serial_s": round(serial_seconds, 3),
+                             "sharded_s": round(sharded_seconds, 3), "speedup": round(serial_seconds / sharded_seconds, 2),
+                             "identical": serial == sharded})
+    print(f"shard workers: {main1.SHARD_WORKERS}")
+    print_table(rows, ["engine", "pages", "serial_s", "sharded_s", "speedup", "identical"])
+
+##################################################################################################################
+# ocr: render-everything-first (what convert_from_path did) vs the windowed OCR pipeline
+
+OCR_SNIPPET = """
+import json, sys, threading, time
+import psutil
+import main1
+mode, pdf_path, dpi, window, workers = sys.argv[1], sys.argv[2], *map(int, sys.argv[3:6])
+process = psutil.Process()
+baseline = process.memory_info().rss
+peak = [baseline]
+done = threading.Event()
+def sample():
+    while not done.wait(0.02):
+        peak[0] = max(peak[0], process.memory_info().rss)
+threading.Thread(target=sample, daemon=True).start()
+start = time.perf_counter()
+if mode == "all_pages":
+    import fitz, pytesseract
+    with fitz.open(pdf_path) as doc:
+        images = [main1.render_page(page, dpi) for page in doc]
+    pages = [pytesseract.image_to_string(image) for image in images]
+else:
+    pages = main1.extract_pages_tesseract(pdf_path, dpi, window, workers)
+seconds = time.perf_counter() - start
+done.set()
+print(json.dumps({"seconds": seconds, "peak_rss_mb": (peak[0] - baseline) / 2**20, "pages": len(pages)}))
+"""
+
+def cmd_ocr(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        rows = []
+        for pages in (int(p) for p in args.pages.split(",")):
+            pdf_path = make_text_pdf(os.path.join(workdir, f"doc_{pages}.pdf"), pages)
+            runs = [("all_pages", 0)] + [("pipeline", int(w)) for w in args.window.split(",")]
+            for mode, window in runs:
+                result = run_snippet(OCR_SNIPPET, mode, pdf_path, str(args.dpi), str(window), str(args.workers), cwd=workdir)
+                rows.append({"mode": mode, "window": window or "-", "pages": pages,
+                             **{key: round(value, 2) if isinstance(value, float) else value for key, value in result.items()}})
+    print(f"dpi: {args.dpi}, OCR workers: {args.workers}")
+    print_table(rows, ["mode", "window", "pages", "seconds", "peak_rss_mb", "error"])
+
+##################################################################################################################
+# auto: all-OCR vs per-page routing on a mixed digital/scanned document
+
+def cmd_auto(args):
+    with app_workdir() as (main1, workdir):
+
+        pdf_path = make_mixed_pdf(os.path.join(workdir, "mixed.pdf"), args.pages, args.scanned_every)
+        start = time.perf_counter()
+        ocr_pages = main1.extract_pages_tesseract(pdf_path, args.dpi)
+        ocr_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        auto_pages = main1.extract_pages_auto(pdf_path, args.dpi)
+        auto_seconds = time.perf_counter() - start
+    routed = sum(page["path"] == "ocr" for page in auto_pages)
+    print_table([
+        {"mode": "all tesseract", "pages": len(ocr_pages), "ocr_pages": len(ocr_pages), "seconds": round(ocr_seconds, 2)},
+        {"mode": "auto", "pages": len(auto_pages), "ocr_pages": routed, "seconds": round(auto_seconds, 2)},
+    ], ["mode", "pages", "ocr_pages", "seconds"])
+    print(f"\nOCR time saved: {1 - auto_seconds / ocr_seconds:.0%}")
+
+##################################################################################################################
+# uploads: throughput of many concurrent same-named uploads, in memory and spooled
+
+def make_tagged_pdf(tag: str, pages: int):
+    """A small digital PDF whose every page carries `tag`, returned as bytes."""
+    import fitz
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page().insert_text((72, 72), f"{tag} {SAMPLE_TEXT[:60]}", fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def cmd_uploads(args):
+    from concurrent.futures import ThreadPoolExecutor
+    with app_workdir() as (main1, workdir):
+        from fastapi.testclient import TestClient
+
+        main1.UPLOAD_DIR = os.path.join(workdir, "uploads")
+        os.makedirs(main1.UPLOAD_DIR)
+        documents = [(f"document-{i:04d}", make_tagged_pdf(f"document-{i:04d}", args.pages)) for i in range(args.clients)]
+
+        rows = []
+        with TestClient(main1.app) as client:
+            def post(engine, tag, data):
+                response = client.post(ENGINE_ENDPOINTS[engine], params={"cache": "bypass"},
+                                       files={"file": ("same_name.pdf", data)})
+                return response.status_code == 200 and tag in json.dumps(response.json())
+
+            for memory_mb in (float(m) for m in args.memory_mb.split(",")):
+                main1.UPLOAD_MEMORY_MB = memory_mb
+                for engine in args.engines.split(","):
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(args.clients) as pool:
+                        matched = list(pool.map(lambda doc: post(engine, *doc), documents))
+                    rows.append({"engine": engine, "mode": "in memory" if memory_mb else "spooled",
+                                 "uploads": len(matched), "own_text": sum(matched),
+                                 "seconds": round(time.perf_counter() - start, 3),
+                                 "leftover_files": len(os.listdir(main1.UPLOAD_DIR))})
+    print_table(rows, ["engine", "mode", "uploads", "own_text", "seconds", "leftover_files"])
+
+##################################################################################################################
+# jobs: submit latency vs synchronous extraction, and the time to work off the queue, on both job backends
+
+def cmd_jobs(args):
+    with app_workdir() as (main1, workdir):
+        from fastapi.testclient import TestClient
+
+        pdf_path = make_text_pdf(os.path.join(workdir, "long.pdf"), args.pages)
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        main1.JOB_WORKERS = 1  # one worker makes the priority order observable
+        main1.JOB_CHUNK_PAGES = max(1, args.pages // 8)
+
+        def wait_finished(client, job_ids, timeout=300):
+            finished, deadline = {}, time.perf_counter() + timeout
+            while len(finished) < len(job_ids) and time.perf_counter() < deadline:
+                for job_id in job_ids:
+                    job = client.get(f"/jobs/{job_id}").json()
+                    if job_id not in finished and job["status"] in main1.JOB_FINISHED:
+                        finished[job_id] = job
+                        if job["status"] == "done":  # fetch before the result's TTL runs out
+                            job["text"] = client.get(f"/jobs/{job_id}/result").json()["text"]
+                time.sleep(0.05)
+            return finished
+
+        rows = []
+        for backend in args.backends.split(","):
+            if backend == "redis":
+                main1.job_backend = main1.RedisJobBackend(LocalRedis(), main1.JOB_QUEUE_SIZE, args.ttl)
+            else:
+                main1.job_backend = main1.LocalJobBackend(main1.JOB_QUEUE_SIZE, args.ttl)
+            with TestClient(main1.app) as client:
+                start = time.perf_counter()
+                expected = client.post(ENGINE_ENDPOINTS[args.engine], params={"cache": "bypass"},
+                                       files={"file": ("long.pdf", pdf_bytes)}).json()["text"]
+                sync_seconds = time.perf_counter() - start
+
+                submit_seconds, jobs = [], []
+                for i in range(args.jobs):
+                    priority = "high" if i % 5 == 4 else "low"
+                    start = time.perf_counter()
+                    job = client.post("/jobs", params={"engine": args.engine, "priority": priority, "cache": "bypass"},
+                                      files={"file": ("long.pdf", pdf_bytes)}).json()
+                    submit_seconds.append(time.perf_counter() - start)
+                    jobs.append(job)
+                start = time.perf_counter()
+                finished = wait_finished(client, [job["id"] for job in jobs])
+                drain_seconds = time.perf_counter() - start
+
+                done = [job for job in finished.values() if job["status"] == "done"]
+                correct = sum(job["text"] == expected for job in done)
+                progress = finished[jobs[0]["id"]]["progress"]
+
+            submit_seconds.sort()
+            rows.append({"backend": backend, "engine": args.engine, "pages": args.pages,
+                         "sync_request_s": round(sync_seconds, 3),
+                         "submit_p50_ms": round(1000 * submit_seconds[len(submit_seconds) // 2], 1),
+                         "submit_max_ms": round(1000 * submit_seconds[-1], 1), "drain_s": round(drain_seconds, 2),
+                         "done": len(done), "correct": correct, "progress": f"{progress['done']}/{progress['total']}"})
+    print_table(rows, ["backend", "engine", "pages", "sync_request_s", "submit_p50_ms", "submit_max_ms", "drain_s", "done", "correct", "progress"])
+
+##################################################################################################################
+# batch: docs/sec of the per-file endpoints vs /extract/batch with many files or one ZIP archive
+
+def cmd_batch(args):
+    import io
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+    with app_workdir() as (main1, workdir):
+        from fastapi.testclient import TestClient
+
+        documents = [(f"doc_{i:05d}.pdf", make_tagged_pdf(f"document-{i:05d}", args.pages)) for i in range(args.docs)]
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in documents:
+                zf.writestr(name, data)
+        archive = archive.getvalue()
+
+        rows = []
+        with TestClient(main1.app) as client:
+            def per_file(engine, name, data):
+                response = client.post(ENGINE_ENDPOINTS[engine], params={"cache": "bypass"}, files={"file": (name, data)})
+                return response.status_code == 200
+
+            def concurrent_per_file(engine):
+                with ThreadPoolExecutor(args.concurrency) as pool:
+                    return sum(pool.map(lambda doc: per_file(engine, *doc), documents))
+
+            def batch(engine, files):
+                response = client.post("/extract/batch", params={"engine": {"pdfminer": "pdfminer_full"}.get(engine, engine),
+                                                                 "cache": "bypass", "concurrency": args.concurrency}, files=files)
+                lines = [json.loads(line) for line in response.text.splitlines()]
+                return sum(line["status"] == "ok" for line in lines)
+
+            for engine in args.engines.split(","):
+                runs = {
+                    "per-file, sequential": lambda: sum(per_file(engine, *doc) for doc in documents),
+                    f"per-file, {args.concurrency} clients": lambda: concurrent_per_file(engine),
+                    "batch, files": lambda: batch(engine, [("files", doc) for doc in documents]),
+                    "batch, zip": lambda: batch(engine, [("files", ("docs.zip", archive))]),
+                }
+                for mode, run in runs.items():
+                    start = time.perf_counter()
+                    ok = run()
+                    seconds = time.perf_counter() - start
+                    rows.append({"engine": engine, "mode": mode, "docs": args.docs, "ok": ok, "seconds": round(seconds, 2),
+                                 "docs_per_sec": round(args.docs / seconds, 1)})
+    print_table(rows, ["engine", "mode", "docs", "ok", "seconds", "docs_per_sec"])
+
+##################################################################################################################
+# profile: request latency without the profiling hook, with it switched off, and with each profiler on
+
+def cmd_profile(args):
+    import statistics
+    os.environ.update(PROFILE_DIR="profiles", PROFILE_TOKEN="benchmark")  # read when main1 is imported
+    with app_workdir() as (main1, workdir):
+        from fastapi.testclient import TestClient
+
+        pdf_bytes = make_tagged_pdf("profiled", args.pages)
+        with TestClient(main1.app) as client:
+            # build the middleware stack with and without the profiling hook and alternate between them
+            client.get("/supported-formats")
+            with_hook = main1.app.middleware_stack
+            hooked = main1.app.user_middleware
+            main1.app.user_middleware = [m for m in hooked if m.cls is not main1.ProfileMiddleware]
+            without_hook = main1.app.build_middleware_stack()
+            main1.app.user_middleware = hooked
+
+            modes = {
+                "no hook": (without_hook, {}),
+                "hook, off": (with_hook, {}),
+                "profile=true pstats": (with_hook, {"profile": "true", "profile_format": "pstats"}),
+                "profile=true collapsed": (with_hook, {"profile": "true", "profile_format": "collapsed"}),
+            }
+            latencies, request_ids = {mode: [] for mode in modes}, {}
+            for _ in range(args.requests // 10):
+                for mode, (stack, params) in modes.items():
+                    main1.app.middleware_stack = stack
+                    for _ in range(10):
+                        start = time.perf_counter()
+                        response = client.post(ENGINE_ENDPOINTS[args.engine], params={"cache": "bypass", **params},
+                                               headers={"X-Profile-Token": "benchmark"}, files={"file": ("doc.pdf", pdf_bytes)})
+                        latencies[mode].append(time.perf_counter() - start)
+                        response.raise_for_status()
+                        request_ids[mode] = response.headers.get("X-Request-ID")
+            request_id = request_ids["profile=true pstats"]
+            artifacts = client.get(f"/profiles/{request_id}", headers={"X-Profile-Token": "benchmark"}).json()["artifacts"]
+            download = client.get(artifacts[0], headers={"X-Profile-Token": "benchmark"})
+            forbidden = client.post(ENGINE_ENDPOINTS[args.engine], params={"profile": "true"}, files={"file": ("doc.pdf", pdf_bytes)}).status_code
+
+    baseline = statistics.median(latencies["no hook"])
+    rows = [{"mode": mode, "requests": len(values), "p50_ms": round(1000 * statistics.median(values), 3),
+             "mean_ms": round(1000 * statistics.fmean(values), 3),
+             "overhead": f"{statistics.median(values) / baseline - 1:+.1%}"} for mode, values in latencies.items()]
+    print(f"engine: {args.engine}, {args.pages} pages per request")
+    print_table(rows, ["mode", "requests", "p50_ms", "mean_ms", "overhead"])
+    print(f"\nlast profile: {len(artifacts)} artifact(s), {len(download.content)} bytes downloaded; profile=true without token -> {forbidden}")
+
+##################################################################################################################
+# pages: full document vs `max_pages` / `pages=` selections per engine, and the old quadratic pdfminer per-page loop
+
+def legacy_pdfminer_pages(pdf_path: str):
+    """What convert_pdf_to_txt_pages did: one growing buffer, sliced after every page."""
+    from io import StringIO
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    retstr = StringIO()
+    device = TextConverter(PDFResourceManager(), retstr, laparams=LAParams())
+    interpreter = PDFPageInterpreter(device.rsrcmgr, device)
+    texts, size = [], 0
+    with open(pdf_path, "rb") as file:
+        for page in list(PDFPage.get_pages(file)):
+            interpreter.process_page(page)
+            value = retstr.getvalue()
+            texts.append(value[size:])
+            size = len(value)
+    device.close()
+    return texts
+
+def cmd_pages(args):
+    with app_workdir() as (main1, workdir):
+        pdf_path = make_text_pdf(os.path.join(workdir, "doc.pdf"), args.pages)
+        selections = {
+            "all pages": None,
+            f"max_pages={args.preview}": main1.parse_page_selection(None, args.preview),
+            f"pages=1-3,{args.pages // 2},{args.pages}": main1.parse_page_selection(f"1-3,{args.pages // 2},{args.pages}"),
+        }
+        rows = []
+        for engine in args.engines.split(","):
+            iterator = main1.PAGE_ITERATORS[engine]
+            full = None
+            for label, page_numbers in selections.items():
+                start = time.perf_counter()
+                pages = list(iterator(pdf_path, page_numbers))
+                seconds = time.perf_counter() - start
+                if page_numbers is None:
+                    full, full_seconds = [text for _, text in pages], seconds
+                identical = [text for _, text in pages] == [full[number] for number in page_numbers or range(len(full))]
+                rows.append({"engine": engine, "selection": label, "pages": len(pages), "seconds": round(seconds, 3),
+                             "vs_full": f"{seconds / full_seconds:.1%}", "identical": identical})
+            if engine == "pdfminer":
+                start = time.perf_counter()
+                legacy = legacy_pdfminer_pages(pdf_path)
+                seconds = time.perf_counter() - start
+                rows.append({"engine": engine, "selection": "all pages, old sliced buffer", "pages": len(legacy),
+                             "seconds": round(seconds, 3), "vs_full": f"{seconds / full_seconds:.1%}", "identical": legacy == full})
+    print(f"{args.pages}-page document")
+    print_table(rows, ["engine", "selection", "pages", "seconds", "vs_full", "identical"])
+
+##################################################################################################################
+# tables: cost of finding the few table pages of a long document, and of the table model on them vs every page
+
+def cmd_tables(args):
+    import importlib.util
+    import random
+    import fitz
+    with app_workdir() as (main1, workdir):
+        table_numbers = sorted(random.Random(0).sample(range(args.pages), args.table_pages))
+        rows = [[f"row {r} col {c}" for c in range(4)] for r in range(6)]
+        make_table_pdf("tables.pdf", [rows] * len(table_numbers))
+        text, tables = fitz.open(make_text_pdf("text.pdf", args.pages)), fitz.open("tables.pdf")
+        doc = fitz.open()
+        for number in range(args.pages):
+            source = tables if number in table_numbers else text
+            position = table_numbers.index(number) if number in table_numbers else number
+            doc.insert_pdf(source, from_page=position, to_page=position)
+        doc.save("doc.pdf")
+
+        def every_page():
+            with fitz.open("doc.pdf") as pdf:
+                return [number for number, page in enumerate(pdf) if page.find_tables().tables]
+
+        def marker_tables(page_numbers):
+            from marker.converters.table import TableConverter
+            models = main1.model_registry.get("marker")
+            return TableConverter(artifact_dict=models["artifact_dict"], config={"page_range": page_numbers})("doc.pdf")
+
+        runs = {
+            "find_tables on every page": lambda: (every_page(), None),
+            "detect_table_pages": lambda: (main1.detect_table_pages("doc.pdf"), None),
+            "extract_tables_pymupdf": lambda: (None, main1.extract_tables_pymupdf("doc.pdf")),
+        }
+        if importlib.util.find_spec("marker") is not None:
+            runs["marker table model, every page"] = lambda: (marker_tables(list(range(args.pages))), None)
+            runs["marker table model, detected pages"] = lambda: (None, main1.extract_tables_marker("doc.pdf"))
+        results = []
+        for mode, run in runs.items():
+            start = time.perf_counter()
+            found, extracted = run()
+            seconds = time.perf_counter() - start
+            if extracted is not None:
+                found = [page - 1 for page in extracted["table_pages"]]
+                cells_ok = all(table["rows"] == rows for table in extracted["tables"]) and len(extracted["tables"]) == len(table_numbers)
+            else:
+                cells_ok = ""
+            results.append({"mode": mode, "seconds": round(seconds, 3), "ms_per_page": round(1000 * seconds / args.pages, 2),
+                            "table_pages": len(found) if isinstance(found, list) else "",
+                            "found_all": found == table_numbers if isinstance(found, list) else "", "cells_ok": cells_ok})
+    print(f"{args.pages} pages, tables on pages {[number + 1 for number in table_numbers]}")
+    if "marker table model, every page" not in runs:
+        print("marker is not installed: table model runs skipped")
+    print_table(results, ["mode", "seconds", "ms_per_page", "table_pages", "found_all", "cells_ok"])
+
+##################################################################################################################
+# thinker: LLM requests and latency of field extraction against a local mock OpenAI-compatible server
+
+class MockLLMServer:
+    """OpenAI-compatible /chat/completions that answers with the `Field: value` pairs found in the prompt after
+    `latency` seconds plus `ms_per_1k_chars` of prompt, and counts requests, in-flight peak and prompt characters."""
+
+    def __init__(self, fields: list, latency: float, ms_per_1k_chars: float = 0):
+        import re
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        server = self
+        self.fields, self.latency, self.ms_per_1k_chars = fields, latency, ms_per_1k_chars
+        self.requests = self.prompt_chars = self.in_flight = self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = "\n".join(str(message["content"]) for message in body["messages"] if message["role"] == "user")
+                with server.lock:
+                    server.requests += 1
+                    server.prompt_chars += len(prompt)
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                time.sleep(server.latency + server.ms_per_1k_chars * len(prompt) / 1e6)
+                values = {}
+                for field in server.fields:
+                    match = re.search(rf"{re.escape(field)}: ([\w.-]+)", prompt)
+                    values[field] = match.group(1) if match else None
+                answer = {"id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                          "choices": [{"index": 0, "finish_reason": "stop",
+                                       "message": {"role": "assistant", "content": "```json\n" + json.dumps(values) + "\n```"}}],
+                          "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 20, "total_tokens": len(prompt) // 4 + 20}}
+                payload = json.dumps(answer).encode()
+                with server.lock:
+                    server.in_flight -= 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def take_counts(self):
+        with self.lock:
+            counts = {"llm_requests": self.requests, "prompt_chars": self.prompt_chars, "peak_in_flight": self.peak_in_flight}
+            self.requests = self.prompt_chars = self.peak_in_flight = 0
+        return counts
+
+def legacy_thinker(pdf_path: str, fields: list, model: str):
+    """What extract_text_thinker did: a new Extractor, loader, LLM and contract, and one call for the whole PDF."""
+    from extract_thinker import Contract, DocumentLoaderPyPdf, Extractor
+    extractor = Extractor()
+    extractor.load_document_loader(DocumentLoaderPyPdf())
+    extractor.load_llm(model)
+    contract = type("DynamicInvoiceContract", (Contract,), {"__annotations__": {field: str for field in fields}, "__module__": __name__})
+    result = extractor.extract(pdf_path, contract)
+    return {field: getattr(result, field, None) for field in fields}
+
+def cmd_thinker(args):
+    import importlib.util
+    if importlib.util.find_spec("extract_thinker") is None:
+        sys.exit("extract_thinker is not installed")
+    import fitz
+    fields = ["Invoice", "Total", "Supplier"]
+    truth = {"Invoice": "INV-0042", "Total": "1234.50", "Supplier": "ACME-Corp"}
+    server = MockLLMServer(fields, args.latency, args.ms_per_1k_chars)
+    os.environ.update(OPENAI_API_BASE=server.url, OPENAI_API_KEY="mock", LITELLM_LOCAL_MODEL_COST_MAP="True",
+                      THINKER_CHUNK_CHARS=str(args.chunk_chars), THINKER_CONCURRENCY=str(args.concurrency))
+    with app_workdir() as (main1, workdir):
+        make_text_pdf("doc.pdf", args.pages)
+        with fitz.open("doc.pdf") as doc:
+            for number, (field, value) in zip([0, args.pages // 2, args.pages - 1], truth.items()):
+                doc[number].insert_text((72, 60), f"{field}: {value}", fontsize=10)
+            doc.saveIncr()
+        texts = main1.page_texts(main1.iter_pages_pymupdf, "doc.pdf")
+        main1.load_engine("extract_thinker")  # imports (litellm, instructor) are not part of any request
+
+        runs = {
+            "old: new Extractor per request, whole PDF in one call": lambda: legacy_thinker("doc.pdf", fields, main1.THINKER_MODEL),
+            "pooled, chunked, concurrent (cold cache)": lambda: main1.extract_text_thinker("doc.pdf", fields),
+            "same document again (response cache)": lambda: main1.extract_text_thinker("doc.pdf", fields),
+            "text from /extract/pymupdf (cached chunks)": lambda: main1.extract_fields_thinker(texts, fields),
+        }
+        rows = []
+        for mode, run in runs.items():
+            start = time.perf_counter()
+            result = run()
+            rows.append({"mode": mode, "seconds": round(time.perf_counter() - start, 3), **server.take_counts(), "correct": result == truth})
+        # many distinct documents at once: rate limit and in-flight cap shared by all requests
+        docs = [[f"{text}\nrequest {n}" for text in texts] for n in range(args.concurrent_docs)]
+        start = time.perf_counter()
+        results = list(main1.ThreadPoolExecutor(args.concurrent_docs).map(lambda pages: main1.extract_fields_thinker(pages, fields), docs))
+        rows.append({"mode": f"{args.concurrent_docs} documents at once", "seconds": round(time.perf_counter() - start, 3),
+                     **server.take_counts(), "correct": all(result == truth for result in results)})
+    print(f"{args.pages} pages, {len(main1.chunk_texts(texts))} chunks of <= {args.chunk_chars} chars, "
+          f"mock LLM latency {args.latency}s + {args.ms_per_1k_chars} ms per 1k prompt chars, THINKER_CONCURRENCY={args.concurrency}")
+    print_table(rows, ["mode", "seconds", "llm_requests", "prompt_chars", "peak_in_flight", "correct"])
+
+##################################################################################################################
+# doctr: pages/sec, peak memory and CER of doctr per batch size vs Tesseract on the scanned corpus
+
+OCR_ENGINE_SNIPPET = """
+import json, os, sys, threading, time
+import psutil
+engine, corpus_dir, files, batch, threads, untrained = sys.argv[1], sys.argv[2], json.loads(sys.argv[3]), int(sys.argv[4]), sys.argv[5], sys.argv[6] == "1"
+os.environ["DOCTR_THREADS"] = threads
+import main1
+if untrained:  # no pretrained weights available: same architecture and cost, but the text is noise
+    import doctr.models
+    build = doctr.models.ocr_predictor
+    doctr.models.ocr_predictor = lambda **kwargs: build(**{**kwargs, "pretrained": False, "pretrained_backbone": False})
+extract = (lambda path: main1.extract_text_doctr(path, batch_size=batch)) if engine == "doctr" else main1.extract_text_tesseract
+main1.load_engine(engine)
+process = psutil.Process()
+baseline = process.memory_info().rss
+peak = [baseline]
+done = threading.Event()
+def sample():
+    while not done.wait(0.02):
+        peak[0] = max(peak[0], process.memory_info().rss)
+threading.Thread(target=sample, daemon=True).start()
+start = time.perf_counter()
+extract(os.path.join(corpus_dir, files[0]))  # warm-up: model loading
+warmup = time.perf_counter() - start
+texts, start = [], time.perf_counter()
+for name in files:
+    texts.append(extract(os.path.join(corpus_dir, name)) or "")
+seconds = time.perf_counter() - start
+done.set()
+print(json.dumps({"seconds": seconds, "warmup_seconds": warmup, "peak_rss_mb": (max(peak[0], process.memory_info().rss) - baseline) / 2**20, "texts": texts}))
+"""
+
+def cmd_doctr(args):
+    corpus_dir = os.path.abspath(args.corpus)
+    manifest = load_corpus(corpus_dir, args.docs, args.pages, args.dpi, args.seed)
+    documents = [document for document in manifest["documents"] if document["kind"] == "scanned"]
+    files = json.dumps([document["file"] for document in documents])
+    pages = sum(document["pages"] for document in documents)
+    truths = []
+    for document in documents:
+        with open(os.path.join(corpus_dir, document["truth"]), encoding="utf-8") as f:
+            truths.append(f.read())
+    runs = [("tesseract", 0)] + [("doctr", int(batch)) for batch in args.batch.split(",")]
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine, batch in runs:
+            result = run_snippet(OCR_ENGINE_SNIPPET, engine, corpus_dir, files, str(batch), str(args.threads),
+                                 "1" if args.untrained and engine == "doctr" else "0", cwd=workdir)
+            row = {"engine": engine, "batch": batch or "-", "pages": pages}
+            if "error" in result:
+                rows.append({**row, "error": result["error"]})
+                continue
+            cers = [character_error_rate(text, truth) for text, truth in zip(result["texts"], truths)]
+            untrained = args.untrained and engine == "doctr"
+            rows.append({**row, "pages_per_sec": round(pages / result["seconds"], 2), "warmup_s": round(result["warmup_seconds"], 2),
+                         "peak_rss_mb": round(result["peak_rss_mb"], 1), "cer": "-" if untrained else round(sum(cers) / len(cers), 4)})
+    print(f"{len(documents)} scanned documents, {pages} pages, DOCTR_THREADS={args.threads or 'default'}"
+          + (", doctr with untrained weights (speed and memory only)" if args.untrained else ""))
+    print_table(rows, ["engine", "batch", "pages", "pages_per_sec", "warmup_s", "peak_rss_mb", "cer", "error"])
+
+##################################################################################################################
+# preprocess: Tesseract seconds/page and CER with and without the NumPy preprocessing on noisy scans
+
+def make_noisy_scan(path: str, texts: list, dpi: int, seed: int):
+    """Write an image-only PDF of `texts` scanned badly: gray paper, noise, a small skew and dark borders.
+
+    Empty strings become blank (noise-only) pages.
+    """
+    import random
+    import fitz
+    import numpy as np
+    from PIL import Image
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        if text:
+            page.insert_textbox(fitz.Rect(72, 72, 540, 760), text, fontsize=10)
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+        image = image.rotate(rng.uniform(1, 3) * rng.choice((-1, 1)), resample=Image.BILINEAR, fillcolor=255)
+        pixels = np.asarray(image, dtype=np.float64) * 0.75 + 40 + noise.normal(0, 18, image.size[::-1])
+        border = rng.randint(dpi // 10, dpi // 4)
+        pixels[:, :border] = pixels[:border] = 30
+        pixels[noise.random(pixels.shape) < 0.002] = 0  # dust
+        scanned = Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+        target = doc.new_page(width=page.rect.width, height=page.rect.height)
+        target.insert_image(target.rect, pixmap=fitz.Pixmap(fitz.csGRAY, scanned.width, scanned.height, scanned.tobytes(), False))
+        doc.delete_page(-2)
+    doc.save(path)
+    doc.close()
+    return path
+
+def cmd_preprocess(args):
+    import random
+    rng = random.Random(args.seed)
+    with app_workdir() as (main1, workdir):
+        texts = ["" if args.blank_every and n % args.blank_every == args.blank_every - 1 else corpus_text(rng, rng.randint(120, 220))
+                 for n in range(args.pages)]
+        pdf_path = make_noisy_scan(os.path.join(workdir, "noisy.pdf"), texts, args.scan_dpi, args.seed)
+        main1.load_engine("tesseract")
+        rows = []
+        for preprocess in (False, True):
+            options = main1.OcrOptions(preprocess, args.psm, args.oem)
+            start = time.perf_counter()
+            pages = main1.extract_pages_tesseract(pdf_path, args.dpi, options=options)
+            seconds = time.perf_counter() - start
+            cers = [character_error_rate(page["text"], truth) for page, truth in zip(pages, texts) if truth]
+            rows.append({"preprocess": "on" if preprocess else "off", "pages": len(pages),
+                         "sec_per_page": round(seconds / len(pages), 3),
+                         "preprocess_s": round(sum(page["preprocess_seconds"] for page in pages), 2),
+                         "ocr_s": round(sum(page["ocr_seconds"] for page in pages), 2),
+                         "blank_skipped": sum(page["blank"] for page in pages),
+                         "cer": round(sum(cers) / len(cers), 4)})
+    print(f"{args.pages} noisy pages scanned at {args.scan_dpi} dpi ({texts.count('')} blank), OCR at {args.dpi} dpi, "
+          f"psm {args.psm}, oem {args.oem}, OCR_WORKERS={main1.OCR_WORKERS}")
+    print_table(rows, ["preprocess", "pages", "sec_per_page", "preprocess_s", "ocr_s", "blank_skipped", "cer"])
+
+##################################################################################################################
+# pagecache: documents sharing boilerplate pages, extracted with the page cache off and on
+
+PAGECACHE_SNIPPET = """
+import hashlib, json, os, sys, time
+import main1
+engines, files = sys.argv[1].split(","), json.loads(sys.argv[2])
+functions = {"pymupdf": main1.extract_text_pymupdf, "pdfplumber": main1.extract_text_pdfplumber,
+             "pdfminer": main1.convert_pdf_to_txt_file, "tesseract": main1.extract_text_tesseract,
+             "doctr": main1.extract_text_doctr}
+results = {}
+for engine in engines:
+    main1.load_engine(engine)
+    before = dict(main1.page_cache.stats)
+    digest, start = hashlib.sha256(), time.perf_counter()
+    for path in files:
+        digest.update(json.dumps(functions[engine](path)).encode())
+    stats = {key: main1.page_cache.stats[key] - before[key] for key in ("hits", "misses")}
+    results[engine] = {"seconds": time.perf_counter() - start, "output": digest.hexdigest(), **stats}
+print(json.dumps(results))
+"""
+
+def make_boilerplate_docs(workdir: str, docs: int, shared: int, unique: int, seed: int):
+    """Write `docs` PDFs with the same `shared` cover/terms pages and `unique` pages of their own each.
+
+    Each file is built from scratch and the shared pages move around, so only the page content repeats.
+    """
+    import random
+    import fitz
+    rng = random.Random(seed)
+    boilerplate = [corpus_text(random.Random(seed + n), 250) for n in range(shared)]
+    files = []
+    for i in range(docs):
+        texts = [corpus_text(rng, rng.randint(150, 250)) for _ in range(unique)]
+        position = rng.randint(0, unique)
+        texts[position:position] = boilerplate
+        doc = fitz.open()
+        for text in texts:
+            doc.new_page().insert_textbox(fitz.Rect(72, 72, 540, 760), text, fontsize=10)
+        path = os.path.join(workdir, f"contract_{i:03d}.pdf")
+        doc.save(path)
+        doc.close()
+        files.append(path)
+    return files
+
+def cmd_pagecache(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        files = make_boilerplate_docs(workdir, args.docs, args.shared, args.unique, args.seed)
+        runs = {}
+        for mode, size in (("off", "0"), ("on", str(args.cache_mb))):
+            os.environ["PAGE_CACHE_MB"] = size
+            runs[mode] = run_snippet(PAGECACHE_SNIPPET, args.engines, json.dumps(files), cwd=workdir)
+    rows = []
+    for engine in args.engines.split(","):
+        off, on = runs["off"].get(engine), runs["on"].get(engine)
+        if off is None or on is None:
+            rows.append({"engine": engine, "error": runs["off"].get("error") or runs["on"].get("error")})
+            continue
+        lookups = on["hits"] + on["misses"]
+        rows.append({"engine": engine, "off_s": round(off["seconds"], 2), "on_s": round(on["seconds"], 2),
+                     "speedup": f"{off['seconds'] / on['seconds']:.2f}x", "pages_reused": on["hits"],
+                     "hit_rate": round(on["hits"] / lookups, 3) if lookups else "-", "identical": off["output"] == on["output"]})
+    print(f"{args.docs} documents, {args.shared} shared + {args.unique} unique pages each")
+    print_table(rows, ["engine", "off_s", "on_s", "speedup", "pages_reused", "hit_rate", "identical", "error"])
+
+##################################################################################################################
+# stream: time to first byte, total time and server memory of stream=true vs the buffered response
+
+def cmd_stream(args):
+    import socket
+    import httpx
+    import psutil
+    with tempfile.TemporaryDirectory() as workdir:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main1:app", "--port", str(port), "--log-level", "warning"],
+                                  cwd=workdir, env=env)
+        rows = []
+        try:
+            url = f"http://127.0.0.1:{port}"
+            with httpx.Client(base_url=url, timeout=600) as client:
+                for _ in range(100):
+                    try:
+                        client.get("/supported-formats")
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.2)
+                process = psutil.Process(server.pid)
+                for pages in [int(p) for p in args.pages.split(",")]:
+                    pdf_bytes = open(make_text_pdf(os.path.join(workdir, f"doc_{pages}.pdf"), pages), "rb").read()
+                    for engine in args.engines.split(","):
+                        for mode, params in {"buffered": {}, "stream=true": {"stream": "true"}}.items():
+                            baseline, peak, done = process.memory_info().rss, [0], threading.Event()
+                            def sample():
+                                while not done.is_set():
+                                    peak[0] = max(peak[0], process.memory_info().rss)
+                                    time.sleep(0.005)
+                            sampler = threading.Thread(target=sample)
+                            sampler.start()
+                            start, first = time.perf_counter(), None
+                            with client.stream("POST", ENGINE_ENDPOINTS[engine], params={"cache": "bypass", **params},
+                                               files={"file": ("doc.pdf", pdf_bytes)}) as response:
+                                body = []
+                                for chunk in response.iter_bytes():
+                                    first = first or time.perf_counter() - start
+                                    body.append(chunk)
+                            seconds = time.perf_counter() - start
+                            done.set()
+                            sampler.join()
+                            body = b"".join(body).decode()
+                            streamed = [json.loads(line) for line in body.splitlines()] if params else []
+                            ok = (len(streamed) == pages + 1 and streamed[-1]["event"] == "done") if params else response.status_code == 200
+                            rows.append({"engine": engine, "pages": pages, "mode": mode, "ok": ok, "ttfb_s": round(first, 3),
+                                         "total_s": round(seconds, 2), "server_rss_delta_mb": round(max(0, peak[0] - baseline) / 2**20, 1)})
+        finally:
+            server.terminate()
+            server.wait()
+    print_table(rows, ["engine", "pages", "mode", "ok", "ttfb_s", "total_s", "server_rss_delta_mb"])
+
+##################################################################################################################
+# checkpoint: kill the server in the middle of a long document and retry; the retry resumes
+
+def start_server(workdir: str, env: dict):
+    """Start the API with uvicorn on a free port; returns (process, base url) once it answers."""
+    import socket
+    import httpx
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""), **env)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main1:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=workdir, env=env)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            httpx.get(url + "/supported-formats")
+            return server, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("the API did not start")
+
+def cmd_checkpoint(args):
+    import hashlib
+    import httpx
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_bytes = open(make_text_pdf(os.path.join(workdir, "long.pdf"), args.pages), "rb").read()
+        document = hashlib.sha256(pdf_bytes).hexdigest()
+        env = {"CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"), "CHECKPOINT_ENGINES": args.engine, "PAGE_CACHE_MB": "0"}
+        endpoint = ENGINE_ENDPOINTS[args.engine]
+
+        def extract(url, cache):
+            start = time.perf_counter()
+            response = httpx.post(url + endpoint, params={"cache": cache}, files={"file": ("long.pdf", pdf_bytes)}, timeout=3600)
+            return response, time.perf_counter() - start
+
+        server, url = start_server(workdir, env)
+        try:
+            full, full_seconds = extract(url, "refresh")
+            # second run: SIGKILL the server (as an OOM kill or eviction would) once kill_at pages are checkpointed
+            def doomed_request():
+                try:
+                    extract(url, "refresh")
+                except httpx.TransportError:
+                    pass  # the server is killed under it
+
+            request = threading.Thread(target=doomed_request)
+            request.start()
+            done_at_kill = 0
+            while done_at_kill < args.kill_at:
+                time.sleep(0.2)
+                checkpoints = httpx.get(url + "/checkpoints", params={"document": document}).json()["checkpoints"]
+                done_at_kill = max([checkpoint["pages_done"] for checkpoint in checkpoints], default=0)
+            server.kill()
+            server.wait()
+        finally:
+            server.kill()
+        request.join()
+        server, url = start_server(workdir, env)
+        try:
+            resumed, resumed_seconds = extract(url, "use")
+            left = httpx.get(url + "/checkpoints", params={"document": document}).json()
+        finally:
+            server.terminate()
+            server.wait()
+    rows = [
+        {"run": "uninterrupted", "seconds": round(full_seconds, 2), "pages_extracted": args.pages, "status": full.status_code},
+        {"run": f"killed at {done_at_kill} pages", "pages_extracted": done_at_kill, "status": "killed"},
+        {"run": "retry", "seconds": round(resumed_seconds, 2), "pages_extracted": args.pages - left["pages_resumed"],
+         "status": resumed.status_code},
+    ]
+    identical = full.status_code == resumed.status_code == 200 and full.json()["text"] == resumed.json()["text"]
+    print(f"{args.engine}, {args.pages} pages, checkpoints left after the retry: {len(left['checkpoints'])}")
+    print_table(rows, ["run", "seconds", "pages_extracted", "status"])
+    print(f"\nretry output identical to the uninterrupted run: {identical}")
+
+##################################################################################################################
+# layout: columnar word-level export vs the same words as a JSON list of objects
+
+def cmd_layout(args):
+    import gzip
+    import io
+    import random
+    import fitz
+    with app_workdir() as (main1, workdir):
+        rng, doc = random.Random(args.seed), fitz.open()
+        for _ in range(args.pages):  # varied text, so dictionary encoding does not flatter the columnar formats
+            doc.new_page().insert_textbox(fitz.Rect(72, 72, 540, 760), corpus_text(rng, 450), fontsize=10)
+        doc.save("doc.pdf")
+        formats = ["arrow", "parquet", "ndjson"] if main1.HAS_PYARROW else ["ndjson"]
+        rows = []
+        for engine in args.engines.split(","):
+            start = time.perf_counter()
+            pages = main1.extract_layout("doc.pdf", engine)
+            extract_seconds = time.perf_counter() - start
+            words = sum(len(page["text"]) for _, page in pages)
+
+            def word_objects():
+                columns = main1.layout_columns(pages)
+                return json.dumps([dict(zip(main1.LAYOUT_COLUMNS, values)) for values in zip(*columns.values())]).encode()
+
+            encoders = {"json (object per word)": word_objects}
+            encoders.update({fmt: lambda fmt=fmt: main1.serialize_layout(pages, fmt) for fmt in formats})
+            json_bytes = None
+            for fmt, encode in encoders.items():
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    body = encode()
+                seconds = (time.perf_counter() - start) / args.repeat
+                json_bytes = json_bytes or len(body)
+                if fmt == "arrow":
+                    import pyarrow as pa
+                    assert pa.ipc.open_stream(body).read_all().num_rows == words
+                elif fmt == "parquet":
+                    import pyarrow.parquet as pq
+                    assert pq.read_table(io.BytesIO(body)).num_rows == words
+                rows.append({"engine": engine, "format": fmt, "words": words, "extract_s": round(extract_seconds, 2),
+                             "serialize_ms": round(1000 * seconds, 1), "kb": round(len(body) / 1024, 1),
+                             "gzip_kb": round(len(gzip.compress(body, 6)) / 1024, 1),
+                             "size_vs_json": round(len(body) / json_bytes, 3)})
+    print(f"{args.pages} pages")
+    if not main1.HAS_PYARROW:
+        print("pyarrow is not installed: arrow and parquet skipped")
+    print_table(rows, ["engine", "format", "words", "extract_s", "serialize_ms", "kb", "gzip_kb", "size_vs_json"])
+
+##################################################################################################################
+# admission: a mixed burst of large scans and text documents, admission control off vs on, against a memory limit
+
+def process_tree_pss_mb(pid: int):
+    """Proportional set size of a process and its children: forked workers' shared pages are counted once."""
+    import psutil
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_full_info().pss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+def cmd_admission(args):
+    import random
+    import fitz
+    import httpx
+    from concurrent.futures import ThreadPoolExecutor
+
+    def scan_pdf(pages: int):
+        doc = fitz.open()
+        for number in range(pages):  # poster-sized pages: every rendered bitmap is large
+            page = doc.new_page(width=args.scan_inches[0] * 72, height=args.scan_inches[1] * 72)
+            page.insert_textbox(page.rect + (72, 72, -72, -72), (SAMPLE_TEXT + "\n") * 20, fontsize=36)
+        return doc.tobytes()
+
+    text_doc = open(make_text_pdf(os.path.join(tempfile.gettempdir(), "pdfhub_admission_text.pdf"), args.text_pages), "rb").read()
+    burst = [("/extract/tesseract?preprocess=false", "scan.pdf", scan_pdf(args.scan_pages))] * args.scans
+    burst += [("/extract/pdfplumber", "text.pdf", text_doc), ("/extract/pymupdf", "text.pdf", text_doc)] * args.texts
+    random.Random(args.seed).shuffle(burst)
+
+    def send(url, endpoint, filename, body):
+        attempts, start = 0, time.perf_counter()
+        while True:
+            attempts += 1
+            try:
+                response = httpx.post(f"{url}{endpoint}&cache=bypass" if "?" in endpoint else f"{url}{endpoint}?cache=bypass",
+                                      files={"file": (filename, body)}, timeout=900)
+            except httpx.TransportError as e:
+                return {"status": type(e).__name__, "attempts": attempts}
+            if response.status_code in (429, 503) and time.perf_counter() - start < args.give_up:
+                time.sleep(min(float(response.headers.get("Retry-After", 1)), 10))
+                continue
+            return {"status": response.status_code, "attempts": attempts}
+
+    rows = []
+    for mode, budget in (("off", "-1"), ("on", str(args.budget_mb))):
+        with tempfile.TemporaryDirectory() as workdir:
+            server, url = start_server(workdir, {"ADMISSION_MEMORY_MB": budget, "PDF_HUB_LIMITS": args.limits,
+                                                 "WORKER_MAX_TASKS": str(args.worker_max_tasks)})
+            peak, stop = [process_tree_pss_mb(server.pid)], threading.Event()
+            idle = peak[0]
+
+            def sample():
+                while not stop.is_set():
+                    peak[0] = max(peak[0], process_tree_pss_mb(server.pid))
+                    time.sleep(0.05)
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            start = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(max_workers=len(burst)) as pool:
+                    results = list(pool.map(lambda item: send(url, *item), burst))
+                seconds = time.perf_counter() - start
+                alive = server.poll() is None
+                engines = httpx.get(url + "/engines").json() if alive else {}
+            finally:
+                stop.set()
+                sampler.join()
+                server.kill()
+                server.wait()
+        statuses = [result["status"] for result in results]
+        admission = engines.get("admission", {})
+        rows.append({"admission": mode, "requests": len(burst), "ok": statuses.count(200),
+                     "too_large": statuses.count(413), "failed": sum(status not in (200, 413) for status in statuses),
+                     "retries": sum(result["attempts"] - 1 for result in results), "seconds": round(seconds, 1),
+                     "idle_mb": round(idle), "peak_mb": round(peak[0]), "limit_mb": args.limit_mb,
+                     "over_limit": peak[0] > args.limit_mb, "server_alive": alive,
+                     "queued": admission.get("queued", ""), "pool_recycles": engines.get("engines", {}).get(
+                         "pdfplumber", {}).get("executor", {}).get("recycled", "")})
+    print(f"{args.scans} scans of {args.scan_pages} {args.scan_inches[0]}x{args.scan_inches[1]} in pages (tesseract) and "
+          f"{args.texts} x 2 text documents of {args.text_pages} pages (pdfplumber, pymupdf), all at once; "
+          f"admission budget {args.budget_mb} MB")
+    print_table(rows, ["admission", "requests", "ok", "too_large", "failed", "retries", "seconds", "idle_mb",
+                       "peak_mb", "limit_mb", "over_limit", "server_alive", "queued", "pool_recycles"])
+
+##################################################################################################################
+# sink: request-path cost and disk use of keeping extracted text, old synchronous writes vs the result sink
+
+def cmd_sink(args):
+    import random
+    rng = random.Random(args.seed)
+    # distinct documents often share an upload name (scan.pdf); repeats are the same document sent again
+    unique = [(f"scan {number % args.names}.pdf", corpus_text(rng, args.words))
+              for number in range(max(1, round(args.docs * (1 - args.duplicates))))]
+    docs = unique + [rng.choice(unique) for _ in range(args.docs - len(unique))]
+    rng.shuffle(docs)
+    with app_workdir() as (main1, workdir):
+
+        def synchronous_write(filename, text, method):  # what every request used to do on the event loop
+            with open(f"{filename.replace(' ', '_')}_{method}.md", "w", encoding="utf-8") as md_file:
+                md_file.write(f"# Extracted Text ({method})\n\n{text}")
+
+        sinks = {"synchronous .md in cwd": ("sync", "none")}
+        sinks.update({f"{kind}, {compression}": (kind, compression) for kind in args.kinds.split(",")
+                      for compression in args.compression.split(",")})
+        rows = []
+        for label, (kind, compression) in sinks.items():
+            directory = os.path.join(workdir, label.replace(" ", "_").replace(",", ""))
+            os.makedirs(directory)
+            sink = main1.ResultSink(kind, main1.Path(directory), compression, 0, 0, args.docs)
+            save = synchronous_write if kind == "sync" else sink.save
+            cwd = os.getcwd()
+            os.chdir(directory)
+            start = time.perf_counter()
+            for filename, text in docs:
+                save(filename, text, "pymupdf")
+            request_seconds = time.perf_counter() - start
+            sink.flush()
+            total_seconds = time.perf_counter() - start
+            sink.close()
+            os.chdir(cwd)
+            stored = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+            kept = len(stored) - (kind == "cas")  # the CAS index is not a text
+            rows.append({"sink": label, "saves": len(docs), "request_ms_per_save": round(1000 * request_seconds / len(docs), 3),
+                         "total_s": round(total_seconds, 2), "files": len(stored), "texts_lost": len(unique) - kept,
+                         "disk_mb": round(sum(map(os.path.getsize, stored)) / (1024 * 1024), 2),
+                         "deduplicated": sink.stats["deduplicated"] if kind != "sync" else ""})
+    print(f"{args.docs} saves of {args.words}-word texts under {args.names} file names, {args.duplicates:.0%} of them repeats")
+    print_table(rows, ["sink", "saves", "request_ms_per_save", "total_s", "files", "texts_lost", "disk_mb", "deduplicated"])
+
+##################################################################################################################
+# suite: reproducible speed / memory / accuracy benchmark of every engine function on a local corpus
+#   corpus   generate (or reuse) digital, scanned, table and PPTX documents with ground-truth text
+#   run      run each engine in its own interpreter; JSON results plus a markdown table
+#   compare  flag regressions between two result files
+
+CORPUS_WORDS = (SAMPLE_TEXT.replace(",", "").replace(".", "").split()
+                + "invoice total amount quantity unit price tax shipping account reference 2024 17 350 0.75".split())
+
+SUITE_ENGINES = {  # engine -> document kinds it is run on
+    "pymupdf": ["digital", "scanned", "tables"],
+    "pdfplumber": ["digital", "scanned", "tables"],
+    "pdfminer": ["digital", "scanned", "tables"],
+    "tesseract": ["digital", "scanned", "tables"],
+    "docling": ["digital", "scanned", "tables", "pptx"],
+    "marker": ["digital", "scanned", "tables"],
+    "doctr": ["digital", "scanned", "tables"],
+    "pptx2md": ["pptx"],
+}
+
+def corpus_text(rng, words: int):
+    return " ".join(rng.choice(CORPUS_WORDS) for _ in range(words)).capitalize() + "."
+
+def make_corpus_pdf(path: str, pages: list):
+    """Write a digital PDF with one text string per page."""
+    import fitz
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        if page.insert_textbox(fitz.Rect(72, 72, 540, 760), text, fontsize=10) < 0:
+            raise ValueError("page text does not fit")
+    doc.save(path)
+    doc.close()
+
+def make_scanned_pdf(path: str, source_path: str, dpi: int):
+    """Rasterize every page of a PDF into an image-only PDF."""
+    import fitz
+    with fitz.open(source_path) as source:
+        doc = fitz.open()
+        for page in source:
+            scanned = doc.new_page(width=page.rect.width, height=page.rect.height)
+            scanned.insert_image(scanned.rect, pixmap=page.get_pixmap(dpi=dpi))
+        doc.save(path)
+        doc.close()
+
+def make_table_pdf(path: str, tables: list):
+    """Write one ruled table (list of rows of cell strings) per page."""
+    import fitz
+    doc = fitz.open()
+    for rows in tables:
+        page = doc.new_page()
+        width = 468 / len(rows[0])
+        for r, row in enumerate(rows):
+            for c, cell in enumerate(row):
+                rect = fitz.Rect(72 + c * width, 72 + r * 20, 72 + (c + 1) * width, 92 + r * 20)
+                page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+                page.insert_text((rect.x0 + 3, rect.y1 - 6), cell, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def make_pptx(path: str, slides: list):
+    """Write a deck with a title and a body text box per slide (needs python-pptx)."""
+    from pptx import Presentation
+    from pptx.util import Inches
+    deck = Presentation()
+    for title, body in slides:
+        slide = deck.slides.add_slide(deck.slide_layouts[5])
+        slide.shapes.title.text = title
+        slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(5)).text_frame.text = body
+    deck.save(path)
+
+def generate_corpus(corpus_dir: str, docs: int, pages: int, dpi: int, seed: int):
+    """Create the corpus and its manifest; every document has a .txt file with its ground truth."""
+    import random
+    rng = random.Random(seed)
+    documents = []
+
+    def add(kind, name, pages, truth):
+        with open(os.path.join(corpus_dir, kind, name + ".txt"), "w", encoding="utf-8") as f:
+            f.write(truth)
+        suffix = ".pptx" if kind == "pptx" else ".pdf"
+        documents.append({"file": f"{kind}/{name}{suffix}", "kind": kind, "pages": pages, "truth": f"{kind}/{name}.txt"})
+
+    for kind in ("digital", "scanned", "tables", "pptx"):
+        os.makedirs(os.path.join(corpus_dir, kind), exist_ok=True)
+    for i in range(docs):
+        texts = [corpus_text(rng, rng.randint(150, 300)) for _ in range(pages)]
+        digital = os.path.join(corpus_dir, "digital", f"doc_{i:03d}.pdf")
+        make_corpus_pdf(digital, texts)
+        add("digital", f"doc_{i:03d}", pages, "\n".join(texts))
+        make_scanned_pdf(os.path.join(corpus_dir, "scanned", f"doc_{i:03d}.pdf"), digital, dpi)
+        add("scanned", f"doc_{i:03d}", pages, "\n".join(texts))
+
+        tables = [[[rng.choice(CORPUS_WORDS) if c < 2 else f"{rng.randint(1, 9999)}" for c in range(5)]
+                   for _ in range(rng.randint(10, 25))] for _ in range(pages)]
+        make_table_pdf(os.path.join(corpus_dir, "tables", f"doc_{i:03d}.pdf"), tables)
+        add("tables", f"doc_{i:03d}", pages, "\n".join(" ".join(row) for table in tables for row in table))
+
+        slides = [(f"Slide {s + 1}", corpus_text(rng, rng.randint(20, 60))) for s in range(pages)]
+        try:
+            make_pptx(os.path.join(corpus_dir, "pptx", f"deck_{i:03d}.pptx"), slides)
+        except ImportError:
+            if i == 0:
+                print("python-pptx is not installed, the corpus has no PPTX documents", file=sys.stderr)
+            continue
+        add("pptx", f"deck_{i:03d}", pages, "\n".join(f"{title}\n{body}" for title, body in slides))
+
+    manifest = {"seed": seed, "dpi": dpi, "documents": documents}
+    with open(os.path.join(corpus_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def load_corpus(corpus_dir: str, docs: int = 5, pages: int = 3, dpi: int = 150, seed: int = 0):
+    """Load the corpus manifest from corpus_dir, generating the corpus first if there is none."""
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    os.makedirs(corpus_dir, exist_ok=True)
+    return generate_corpus(corpus_dir, docs, pages, dpi, seed)
+
+def levenshtein(a: str, b: str):
+    """Edit distance, bit-parallel (Myers/Hyyrö) over Python ints, so long texts stay fast without C helpers."""
+    try:
+        from rapidfuzz.distance import Levenshtein
+        return Levenshtein.distance(a, b)
+    except ImportError:
+        pass
+    if not a or not b:
+        return len(a) + len(b)
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask, high = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def character_error_rate(text: str, truth: str):
+    """CER after collapsing whitespace, which engines lay out differently."""
+    text, truth = " ".join(text.split()), " ".join(truth.split())
+    return levenshtein(text, truth) / max(1, len(truth))
+
+def percentile(values, fraction: float):
+    """Nearest-rank percentile."""
+    import math
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+SUITE_SNIPPET = """
+import json, os, sys, threading, time
+import psutil
+import main1
+engine, corpus_dir, files = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+ENGINES = {
+    "pymupdf": main1.extract_text_pymupdf,
+    "pdfplumber": main1.extract_text_pdfplumber,
+    "pdfminer": lambda path: main1.convert_pdf_to_txt_file(path)[0],
+    "tesseract": main1.extract_text_tesseract,
+    "docling": lambda path: main1.extract_text_docling(path, os.path.basename(path)),
+    "marker": lambda path: main1.extract_text_marker(path)[0],
+    "doctr": main1.extract_text_doctr,
+    "pptx2md": lambda path: main1.convert_pptx_file(path, os.path.splitext(os.path.basename(path))[0], True)[0],
+}
+main1.load_engine(engine)
+process = psutil.Process()
+peak = [process.memory_info().rss]
+done = threading.Event()
+def sample():
+    while not done.wait(0.02):
+        peak[0] = max(peak[0], process.memory_info().rss)
+threading.Thread(target=sample, daemon=True).start()
+extract = ENGINES[engine]
+start = time.perf_counter()
+extract(os.path.join(corpus_dir, files[0]))  # warm-up: model loading and lazy imports
+warmup = time.perf_counter() - start
+results = []
+for name in files:
+    start = time.perf_counter()
+    text = extract(os.path.join(corpus_dir, name))
+    results.append({"file": name, "seconds": time.perf_counter() - start, "text": text or ""})
+done.set()
+print(json.dumps({"warmup_seconds": warmup, "peak_rss_mb": max(peak[0], process.memory_info().rss) / 2**20, "documents": results}))
+"""
+
+SUITE_COLUMNS = ["engine", "kind", "docs", "pages", "pages_per_sec", "p50_ms", "p95_ms", "warmup_s", "peak_rss_mb", "cer", "error"]
+
+def suite_environment():
+    import platform
+    sys.path.insert(0, REPO_DIR)
+    import main1
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "engine_versions": {engine: main1.engine_version(engine) for engine in main1.ENGINE_DISTRIBUTIONS}}
+
+def cmd_corpus(args):
+    manifest = load_corpus(args.corpus, args.docs, args.pages, args.dpi, args.seed)
+    kinds = {}
+    for document in manifest["documents"]:
+        kinds[document["kind"]] = kinds.get(document["kind"], 0) + 1
+    print(f"{args.corpus}: {json.dumps(kinds)}")
+
+def cmd_run(args):
+    corpus_dir = os.path.abspath(args.corpus)
+    manifest = load_corpus(corpus_dir, args.docs, args.pages, args.dpi, args.seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine in args.engines.split(","):
+            for kind in SUITE_ENGINES[engine]:
+                documents = [document for document in manifest["documents"] if document["kind"] == kind]
+                if not documents:
+                    continue
+                # one interpreter per engine and kind, so peak RSS and warm-up are not shared between runs
+                result = run_snippet(SUITE_SNIPPET, engine, corpus_dir, json.dumps([d["file"] for d in documents]), cwd=workdir)
+                row = {"engine": engine, "kind": kind, "docs": len(documents), "pages": sum(d["pages"] for d in documents)}
+                if "error" in result:
+                    rows.append({**row, "error": result["error"]})
+                    print(f"{engine}/{kind}: {result['error']}", file=sys.stderr)
+                    continue
+                seconds = [d["seconds"] for d in result["documents"]]
+                cers = []
+                for document, extracted in zip(documents, result["documents"]):
+                    with open(os.path.join(corpus_dir, document["truth"]), encoding="utf-8") as f:
+                        cers.append(character_error_rate(extracted["text"], f.read()))
+                rows.append({**row, "pages_per_sec": round(row["pages"] / max(sum(seconds), 1e-9), 2),
+                             "p50_ms": round(1000 * percentile(seconds, 0.5), 1), "p95_ms": round(1000 * percentile(seconds, 0.95), 1),
+                             "warmup_s": round(result["warmup_seconds"], 2), "peak_rss_mb": round(result["peak_rss_mb"], 1),
+                             "cer": round(sum(cers) / len(cers), 4)})
+                print(f"{engine}/{kind}: done", file=sys.stderr)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "environment": suite_environment(),
+              "corpus": {"path": corpus_dir, "seed": manifest["seed"], "documents": len(manifest["documents"])},
+              "results": rows}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    table = markdown_table(rows, SUITE_COLUMNS)
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            f.write(table + "\n")
+    print(table)
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = {(row["engine"], row["kind"]): row for row in json.load(f)["results"]}
+    with open(args.candidate) as f:
+        candidate = {(row["engine"], row["kind"]): row for row in json.load(f)["results"]}
+
+    def change(old, new):
+        return (new - old) / old if old else 0.0
+
+    rows, regressions = [], 0
+    for key in baseline.keys() & candidate.keys():
+        old, new = baseline[key], candidate[key]
+        if "error" in old or "error" in new:
+            continue
+        flags = []
+        if change(old["pages_per_sec"], new["pages_per_sec"]) < -args.threshold:
+            flags.append("pages/sec")
+        if change(old["p95_ms"], new["p95_ms"]) > args.threshold:
+            flags.append("p95")
+        if change(old["peak_rss_mb"], new["peak_rss_mb"]) > args.threshold:
+            flags.append("rss")
+        if new["cer"] - old["cer"] > args.cer_threshold:
+            flags.append("cer")
+        regressions += bool(flags)
+        rows.append({"engine": key[0], "kind": key[1],
+                     "pages_per_sec": f"{old['pages_per_sec']} -> {new['pages_per_sec']} ({change(old['pages_per_sec'], new['pages_per_sec']):+.0%})",
+                     "p95_ms": f"{old['p95_ms']} -> {new['p95_ms']} ({change(old['p95_ms'], new['p95_ms']):+.0%})",
+                     "peak_rss_mb": f"{old['peak_rss_mb']} -> {new['peak_rss_mb']} ({change(old['peak_rss_mb'], new['peak_rss_mb']):+.0%})",
+                     "cer": f"{old['cer']} -> {new['cer']}", "regression": ", ".join(flags) or "-"})
+    rows.sort(key=lambda row: (row["engine"], row["kind"]))
+    print_table(rows, ["engine", "kind", "pages_per_sec", "p95_ms", "peak_rss_mb", "cer", "regression"])
+    if regressions:
+        sys.exit(f"FAIL: {regressions} regressions beyond {args.threshold:.0%} (CER +{args.cer_threshold})")
+
+##################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF Extraction HUB benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    startup = sub.add_parser("startup", help="cold import and first-request latency per engine")
+    startup.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer,tesseract,docling,marker")
+    startup.add_argument("--pages", type=int, default=5)
+    startup.add_argument("--json", action="store_true")
+    startup.set_defaults(func=cmd_startup)
+
+    cache = sub.add_parser("cache", help="result cache miss/hit latency per tier")
+    cache.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer")
+    cache.add_argument("--pages", type=int, default=50)
+    cache.set_defaults(func=cmd_cache)
+
+    shard = sub.add_parser("shard", help="serial vs page-sharded extraction speedup")
+    shard.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer")
+    shard.add_argument("--pages", default="50,200,800")
+    shard.add_argument("--workers", type=int, default=0, help="shard pool size (default: SHARD_WORKERS / CPU count)")
+    shard.set_defaults(func=cmd_shard)
+
+    ocr = sub.add_parser("ocr", help="peak memory and time of the windowed OCR pipeline")
+    ocr.add_argument("--pages", default="10,40")
+    ocr.add_argument("--window", default="2,4,8")
+    ocr.add_argument("--dpi", type=int, default=200)
+    ocr.add_argument("--workers", type=int, default=2)
+    ocr.set_defaults(func=cmd_ocr)
+
+    auto = sub.add_parser("auto", help="all-OCR vs per-page text/OCR routing on a mixed document")
+    auto.add_argument("--pages", type=int, default=50)
+    auto.add_argument("--scanned-every", type=int, default=5, help="every Nth page is scanned (5 = 20%% scanned)")
+    auto.add_argument("--dpi", type=int, default=200)
+    auto.set_defaults(func=cmd_auto)
+
+    uploads = sub.add_parser("uploads", help="concurrent same-named uploads, in memory and spooled to disk")
+    uploads.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer")
+    uploads.add_argument("--clients", type=int, default=32)
+    uploads.add_argument("--pages", type=int, default=2)
+    uploads.add_argument("--memory-mb", default="32,0", help="UPLOAD_MEMORY_MB values to run (0 = always spool)")
+    uploads.set_defaults(func=cmd_uploads)
+
+    jobs = sub.add_parser("jobs", help="job API: submit latency, priorities, cancellation and TTL per backend")
+    jobs.add_argument("--backends", default="local,redis", help="redis uses an in-process stand-in")
+    jobs.add_argument("--engine", default="pdfplumber")
+    jobs.add_argument("--jobs", type=int, default=10)
+    jobs.add_argument("--pages", type=int, default=40)
+    jobs.add_argument("--ttl", type=int, default=5, help="JOB_RESULT_TTL for the run, in seconds")
+    jobs.set_defaults(func=cmd_jobs)
+
+    batch = sub.add_parser("batch", help="docs/sec of per-file requests vs /extract/batch (files and ZIP)")
+    batch.add_argument("--engines", default="pymupdf,pdfplumber")
+    batch.add_argument("--docs", type=int, default=200)
+    batch.add_argument("--pages", type=int, default=2)
+    batch.add_argument("--concurrency", type=int, default=4)
+    batch.set_defaults(func=cmd_batch)
+
+    profile = sub.add_parser("profile", help="overhead of the profiling hook (off and on) per request")
+    profile.add_argument("--engine", default="pymupdf")
+    profile.add_argument("--requests", type=int, default=300)
+    profile.add_argument("--pages", type=int, default=2)
+    profile.set_defaults(func=cmd_profile)
+
+    pages = sub.add_parser("pages", help="full document vs max_pages / pages= selections per engine")
+    pages.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer")
+    pages.add_argument("--pages", type=int, default=400)
+    pages.add_argument("--preview", type=int, default=5, help="max_pages of the preview run")
+    pages.set_defaults(func=cmd_pages)
+
+    tables = sub.add_parser("tables", help="table-page detection vs find_tables / the table model on every page")
+    tables.add_argument("--pages", type=int, default=200)
+    tables.add_argument("--table-pages", type=int, default=3)
+    tables.set_defaults(func=cmd_tables)
+
+    stream = sub.add_parser("stream", help="time to first byte and server memory of stream=true vs buffered responses")
+    stream.add_argument("--engines", default="pymupdf,pdfplumber,pdfminer")
+    stream.add_argument("--pages", default="200,1000")
+    stream.set_defaults(func=cmd_stream)
+
+    thinker = sub.add_parser("thinker", help="LLM requests and latency of extract_thinker against a mock OpenAI-compatible server")
+    thinker.add_argument("--pages", type=int, default=60)
+    thinker.add_argument("--latency", type=float, default=0.5, help="seconds the mock LLM takes per request")
+    thinker.add_argument("--ms-per-1k-chars", type=float, default=20, help="extra mock latency per 1000 prompt characters")
+    thinker.add_argument("--chunk-chars", type=int, default=12000)
+    thinker.add_argument("--concurrency", type=int, default=4)
+    thinker.add_argument("--concurrent-docs", type=int, default=4)
+    thinker.set_defaults(func=cmd_thinker)
+
+    preprocess = sub.add_parser("preprocess", help="Tesseract speed and CER with and without page preprocessing on noisy scans")
+    preprocess.add_argument("--pages", type=int, default=20)
+    preprocess.add_argument("--blank-every", type=int, default=5, help="every Nth page is blank (0 = none)")
+    preprocess.add_argument("--scan-dpi", type=int, default=150, help="resolution of the simulated scans")
+    preprocess.add_argument("--dpi", type=int, default=200, help="OCR rendering dpi")
+    preprocess.add_argument("--psm", type=int, default=3)
+    preprocess.add_argument("--oem", type=int, default=3)
+    preprocess.add_argument("--seed", type=int, default=0)
+    preprocess.set_defaults(func=cmd_preprocess)
+
+    pagecache = sub.add_parser("pagecache", help="documents sharing boilerplate pages with the page cache off and on")
+    pagecache.add_argument("--engines", default="pdfplumber,pdfminer")
+    pagecache.add_argument("--docs", type=int, default=50)
+    pagecache.add_argument("--shared", type=int, default=3, help="boilerplate pages every document has")
+    pagecache.add_argument("--unique", type=int, default=2, help="pages only one document has")
+    pagecache.add_argument("--cache-mb", type=int, default=64)
+    pagecache.add_argument("--seed", type=int, default=0)
+    pagecache.set_defaults(func=cmd_pagecache)
+
+    checkpoint = sub.add_parser("checkpoint", help="kill the API in the middle of a long document, retry and resume")
+    checkpoint.add_argument("--engine", default="tesseract")
+    checkpoint.add_argument("--pages", type=int, default=40)
+    checkpoint.add_argument("--kill-at", type=int, default=30, help="pages checkpointed before the server is killed")
+    checkpoint.set_defaults(func=cmd_checkpoint)
+
+    layout = sub.add_parser("layout", help="size and serialization time of the columnar word layout vs a JSON list")
+    layout.add_argument("--engines", default="pymupdf,pdfplumber")
+    layout.add_argument("--pages", type=int, default=200)
+    layout.add_argument("--repeat", type=int, default=3, help="serializations timed per format")
+    layout.add_argument("--seed", type=int, default=0)
+    layout.set_defaults(func=cmd_layout)
+
+    admission = sub.add_parser("admission", help="peak memory (PSS of the server's processes) of a mixed burst with admission control off and on")
+    admission.add_argument("--scans", type=int, default=8, help="large-format scans OCRed with tesseract")
+    admission.add_argument("--scan-pages", type=int, default=3)
+    admission.add_argument("--scan-inches", type=float, nargs=2, default=[24, 36], help="page width and height")
+    admission.add_argument("--texts", type=int, default=8, help="text documents sent to pdfplumber and to pymupdf")
+    admission.add_argument("--text-pages", type=int, default=20)
+    admission.add_argument("--budget-mb", type=float, default=900, help="ADMISSION_MEMORY_MB of the 'on' run")
+    admission.add_argument("--limit-mb", type=float, default=1400, help="memory limit of the simulated container")
+    admission.add_argument("--limits", default="tesseract=8:64", help="PDF_HUB_LIMITS of both runs")
+    admission.add_argument("--worker-max-tasks", type=int, default=4, help="WORKER_MAX_TASKS of both runs")
+    admission.add_argument("--give-up", type=float, default=600, help="seconds a client keeps retrying 429/503")
+    admission.add_argument("--seed", type=int, default=0)
+    admission.set_defaults(func=cmd_admission)
+
+    sink = sub.add_parser("sink", help="request-path cost and disk use of synchronous markdown writes vs the result sink")
+    sink.add_argument("--docs", type=int, default=2000)
+    sink.add_argument("--words", type=int, default=2000, help="words per extracted text")
+    sink.add_argument("--duplicates", type=float, default=0.3, help="fraction of saves repeating an earlier document")
+    sink.add_argument("--names", type=int, default=200, help="distinct upload file names")
+    sink.add_argument("--kinds", default="local,cas")
+    sink.add_argument("--compression", default="none,gzip,zstd")
+    sink.add_argument("--seed", type=int, default=0)
+    sink.set_defaults(func=cmd_sink)
+
+    corpus_args = argparse.ArgumentParser(add_help=False)
+    corpus_args.add_argument("--corpus", default="bench_corpus", help="corpus directory, generated when it has no manifest")
+    corpus_args.add_argument("--docs", type=int, default=5, help="documents per kind when generating")
+    corpus_args.add_argument("--pages", type=int, default=3, help="pages per document when generating")
+    corpus_args.add_argument("--dpi", type=int, default=150, help="rasterization dpi of scanned documents")
+    corpus_args.add_argument("--seed", type=int, default=0)
+
+    corpus = sub.add_parser("corpus", parents=[corpus_args], help="generate the benchmark corpus")
+    corpus.set_defaults(func=cmd_corpus)
+
+    doctr = sub.add_parser("doctr", parents=[corpus_args], help="doctr per batch size vs Tesseract on the scanned corpus")
+    doctr.add_argument("--batch", default="1,4,8", help="comma separated pages per predictor call")
+    doctr.add_argument("--threads", type=int, default=0, help="DOCTR_THREADS, 0 keeps torch's default")
+    doctr.add_argument("--untrained", action="store_true", help="random weights, when pretrained ones cannot be downloaded")
+    doctr.set_defaults(func=cmd_doctr)
+
+    run = sub.add_parser("run", parents=[corpus_args], help="speed, memory and accuracy of every engine on the corpus")
+    run.add_argument("--engines", default=",".join(SUITE_ENGINES))
+    run.add_argument("--out", help="write results as JSON")
+    run.add_argument("--markdown", help="write the results table as markdown")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="flag regressions between two `run --out` result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=0.1, help="relative change in pages/sec, p95 or RSS")
+    compare.add_argument("--cer-threshold", type=float, default=0.01, help="absolute CER increase")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,482 +1,3973 @@
-from fastapi import FastAPI, UploadFile, File, Query
-import pdfplumber
-from pdf2image import convert_from_path
-import shutil
-import os
-import fitz  # PyMuPDF
-from docling.document_converter import DocumentConverter  # docling
-from marker.converters.pdf import PdfConverter
-from marker.converters.table import TableConverter
-from marker.models import create_model_dict
-from marker.output import text_from_rendered
-import deepdoctection as dd
-from extract_thinker import Extractor
-from extract_thinker.exceptions import ExtractThinkerError
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfpage import PDFPage
-from io import StringIO
-import base64
-#------- OCR ------------
-import pdf2image
-import pytesseract
-from pytesseract import Output, TesseractError
-from doctr.io import DocumentFile
-
-# Extract thinker
-import os
-import shutil
-from fastapi import FastAPI, UploadFile, File
-from dotenv import load_dotenv
-from extract_thinker import Extractor, DocumentLoaderPyPdf, Contract
-
-
-#logs
-import logging
-
-print(DocumentFile)
-##################################################################################################################
-
-app = FastAPI()
-
-##################################################################################################################
-# logs
-
-import logging
-
-log_file = "api_logs.log"
-
-# Create a logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)  # Change to DEBUG for more logs
-
-# Create handlers
-file_handler = logging.FileHandler(log_file, mode="a")  # Appends logs
-console_handler = logging.StreamHandler()  # Prints to console
-
-# Set formatter
-formatter = logging.Formatter("%(asctime)s [%(filename)s:%(lineno)d] %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
-
-# Add handlers to the logger (avoid duplicates)
-if not logger.hasHandlers():
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-# Example log message
-logger.info("Logging setup complete. Logs will be saved in api_logs.log")
-
-##################################################################################################################
-# helper functions
-def handle_file_upload(file: UploadFile):
-    """Handle file upload, save temporarily, and return path."""
-    temp_path = f"temp_{file.filename.replace(' ', '_')}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    logging.info(f"File uploaded and saved as: {temp_path}")
-    return temp_path
-
-def save_text_as_markdown(filename: str, text: str, method: str):
-    """Save extracted text as a Markdown (.md) file."""
-    sanitized_filename = filename.replace(" ", "_")
-    md_filename = f"{sanitized_filename}_{method}.md"
-    with open(md_filename, "w", encoding="utf-8") as md_file:
-        md_file.write(f"# Extracted Text ({method})\n\n{text}")
-        logging.info(f"Extracted text saved as: {md_filename}")
-    return md_filename
-
-# main functions and apis
-##################################################################################################################
-# 1. pdf plumber
-def extract_text_pdfplumber(pdf_path: str):
-    """Extract text from text-based PDFs using PDFPlumber."""
-    text = ""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n" if page.extract_text() else ""
-        logging.info(f"Test extracted using pdfplumber from: {pdf_path}")
-    except Exception as e:
-        logging.error(f"Error occur during text extraction with pdfplumber: {e}")
-
-    return text.strip()
-
-
-# api
-@app.post("/extract/pdfplumber")
-async def pdfplumber_extraction(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text = extract_text_pdfplumber(temp_path)
-    os.remove(temp_path)
-    logging.info(f"Temporary file deleted: {temp_path}")
-    md_filename = save_text_as_markdown(file.filename, text, "pdfplumber") if text else None
-    return {"text": text or "No text extracted", "method": "PDFPlumber", "saved_as": md_filename}
-
-##################################################################################################################
-#2. pytesseract
-def extract_text_tesseract(pdf_path: str):
-    """Extract text from scanned PDFs using Tesseract OCR."""
-    text=""
-    try:
-        images = convert_from_path(pdf_path)
-        for img in images:
-            text += pytesseract.image_to_string(img) + "\n"
-        logging.info(f"Text extracted using Tesseract OCR from: {pdf_path}")
-    except Exception as e:
-        logging.error(f"Error extracting text with Tesseract: {e}")
-    return text.strip()
-
-#api
-@app.post("/extract/tesseract")
-async def tesseract_extraction(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text = extract_text_tesseract(temp_path)
-    os.remove(temp_path)
-    md_filename = save_text_as_markdown(file.filename, text, "tesseract") if text else None
-    return {"text": text or "No text extracted", "method": "Tesseract OCR", "saved_as": md_filename}
-    
-##################################################################################################################
-#3. pymupdf        
-def extract_text_pymupdf(pdf_path: str):
-    """Extract text using PyMuPDF."""
-    text = ""
-    try:
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            text += page.get_text("text") + "\n"
-        logging.info(f"Text extracting using PyMuPDF: {pdf_path}")
-    except Exception as e:
-        logging.error(f"Error extracting text with PyMuPDF {e}")
-    return text.strip()
-#api
-@app.post("/extract/pymupdf")
-async def pymupdf_extraction(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text = extract_text_pymupdf(temp_path)
-    os.remove(temp_path)
-    logging.info(f"Temporary file deleted: {temp_path}")
-    md_filename = save_text_as_markdown(file.filename, text, "pymupdf") if text else None
-    return {"text": text or "No text extracted", "method": "PyMuPDF", "saved_as": md_filename}
-    
-##################################################################################################################
-#docling
-# Docling configuration
-SUPPORTED_FORMATS = ["pdf", "pptx", "docx", "xlsx", "md", "csv", "png", "jpeg", "tiff"]
-
-def extract_text_docling(temp_path: str, filename: str):
-    """Extract text using Docling."""
-    logging.info(f"Starting docling extraction for file: {filename}")
-    file_ext = filename.split(".")[-1].lower()
-    if file_ext not in SUPPORTED_FORMATS:
-        logging.warning(f"Unsupported file format: {file_ext}")
-        return "Unsupported file format"
-    
-    converter = DocumentConverter()
-    result = converter.convert(temp_path)
-    logging.info(f"Successfully extracted text using Docling for file: {filename}")
-    return result.document.export_to_markdown()
-#api
-@app.post("/extract/docling")
-async def docling_extraction(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text = extract_text_docling(temp_path, file.filename)
-    os.remove(temp_path)
-    logging.info(f"File {file.filename} processed and deleted from temp storage")
-    md_filename = save_text_as_markdown(file.filename, text, "docling") if text and "Unsupported" not in text else None
-    return {"text": text, "method": "Docling", "saved_as": md_filename}
-
-##################################################################################################################
-# 5.  Marker text extraction
-def extract_text_marker(temp_path: str):
-    """Extract text and tables using Marker."""
-    logging.info(f"Starting Marker extraction for file: {temp_path}")
-    text_converter = PdfConverter(artifact_dict=create_model_dict())
-    table_converter = TableConverter(artifact_dict=create_model_dict())
-    
-    text_rendered = text_converter(temp_path)
-    table_rendered = table_converter(temp_path)
-    
-    text, _, _ = text_from_rendered(text_rendered)
-    table_text, _, _ = text_from_rendered(table_rendered)
-    logging.info(f"Marker extraction completed for file: {temp_path}")
-    
-    return text, table_text
-#api
-@app.post("/extract/marker")
-async def marker_extraction(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text, table_text = extract_text_marker(temp_path)
-    os.remove(temp_path)
-    logging.info(f"File {file.filename} processed and deleted from temp storage")
-    
-    md_text = save_text_as_markdown(file.filename, text, "marker_text") if text else None
-    md_table = save_text_as_markdown(file.filename, table_text, "marker_table") if table_text else None
-    
-    return {
-        "text": text or "No text extracted",
-        "table_text": table_text or "No table extracted",
-        "saved_files": {"text": md_text, "table": md_table}
-    }
-##################################################################################################################
-#6.  doctr
-# # Doctr text extraction
-# import deepdoctection as dd
-# from matplotlib import pyplot as plt
-
-# def extract_text_doctr(temp_path: str, filename: str):
-#     """Extract text using Doctr."""
-#     config_overwrite = [
-#         "OCR.USE_DOCTR=True",
-#         "OCR.USE_TESSERACT=False",
-#         "TEXT_ORDERING.INCLUDE_RESIDUAL_TEXT_CONTAINER=True"
-#     ]
-
-#     analyzer = dd.get_dd_analyzer(config_overwrite=config_overwrite)
-#     doc = analyzer.analyze(temp_path)
-#     page_number = 1
-
-#     markdown_filename = f"{filename.replace(' ', '_')}_doctr.md"
-#     with open(markdown_filename, 'w') as markdown_file:
-#         for page in doc.pages:
-#             page_details = str(page)
-#             if page_number == 1:
-#                 markdown_file.write("# Extracted Content\n\n")
-#             markdown_file.write(f"## Page {page_number}\n\n")
-#             markdown_file.write(f"{page_details}\n\n")
-#             page_number += 1
-
-#     return markdown_filename
-
-
-# @app.post("/extract/doctr")
-# async def doctr_extraction(file: UploadFile = File(...)):
-#     temp_path = handle_file_upload(file)
-#     md_filename = extract_text_doctr(temp_path, file.filename)
-#     os.remove(temp_path)
-#     return {"method": "Doctr", "saved_as": md_filename}
-
-from doctr.io import DocumentFile
-print(DocumentFile)
-
-# @app.post("/extract/doctr")
-# async def extract_text_doctr(file: UploadFile = File(...)):
-#     temp_path = handle_file_upload(file)
-#     pdf_doc = DocumentFile.from_pdf(temp_path)
-#     extracted_text = "\n".join([page.text for page in pdf_doc])
-#     md_filename = save_text_as_markdown(file.filename, extracted_text, "doctr_pdf")
-#     return {"markdown_file": md_filename}  
-
-@app.post("extract/doctr")
-async def extract_text_doctr(file: UploadFile = File(...)):
-    pass
-
-##################################################################################################################
-# 7.  extract thinker
-
-load_dotenv()
-def create_dynamic_contract(field_list):
-    """Dynamically create a contract class based on user-provided fields."""
-    attributes = {"__annotations__": {field: str for field in field_list}}  # Explicit type annotations
-    attributes["__module__"] = __name__  # Required to avoid KeyError in Pydantic
-    return type("DynamicInvoiceContract", (Contract,), attributes)
-
-def extract_text_thinker(pdf_path: str, field_list: list):
-    """Extract user-specified fields from the given PDF file."""
-    logging.info(f"Starting Thinker extraction for file: {pdf_path}")
-    extractor = Extractor()
-    extractor.load_document_loader(DocumentLoaderPyPdf())
-    extractor.load_llm("gpt-4o")  # Load the required LLM
-
-    # Dynamically create the contract class
-    DynamicInvoiceContract = create_dynamic_contract(field_list)
-
-    # Extract data using the dynamically created contract
-    result = extractor.extract(pdf_path, DynamicInvoiceContract)
-
-    # Convert extracted result into a dictionary
-    extracted_data = {field: getattr(result, field, None) for field in field_list}
-    logging.info(f"Thinker extraction completed for file: {pdf_path}")
-    return extracted_data
-
-
-@app.post("/extract/extract_thinker")
-async def thinker_extraction(file: UploadFile = File(...), fields: list[str] = ["Insert field You want to extract"]):
-    """Extract user-specified fields from a PDF using extract_thinker."""
-    temp_path = handle_file_upload(file)
-    extracted_data = extract_text_thinker(temp_path, fields)
-    os.remove(temp_path)
-    logging.info(f"File {file.filename} processed and deleted from temp storage")
-    md_filename = save_text_as_markdown(file.filename, str(extracted_data), "extract_thinker") if extracted_data else None
-    return {"extracted_data": extracted_data or "No data extracted", "method": "extract_thinker", "saved_as": md_filename}
-##################################################################################################################
-# 8. pdfminer
-
-def convert_pdf_to_txt_file(pdf_path):
-    """Extracts full text from a PDF file using pdfminer."""
-    logging.info(f"Starting full pdf text extraction for {pdf_path}")
-    rsrcmgr = PDFResourceManager()
-    retstr = StringIO() 
-    laparams = LAParams()
-    device = TextConverter(rsrcmgr, retstr, laparams=laparams)
-    interpreter = PDFPageInterpreter(rsrcmgr, device)
-
-    with open(pdf_path, 'rb') as file:
-        pages = list(PDFPage.get_pages(file))
-        nb_pages = len(pages)  # Count total pages
-        logging.info(f"Total Pages found: {nb_pages}")
-        for page in pages:
-            interpreter.process_page(page)
-
-    text = retstr.getvalue()  # Get the full extracted text
-
-    device.close()
-    retstr.close()
-    logging.info(f"Completed full PDF extraction. Extracted {len(text)} characters.")
-    
-    return text, nb_pages
-
-def convert_pdf_to_txt_pages(pdf_path):
-    """Extracts text from a PDF file page by page using pdfminer."""
-    logging.info(f"Starting per-page PDF text extraction for {pdf_path}")
-    rsrcmgr = PDFResourceManager()
-    laparams = LAParams()
-    texts = []
-
-    with open(pdf_path, 'rb') as file:
-        retstr = StringIO()
-        device = TextConverter(rsrcmgr, retstr, laparams=laparams)
-        interpreter = PDFPageInterpreter(rsrcmgr, device)
-
-        pages = list(PDFPage.get_pages(file))
-        nb_pages = len(pages)  # Get total number of pages
-        logging.info(f"Total pages found: {nb_pages}")
-
-        size = 0  # Keeps track of text size per page
-        for c, page in enumerate(pages):
-            interpreter.process_page(page)
-            t = retstr.getvalue()
-            if c == 0:
-                texts.append(t)  # First page
-            else:
-                texts.append(t[size:])  # Subsequent pages get new content only
-            size = len(t)  # Update size for the next iteration
-
-        device.close()
-        retstr.close()
-    logging.info(f"Completed per-page PDF extraction. Extracted text from {nb_pages} pages.")
-    return texts, nb_pages    
-
-@app.post("/extract/pdfminer/pages")
-async def extract_pdfminer_pages(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    texts, nb_pages = convert_pdf_to_txt_pages(temp_path)
-    os.remove(temp_path)
-    md_filename = save_text_as_markdown(file.filename, "\n".join(texts), "pdfminer") if texts else None
-    return {"text": texts or "No text extracted", "pages": nb_pages, "method": "PDFMiner", "saved_as": md_filename}
-
-@app.post("/extract/pdfminer_full")
-async def extract_pdfminer_full(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    text, nb_pages = convert_pdf_to_txt_file(temp_path)
-    os.remove(temp_path)
-    md_filename = save_text_as_markdown(file.filename, text, "pdfminer") if text else None
-    return {"text": text or "No text extracted", "pages": nb_pages, "method": "PDFMiner", "saved_as": md_filename}
-
-##################################################################################################################
-from pptx2md import convert, ConversionConfig
-from pathlib import Path
-import os
-
-OUTPUT_FOLDER = Path(os.getcwd()) / "output"
-TEMP_FOLDER = Path(os.getcwd()) / "temp"
-
-OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
-TEMP_FOLDER.mkdir(parents=True, exist_ok=True)
-
-@app.post("/extract/pptx2md")
-async def convert_pptx_to_md(file: UploadFile = File(...), disable_image: bool = False):
-    logging.info(f"Processing PPTX file: {file.filename}")
-    if not file.filename.endswith('.pptx'):
-        logging.error("Invalid file format. Only .pptx files are supported.")
-        return {"error": "Only .pptx files are supported."}
-    
-    try:
-        temp_pptx_path = TEMP_FOLDER / file.filename
-        with open(temp_pptx_path, "wb") as temp_file:
-            temp_file.write(await file.read())
-        
-        output_md_path = OUTPUT_FOLDER / f"{Path(file.filename).stem}.md"
-        image_dir = OUTPUT_FOLDER / Path(file.filename).stem / "images"
-        
-        if not disable_image:
-            image_dir.mkdir(parents=True, exist_ok=True)
-        
-        config = ConversionConfig(
-            pptx_path=temp_pptx_path,
-            output_path=output_md_path,
-            image_dir=image_dir if not disable_image else None,
-            disable_notes=False,
-            enable_slides=True,
-            disable_image=disable_image
-        )
-        
-        convert(config)
-        os.remove(temp_pptx_path)
-        
-        # Read generated markdown content
-        with open(output_md_path, "r", encoding="utf-8") as f:
-            md_content = f.read()
-
-        logging.info(f"PPTX conversion successfull. Markdown saved at {output_md_path}")
-        
-        return {
-            "markdown_content": md_content,
-            "filename": output_md_path.name
-        }
-    except Exception as e:
-        logging.error(f"Error processing PPTX file: {str(e)}")
-        return {"error": str(e)}
-
-
-##################################################################################################################
-
-@app.post("/extract/all")
-async def extract_all(file: UploadFile = File(...)):
-    temp_path = handle_file_upload(file)
-    results = {}
-    
-    try:
-        # Basic PDF extraction
-        results["pdfplumber"] = extract_text_pdfplumber(temp_path)
-        results["tesseract"] = extract_text_tesseract(temp_path)
-        results["pymupdf"] = extract_text_pymupdf(temp_path)
-        
-        # Docling extraction
-        results["docling"] = extract_text_docling(temp_path, file.filename)
-        
-        # Marker extraction
-        marker_text, marker_table = extract_text_marker(temp_path)
-        results["marker_text"] = marker_text
-        results["marker_table"] = marker_table
-        results["doctr"]=extract_text_doctr(temp_path, file.filename)
-        results["extract_thinker"]=extract_text_thinker(temp_path, file.filename)
-        results["extract_pdfminer_full"]=extract_pdfminer_full(temp_path, file.filename)
-        results["extract_pdfminer_pages"]=extract_pdfminer_pages(temp_path, file.filename)
-
-        
-        # Save all results
-        md_files = {}
-        for method, text in results.items():
-            if text and "Unsupported" not in text:
-                md_files[method] = save_text_as_markdown(file.filename, text, method)
-        
-        return {"results": results, "saved_files": md_files}
-    
-    finally:
-        os.remove(temp_path)
-
-@app.get("/supported-formats")
-async def supported_formats():
-    return {"supported_formats": SUPPORTED_FORMATS}
\ No newline at end of file
+from fastapi import FastAPI, UploadFile, File, Form, Query, Depends, HTTPException, Request
+from fastapi import Path as FastAPIPath
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+import shutil
+import os
+from io import BytesIO, StringIO
+import asyncio
+import contextvars
+import cProfile
+import functools
+import gc
+import hashlib
+import hmac
+import importlib
+import importlib.metadata
+import importlib.util
+import inspect
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from queue import Full, Queue
+import tempfile
+import uuid
+import zipfile
+import psutil
+from dotenv import load_dotenv
+# Extraction backends (pdfplumber, fitz, pytesseract, docling, marker, doctr, extract_thinker, pdfminer,
+# pptx2md) are imported lazily by the engine that uses them, see the engine registry below.
+
+#logs
+import logging
+
+##################################################################################################################
+# metrics and stage timings
+# Prometheus metrics are kept in-process and served in the text exposition format by GET /metrics. Each
+# request also collects how long it spent in each stage: upload spooling, engine queueing, engine calls, page
+# rendering, OCR, model inference and markdown writing. The stages come back as a `timings` block in JSON
+# responses and a Server-Timing header, and as OpenTelemetry spans when opentelemetry is installed.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Metric:
+    """A metric family with labelled samples."""
+
+    registry = []
+
+    def __init__(self, name: str, help: str, kind: str):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.samples = {}
+        self._lock = threading.Lock()
+        Metric.registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.samples[tuple(sorted(labels.items()))] = value
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for labels, value in sorted(self.samples.items()):
+                lines.append(f"{self.name}{self.format_labels(labels)} {value}")
+        return lines
+
+class Histogram(Metric):
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, "histogram")
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self.samples.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += value
+            total[1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, (total, count)) in sorted(self.samples.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self.format_labels(labels + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{self.format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{self.format_labels(labels)} {count}")
+        return lines
+
+HTTP_REQUESTS = Metric("pdfhub_http_requests_total", "HTTP requests by route, method and status code.", "counter")
+HTTP_SECONDS = Histogram("pdfhub_http_request_seconds", "HTTP request latency by route.")
+HTTP_IN_FLIGHT = Metric("pdfhub_http_requests_in_flight", "HTTP requests being served.", "gauge")
+ENGINE_CALLS = Metric("pdfhub_engine_calls_total", "Engine calls by engine and outcome (ok or error).", "counter")
+ENGINE_SECONDS = Histogram("pdfhub_engine_seconds", "Engine call duration, excluding time queued for a slot.")
+ENGINE_QUEUE_SECONDS = Histogram("pdfhub_engine_queue_seconds", "Time spent waiting for an engine slot.")
+ENGINE_IN_FLIGHT = Metric("pdfhub_engine_in_flight", "Engine calls running.", "gauge")
+ENGINE_QUEUED = Metric("pdfhub_engine_queued", "Engine calls waiting for a slot.", "gauge")
+PAGES_PROCESSED = Metric("pdfhub_pages_processed_total", "Pages of PDF documents extracted, by engine.", "counter")
+UPLOAD_BYTES = Metric("pdfhub_upload_bytes_total", "Bytes of uploaded documents ingested.", "counter")
+STAGE_SECONDS = Histogram("pdfhub_stage_seconds", "Time spent per request stage.")
+JOBS_QUEUED = Metric("pdfhub_jobs_queued", "Jobs waiting in the job queue.", "gauge")
+RESULT_CACHE_LOOKUPS = Metric("pdfhub_result_cache_lookups_total", "Result cache lookups by outcome.", "counter")
+PAGE_CACHE_LOOKUPS = Metric("pdfhub_page_cache_lookups_total", "Page cache lookups by outcome.", "counter")
+PROCESS_RSS = Metric("pdfhub_process_resident_memory_bytes", "Resident memory of the API process.", "gauge")
+ADMISSIONS = Metric("pdfhub_admissions_total", "Engine calls by admission outcome.", "counter")
+ADMISSION_RESERVED = Metric("pdfhub_admission_reserved_bytes", "Predicted memory reserved by admitted engine calls.", "gauge")
+WORKER_RECYCLES = Metric("pdfhub_worker_recycles_total", "Process pools replaced after too many calls or too much memory.", "counter")
+
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer("pdfhub")  # a no-op until an OpenTelemetry SDK/exporter is configured
+except ImportError:
+    tracer = None
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+class StageTimings:
+    """Seconds per stage of one request; stages running on several threads (OCR workers) add up."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        with self._lock:
+            timings = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        return {**timings, "total": round(time.perf_counter() - self.start, 4)}
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.as_dict().items())
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a request stage (and an OpenTelemetry span)."""
+    start = time.perf_counter()
+    with tracer.start_as_current_span(name) if tracer is not None else nullcontext():
+        try:
+            yield
+        finally:
+            record_stage(name, time.perf_counter() - start)
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response that adds the request's stage timings to dict bodies."""
+
+    def render(self, content):
+        timings = _request_timings.get()
+        if timings is not None and isinstance(content, dict) and "timings" not in content:
+            content = {**content, "timings": timings.as_dict()}
+        return super().render(content)
+
+##################################################################################################################
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Import configured engines, preload models and start job workers on startup; release everything on shutdown."""
+    if PRELOAD_ENGINES:
+        for name in ENABLED_ENGINES:
+            await asyncio.to_thread(load_engine, name)
+    for name in MODEL_PRELOAD:
+        await asyncio.to_thread(model_registry.get, name)
+    evictor = asyncio.create_task(evict_idle_models())
+    workers = [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+    expirer = asyncio.create_task(expire_jobs())
+    yield
+    evictor.cancel()
+    expirer.cancel()
+    for worker in workers:
+        worker.cancel()
+    model_registry.clear()
+    for executor in engine_executors.values():
+        executor.shutdown()
+    if _shard_pool is not None:
+        _shard_pool.shutdown(wait=False, cancel_futures=True)
+    thinker_pool.shutdown(wait=False, cancel_futures=True)
+    await asyncio.to_thread(result_sink.close)  # queued texts are written before the process exits
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+
+##################################################################################################################
+# logs
+
+import logging
+
+log_file = "api_logs.log"
+
+# Create a logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # Change to DEBUG for more logs
+
+# Create handlers
+file_handler = logging.FileHandler(log_file, mode="a")  # Appends logs
+console_handler = logging.StreamHandler()  # Prints to console
+
+# Set formatter
+formatter = logging.Formatter("%(asctime)s [%(filename)s:%(lineno)d] %(levelname)s - %(message)s")
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# Add handlers to the logger (avoid duplicates)
+if not logger.hasHandlers():
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+
+# Example log message
+logger.info("Logging setup complete. Logs will be saved in api_logs.log")
+
+##################################################################################################################
+# helper functions
+# Uploads up to UPLOAD_MEMORY_MB stay in memory and are handed to engines that can read a buffer
+# (PyMuPDF, pdfplumber, pdfminer). Larger ones are already on disk in Starlette's unnamed spool file: on
+# Linux the upload keeps a descriptor of that file open and engines read it by path through a symlink in
+# UPLOAD_DIR to /proc/<pid>/fd/<fd>, so it is never written twice and outlives the request for jobs and
+# streams. Elsewhere it is copied to a unique, private temp file. Small uploads get a path on demand, and
+# the file or link is always removed on close.
+
+UPLOAD_MEMORY_MB = float(os.getenv("UPLOAD_MEMORY_MB", "32"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # defaults to the system temp directory
+BUFFER_ENGINES = {"pymupdf", "pdfplumber", "pdfminer", "tesseract", "doctr", "extract_thinker"}
+
+class SpooledUpload:
+    """An uploaded document held in memory, or in a private temp file when large."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.suffix = Path(filename).suffix
+        self.data = None
+        self._path = None
+        self._spool_fd = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_fileobj(cls, fileobj, filename: str, memory_limit: int):
+        upload = cls(filename)
+        head = fileobj.read(memory_limit + 1)
+        if len(head) <= memory_limit:
+            upload.data = head
+            return upload
+        if upload._link_spool(fileobj):
+            return upload
+        try:
+            with upload._create_temp() as out:
+                out.write(head)
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+        except BaseException:
+            upload.close()
+            raise
+        return upload
+
+    def _link_spool(self, fileobj):
+        """Point a path in UPLOAD_DIR at the temp file behind fileobj (Starlette's spool) instead of copying it."""
+        try:
+            fd = fileobj.fileno()  # rolls a SpooledTemporaryFile still in memory over to disk
+            fileobj.flush()
+        except (AttributeError, OSError, ValueError):
+            return False
+        # the file has no name (O_TMPFILE / unlinked), so its own descriptor is the only way back to it; pool
+        # worker processes run as the same user and may open it through our /proc entry too
+        self._spool_fd = os.dup(fd)
+        target = f"/proc/{os.getpid()}/fd/{self._spool_fd}"
+        path = os.path.join(UPLOAD_DIR or tempfile.gettempdir(), f"pdfhub_{uuid.uuid4().hex}{self.suffix}")
+        try:
+            if not os.path.exists(target):
+                raise OSError(f"{target} does not exist")
+            os.symlink(target, path)
+        except OSError:
+            os.close(self._spool_fd)
+            self._spool_fd = None
+            return False
+        self._path = path
+        return True
+
+    def _create_temp(self):
+        fd, self._path = tempfile.mkstemp(prefix="pdfhub_", suffix=self.suffix, dir=UPLOAD_DIR)  # mode 0600
+        return os.fdopen(fd, "wb")
+
+    @functools.cached_property
+    def size(self):
+        return len(self.data) if self.data is not None else os.path.getsize(self._path)
+
+    @functools.cached_property
+    def sha256(self):
+        """SHA-256 of the upload, read in chunks."""
+        with open_binary(self.source("pymupdf")) as f:
+            return hash_upload(f)
+
+    def read_bytes(self):
+        return self.data if self.data is not None else Path(self._path).read_bytes()
+
+    @property
+    def path(self):
+        """A filesystem path for engines that only read files; small uploads are written out on first use."""
+        with self._lock:
+            if self._path is None:
+                with self._create_temp() as out:
+                    out.write(self.data)
+            return self._path
+
+    def source(self, engine: str):
+        """What to hand an engine: the in-memory bytes when it can read them, otherwise a path."""
+        if self.data is not None and engine in BUFFER_ENGINES:
+            return self.data
+        return self.path
+
+    @functools.cached_property
+    def page_sizes(self):
+        """(width, height) in points of every page of a PDF, read from the page tree only; None for other files."""
+        if self.suffix.lower() != ".pdf":
+            return None
+        try:
+            with open_fitz(self.source("pymupdf")) as doc:
+                return [(box.width, box.height) for box in map(doc.page_cropbox, range(doc.page_count))]
+        except Exception as e:
+            logging.warning(f"Could not read the page sizes of {self.filename}: {e}")
+            return None
+
+    def close(self):
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+                logging.info(f"Temporary file deleted: {self._path}")
+            except FileNotFoundError:
+                pass
+            self._path = None
+        if self._spool_fd is not None:
+            os.close(self._spool_fd)
+            self._spool_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def handle_file_upload(file: UploadFile):
+    """Take an upload into memory or a private temp file; use it as a context manager to clean up."""
+    file.file.seek(0)
+    with stage("upload"):
+        upload = SpooledUpload.from_fileobj(file.file, file.filename, int(UPLOAD_MEMORY_MB * 1024 * 1024))
+    UPLOAD_BYTES.inc(upload.size)
+    logging.info(f"File uploaded: {file.filename} ({upload.size} bytes, {'in memory' if upload.data is not None else 'spooled'})")
+    return upload
+
+def source_name(source):
+    """Printable name of an engine input, which is either a path or in-memory bytes."""
+    return f"<{len(source)} bytes in memory>" if isinstance(source, (bytes, bytearray)) else str(source)
+
+def open_binary(source):
+    """Binary file object for a path or in-memory bytes."""
+    return BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, "rb")
+
+def open_fitz(source):
+    """Open a PyMuPDF document from a path or in-memory bytes."""
+    import fitz  # PyMuPDF
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+##################################################################################################################
+# result sink
+# Keeping extracted text on the server is opt-in: a request passes save=true (RESULT_SINK_SAVE flips the
+# default) and the text goes to the configured sink. RESULT_SINK=none keeps nothing; "local" writes readable
+# <file>_<method>_<hash>.md files to RESULT_SINK_DIR; "cas" stores every distinct text once, under its
+# SHA-256 (objects/<ab>/<sha256>.md), and appends who saved it to index.ndjson. Requests only enqueue the
+# text: a writer thread stores the queue in batches, optionally compressed (RESULT_SINK_COMPRESSION=gzip or
+# zstd), skips texts it already holds and prunes files older than RESULT_SINK_MAX_AGE, then the oldest ones
+# beyond RESULT_SINK_MAX_MB; in cas mode index.ndjson is then rewritten without the entries of pruned objects,
+# so it stays within the same limits. When the queue is full, a save is dropped with a warning rather than slowing
+# requests down.
+
+RESULT_SINK = os.getenv("RESULT_SINK", "local")  # none, local or cas
+RESULT_SINK_DIR = Path(os.getenv("RESULT_SINK_DIR", "results"))
+RESULT_SINK_SAVE = os.getenv("RESULT_SINK_SAVE", "false").lower() in ("1", "true", "yes")  # default of save=
+RESULT_SINK_COMPRESSION = os.getenv("RESULT_SINK_COMPRESSION", "none")  # none, gzip or zstd
+RESULT_SINK_MAX_MB = float(os.getenv("RESULT_SINK_MAX_MB", "1024"))  # 0 = unbounded
+RESULT_SINK_MAX_AGE = float(os.getenv("RESULT_SINK_MAX_AGE", str(30 * 24 * 3600)))  # seconds, 0 = forever
+RESULT_SINK_QUEUE = int(os.getenv("RESULT_SINK_QUEUE", "1024"))  # texts waiting to be written
+RESULT_SINK_BATCH = 64  # texts per write pass
+RESULT_SINK_PRUNE_SECONDS = 60  # minimum interval between retention scans
+SAVE_QUERY = Query(RESULT_SINK_SAVE, description="keep the extracted text in the server's result sink")
+
+class ResultSink:
+    """Stores extracted texts off the request path: requests enqueue, a writer thread writes in batches."""
+
+    SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, kind: str, directory: Path, compression: str, max_mb: float, max_age: float, queue_size: int):
+        if compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+            logging.warning("zstandard is not installed, the result sink compresses with gzip instead")
+            compression = "gzip"
+        self.kind = kind
+        self.directory = directory
+        self.compression = compression
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = max_age
+        self._queue = Queue(maxsize=max(queue_size, 1))
+        self._writer = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self.stored_bytes = None  # as of the last retention scan
+        self.stats = {"queued": 0, "written": 0, "deduplicated": 0, "dropped": 0, "pruned": 0, "bytes_written": 0}
+
+    def _name(self, filename: str, method: str, digest: str):
+        suffix = ".md" + self.SUFFIXES[self.compression]
+        if self.kind == "cas":
+            return f"objects/{digest[:2]}/{digest}{suffix}"
+        stem, method = (re.sub(r"[^\w.-]+", "_", part) for part in (Path(filename).name, method))  # no paths or spaces
+        return f"{stem}_{method}_{digest[:12]}{suffix}"
+
+    def save(self, filename: str, text: str, method: str):
+        """Queue a text for storage; returns the name it is stored under, or None when nothing is kept."""
+        if self.kind == "none":
+            return None
+        with stage("markdown"):
+            data = (text if self.kind == "cas" else f"# Extracted Text ({method})\n\n{text}").encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            name = self._name(filename, method, digest)
+            entry = {"saved_at": time.time(), "filename": filename, "method": method, "sha256": digest, "object": name}
+            try:
+                self._queue.put_nowait((name, data, entry))
+            except Full:
+                self.stats["dropped"] += 1
+                logging.warning(f"Result sink queue is full, not saving {filename} ({method})")
+                return None
+            self.stats["queued"] += 1
+            self._start()
+        return name
+
+    def _start(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="result-sink", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < RESULT_SINK_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                self._write([item for item in batch if item is not None])
+            except Exception as e:
+                logging.error(f"Result sink failed to write {len(batch)} texts: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                return
+
+    def _compress(self, data: bytes):
+        if self.compression == "gzip":
+            import gzip
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return data
+
+    def _write(self, batch: list):
+        index = []
+        for name, data, entry in batch:
+            path = self.directory / name
+            if path.exists():
+                os.utime(path)  # a repeated text counts as recent for retention
+                self.stats["deduplicated"] += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                body = self._compress(data)
+                partial = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+                partial.write_bytes(body)
+                os.replace(partial, path)  # readers never see a half-written file
+                self.stats["written"] += 1
+                self.stats["bytes_written"] += len(body)
+            if self.kind == "cas":
+                index.append(json.dumps(entry))
+        if index:
+            with open(self.directory / "index.ndjson", "a", encoding="utf-8") as f:
+                f.write("\n".join(index) + "\n")
+        if batch and time.time() - self._pruned_at >= RESULT_SINK_PRUNE_SECONDS:
+            self.prune()
+
+    def prune(self):
+        """Delete stored texts past the age limit, then the least recently saved ones beyond the size limit."""
+        self._pruned_at = time.time()
+        pruned = self.stats["pruned"]
+        files = []
+        for path in self.directory.rglob("*.md*") if self.directory.exists() else []:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age and self._pruned_at - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                self.stats["pruned"] += 1
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if not self.max_bytes or total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.stats["pruned"] += 1
+        self.stored_bytes = total
+        if self.kind == "cas" and self.stats["pruned"] > pruned:
+            self._rewrite_index({path.relative_to(self.directory).as_posix() for _, _, path in files if path.exists()})
+
+    def _rewrite_index(self, objects: set):
+        """Keep only the index entries whose object is still stored (and that are within the age limit)."""
+        index = self.directory / "index.ndjson"
+        if not index.exists():
+            return
+        partial = index.with_name(f".index.ndjson.{uuid.uuid4().hex}")
+        with open(index, encoding="utf-8") as f, open(partial, "w", encoding="utf-8") as kept:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("object") in objects and not (self.max_age and self._pruned_at - entry["saved_at"] > self.max_age):
+                    kept.write(line)
+        os.replace(partial, index)
+
+    def flush(self):
+        """Wait until every queued text is written."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def status(self):
+        return {"sink": self.kind, "dir": str(self.directory), "compression": self.compression,
+                "pending": self._queue.qsize(), "stored_bytes": self.stored_bytes, **self.stats}
+
+result_sink = ResultSink(RESULT_SINK, RESULT_SINK_DIR, RESULT_SINK_COMPRESSION, RESULT_SINK_MAX_MB, RESULT_SINK_MAX_AGE,
+                         RESULT_SINK_QUEUE)
+
+##################################################################################################################
+# engine registry
+# Each engine's backend is imported the first time its endpoint is hit, so a node only pays the import
+# cost (torch, transformers, ...) of the engines it actually serves. PDF_HUB_ENGINES (or `--engines`)
+# restricts the engines served by this node and imports them at startup instead.
+
+ENGINE_MODULES = {
+    "pdfplumber": ["pdfplumber"],
+    "tesseract": ["pytesseract", "fitz", "PIL.Image", "numpy"],
+    "pymupdf": ["fitz"],
+    "docling": ["docling.document_converter"],
+    "marker": ["marker.converters.pdf", "marker.converters.table", "marker.models", "marker.output"],
+    "doctr": ["doctr.models", "fitz", "numpy"],
+    "extract_thinker": ["extract_thinker", "fitz"],
+    "pdfminer": ["pdfminer.pdfinterp", "pdfminer.converter", "pdfminer.layout", "pdfminer.pdfpage"],
+    "pptx2md": ["pptx2md"],
+}
+
+def parse_engine_list(value: str):
+    """Parse a comma separated engine list such as "pymupdf,pdfplumber"; empty means every engine."""
+    names = [name.strip().lower() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ENGINE_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown engines {unknown}, expected any of {list(ENGINE_MODULES)}")
+    return names or list(ENGINE_MODULES)
+
+ENABLED_ENGINES = parse_engine_list(os.getenv("PDF_HUB_ENGINES", ""))
+PRELOAD_ENGINES = bool(os.getenv("PDF_HUB_ENGINES"))
+ENGINE_IMPORT_SECONDS = {}  # engine -> seconds spent importing its backend
+_engine_import_lock = threading.Lock()
+
+def load_engine(name: str):
+    """Import an engine's backend modules once and record how long the import took."""
+    if name not in ENGINE_IMPORT_SECONDS:
+        with _engine_import_lock:
+            if name not in ENGINE_IMPORT_SECONDS:
+                start = time.perf_counter()
+                for module in ENGINE_MODULES[name]:
+                    importlib.import_module(module)
+                ENGINE_IMPORT_SECONDS[name] = round(time.perf_counter() - start, 3)
+                logging.info(f"Engine {name} imported in {ENGINE_IMPORT_SECONDS[name]}s")
+    return ENGINE_IMPORT_SECONDS[name]
+
+def require_engine(name: str):
+    """Route dependency that rejects engines this node does not serve and imports the rest on first hit."""
+    async def dependency():
+        if name not in ENABLED_ENGINES:
+            raise HTTPException(status_code=404, detail=f"Engine '{name}' is not enabled on this server")
+        if name not in ENGINE_IMPORT_SECONDS:
+            await asyncio.to_thread(load_engine, name)
+    return Depends(dependency)
+
+def engines_info():
+    return {
+        name: {"enabled": name in ENABLED_ENGINES, "imported": name in ENGINE_IMPORT_SECONDS,
+               "import_seconds": ENGINE_IMPORT_SECONDS.get(name)}
+        for name in ENGINE_MODULES
+    }
+
+##################################################################################################################
+# model registry
+# Marker, Docling and doctr models take seconds to load and hundreds of MB of RAM, so they are
+# loaded once on first use, shared between converters and kept resident until they sit idle.
+
+MODEL_IDLE_TTL = float(os.getenv("MODEL_IDLE_TTL", "1800"))  # seconds unused before eviction, 0 disables
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]
+
+def current_rss_mb():
+    """Return the resident memory of this process in MB."""
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+class ModelRegistry:
+    """Loads heavy models lazily, shares them across requests and evicts them when idle."""
+
+    def __init__(self, idle_ttl: float):
+        self.idle_ttl = idle_ttl
+        self._loaders = {}
+        self._locks = {}
+        self._models = {}
+        self._info = {}
+
+    def register(self, name: str, loader):
+        """Register a zero-argument loader that builds the model named `name`."""
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str):
+        """Return the model, loading it on first use."""
+        with self._locks[name]:
+            if name not in self._models:
+                logging.info(f"Loading model: {name}")
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._info[name] = {
+                    "loaded_at": time.time(),
+                    "load_seconds": round(time.perf_counter() - start, 3),
+                    "rss_mb": round(current_rss_mb() - rss_before, 1),
+                    "uses": 0,
+                }
+                logging.info(f"Model {name} loaded in {self._info[name]['load_seconds']}s (+{self._info[name]['rss_mb']} MB)")
+            info = self._info[name]
+            info["last_used"] = time.time()
+            info["uses"] += 1
+            return self._models[name]
+
+    def evict(self, name: str):
+        """Drop a resident model so its memory can be reclaimed."""
+        with self._locks[name]:
+            if self._models.pop(name, None) is not None:
+                self._info.pop(name, None)
+                gc.collect()
+                logging.info(f"Model evicted: {name}")
+
+    def evict_idle(self):
+        """Evict every model that has not been used for longer than the idle TTL."""
+        if self.idle_ttl <= 0:
+            return
+        now = time.time()
+        for name, info in list(self._info.items()):
+            if now - info["last_used"] > self.idle_ttl:
+                self.evict(name)
+
+    def clear(self):
+        for name in list(self._models):
+            self.evict(name)
+
+    def resident_mb(self):
+        """Memory the resident models took to load, in MB."""
+        return sum(max(info["rss_mb"], 0) for info in list(self._info.values()))
+
+    def status(self):
+        """Describe which models are resident and how much memory they took to load."""
+        now = time.time()
+        models = {}
+        for name in self._loaders:
+            info = self._info.get(name)
+            if info is None:
+                models[name] = {"resident": False}
+            else:
+                models[name] = {
+                    "resident": True,
+                    "load_seconds": info["load_seconds"],
+                    "rss_mb": info["rss_mb"],
+                    "uses": info["uses"],
+                    "idle_seconds": round(now - info["last_used"], 1),
+                }
+        return {"models": models, "process_rss_mb": round(current_rss_mb(), 1), "idle_ttl": self.idle_ttl}
+
+MARKER_TEXT_CONFIG = {"paginate_output": True}  # page separators let iter_pages_marker split the output
+
+def load_marker_models():
+    """Build Marker's artifact dict once and share it between the text and table converters."""
+    from marker.converters.pdf import PdfConverter
+    from marker.converters.table import TableConverter
+    from marker.models import create_model_dict
+    artifact_dict = create_model_dict()
+    return {
+        "artifact_dict": artifact_dict,
+        "text_converter": PdfConverter(artifact_dict=artifact_dict, config=MARKER_TEXT_CONFIG),
+        "table_converter": TableConverter(artifact_dict=artifact_dict),
+    }
+
+def load_docling_converter():
+    from docling.document_converter import DocumentConverter
+    return DocumentConverter()
+
+DOCTR_DPI = int(os.getenv("DOCTR_DPI", "150"))
+DOCTR_BATCH = int(os.getenv("DOCTR_BATCH", "4"))  # pages per detection call
+DOCTR_RECO_BATCH = int(os.getenv("DOCTR_RECO_BATCH", "128"))  # word crops per recognition call
+DOCTR_THREADS = int(os.getenv("DOCTR_THREADS", "0"))  # torch intra-op threads, 0 keeps torch's default
+
+def load_doctr_predictor():
+    import torch
+    from doctr.models import ocr_predictor
+    if DOCTR_THREADS:
+        torch.set_num_threads(DOCTR_THREADS)
+    return ocr_predictor(pretrained=True, det_bs=DOCTR_BATCH, reco_bs=DOCTR_RECO_BATCH)
+
+model_registry = ModelRegistry(MODEL_IDLE_TTL)
+model_registry.register("marker", load_marker_models)
+model_registry.register("docling", load_docling_converter)
+model_registry.register("doctr", load_doctr_predictor)
+
+async def evict_idle_models():
+    """Background task that periodically evicts idle models."""
+    while True:
+        await asyncio.sleep(min(60, MODEL_IDLE_TTL) if MODEL_IDLE_TTL > 0 else 60)
+        await asyncio.to_thread(model_registry.evict_idle)
+
+##################################################################################################################
+# execution layer
+# Extraction is blocking and CPU bound, so it never runs on the event loop. Each engine has a profile that
+# picks a thread pool (C extensions, subprocesses and resident torch models release the GIL) or a process
+# pool (pure-Python parsers), a concurrency cap and a queue limit. A saturated engine answers 429 with
+# Retry-After instead of piling up work, while other engines keep flowing. Process pools are replaced after
+# WORKER_MAX_TASKS calls, or as soon as one of their workers grows past WORKER_MAX_RSS_MB, so memory leaked
+# by a parser is returned to the system; calls already running finish in the old workers.
+
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "500"))  # calls per process pool, 0 = never recycle
+WORKER_MAX_RSS_MB = float(os.getenv("WORKER_MAX_RSS_MB", "1024"))  # per pool worker, 0 = no limit
+
+@dataclass
+class EngineProfile:
+    pool: str  # "thread" or "process"
+    max_concurrency: int
+    max_queue: int
+
+ENGINE_PROFILES = {
+    "pymupdf": EngineProfile("thread", 8, 64),
+    "pdfplumber": EngineProfile("process", 4, 32),
+    "pdfminer": EngineProfile("process", 4, 32),
+    "tesseract": EngineProfile("thread", 2, 16),
+    "docling": EngineProfile("thread", 1, 8),
+    "marker": EngineProfile("thread", 1, 4),
+    "doctr": EngineProfile("thread", 1, 8),
+    "extract_thinker": EngineProfile("thread", 4, 32),
+    "pptx2md": EngineProfile("thread", 2, 16),
+}
+
+def apply_engine_limits(value: str):
+    """Override profiles from a string such as "tesseract=4:32,marker=1:2" (concurrency:queue)."""
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, limits = item.split("=")
+        concurrency, _, queue = limits.partition(":")
+        profile = ENGINE_PROFILES[name.strip()]
+        profile.max_concurrency = int(concurrency)
+        if queue:
+            profile.max_queue = int(queue)
+
+apply_engine_limits(os.getenv("PDF_HUB_LIMITS", ""))
+
+class EngineExecutor:
+    """Runs one engine's blocking calls on its own pool, bounded by its concurrency cap and queue limit."""
+
+    def __init__(self, name: str, profile: EngineProfile):
+        self.name = name
+        self.profile = profile
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 1.0
+        self.pool_calls = 0
+        self.recycled = 0
+        self._slots = asyncio.Semaphore(profile.max_concurrency)
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            if self.profile.pool == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.profile.max_concurrency)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.profile.max_concurrency, thread_name_prefix=f"engine-{self.name}")
+        return self._pool
+
+    def retry_after(self):
+        """Estimate how many seconds until a slot frees up, from the average call duration."""
+        backlog = (self.waiting + 1) / self.profile.max_concurrency
+        return max(1, round(self.avg_seconds * backlog))
+
+    async def _acquire(self):
+        if self._slots.locked() and self.waiting >= self.profile.max_queue:
+            logging.warning(f"Engine {self.name} saturated: {self.in_flight} running, {self.waiting} queued")
+            raise HTTPException(status_code=429, detail=f"Engine '{self.name}' is busy, retry later",
+                                headers={"Retry-After": str(self.retry_after())})
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    async def _acquire_timed(self):
+        wait_start = time.perf_counter()
+        await self._acquire()
+        start = time.perf_counter()
+        ENGINE_QUEUE_SECONDS.observe(start - wait_start, engine=self.name)
+        record_stage("queue", start - wait_start)
+        return start
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the engine's slots while the caller drives the work on another pool."""
+        start = await self._acquire_timed()
+        failed = True
+        try:
+            with stage("engine"):
+                yield
+            failed = False
+        finally:
+            self._release(start, failed)
+
+    async def run(self, fn, *args, **kwargs):
+        start = await self._acquire_timed()
+        loop = asyncio.get_running_loop()
+        if self.profile.pool == "process" and _page_cache_mode.get() != "use":
+            fn, args = call_with_page_cache, (_page_cache_mode.get(), fn, *args)
+        profile = _request_profile.get()
+        if profile is not None:
+            fn, args = profiled_call, (profile.artifact_path(self.name), profile.format, fn, *args)
+        with stage("engine"):
+            try:
+                if self.profile.pool == "thread":
+                    # carry the request's stage timings and trace context into the worker thread
+                    future = self.pool().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+                else:
+                    future = self.pool().submit(fn, *args, **kwargs)
+            except BaseException as error:
+                # a pool shut down by recycling or teardown refuses new work with RuntimeError
+                self._release(start, True)
+                if isinstance(error, BrokenProcessPool):
+                    self._pool_broken()
+                raise
+            # The slot stays taken until the call really finishes, even when the awaiting request
+            # times out or disconnects, so the concurrency cap holds for abandoned work too.
+            future.add_done_callback(lambda done: loop.call_soon_threadsafe(
+                self._release, start, done.cancelled() or done.exception() is not None))
+            try:
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                self._pool_broken()
+
+    def _release(self, start: float, failed: bool = False):
+        seconds = time.perf_counter() - start
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+        self.in_flight -= 1
+        self._slots.release()
+        ENGINE_SECONDS.observe(seconds, engine=self.name)
+        ENGINE_CALLS.inc(engine=self.name, outcome="error" if failed else "ok")
+        if self.profile.pool == "process" and self._pool is not None:
+            self.pool_calls += 1
+            self._recycle_if_needed()
+
+    def worker_rss_mb(self):
+        """Resident memory of the pool's live worker processes, in MB."""
+        rss = []
+        for process in list((getattr(self._pool, "_processes", None) or {}).values()):
+            try:
+                rss.append(psutil.Process(process.pid).memory_info().rss / (1024 * 1024))
+            except (psutil.Error, ValueError):
+                pass
+        return rss
+
+    def _recycle_if_needed(self):
+        reason = None
+        if WORKER_MAX_TASKS and self.pool_calls >= WORKER_MAX_TASKS:
+            reason = f"{self.pool_calls} calls"
+        elif WORKER_MAX_RSS_MB and max(self.worker_rss_mb(), default=0) > WORKER_MAX_RSS_MB:
+            reason = f"a worker above {WORKER_MAX_RSS_MB:.0f} MB"
+        if reason is not None:
+            self.recycle(reason)
+
+    def recycle(self, reason: str):
+        """Start fresh worker processes on the next call; a thread pool has no memory of its own to give back."""
+        if self.profile.pool != "process" or self._pool is None:
+            return
+        logging.info(f"Recycling the {self.name} process pool after {reason}")
+        self._pool.shutdown(wait=False)  # running calls finish, then the old workers exit
+        self._pool = None
+        self.pool_calls = 0
+        self.recycled += 1
+        WORKER_RECYCLES.inc(engine=self.name)
+
+    def _pool_broken(self):
+        logging.error(f"Process pool for engine {self.name} died, recreating it")
+        self._pool = None
+        raise HTTPException(status_code=503, detail=f"Engine '{self.name}' worker crashed, retry later",
+                            headers={"Retry-After": str(self.retry_after())})
+
+    def status(self):
+        status = {"pool": self.profile.pool, "max_concurrency": self.profile.max_concurrency,
+                  "max_queue": self.profile.max_queue, "in_flight": self.in_flight, "queued": self.waiting}
+        if self.profile.pool == "process":
+            status.update(pool_calls=self.pool_calls, recycled=self.recycled,
+                          worker_rss_mb=[round(rss, 1) for rss in self.worker_rss_mb()])
+        return status
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+engine_executors = {name: EngineExecutor(name, profile) for name, profile in ENGINE_PROFILES.items()}
+
+async def run_engine(engine: str, fn, *args, **kwargs):
+    """Run a blocking extraction function on the engine's executor."""
+    with checkpointing():
+        return await engine_executors[engine].run(fn, *args, **kwargs)
+
+##################################################################################################################
+# result cache
+# Extraction results are content addressed: the key is the SHA-256 of the uploaded bytes plus the engine,
+# its installed version, the extraction function and its parameters. Lookups go memory (LRU bounded by
+# size) -> disk -> Redis, and a hit is answered before the upload is ever written to a temp file.
+
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "256"))  # in-process LRU size, 0 disables
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")  # on-disk tier, disabled when empty
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "4096"))
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", "")  # Redis tier, disabled when empty
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))  # Redis expiry in seconds
+
+ENGINE_DISTRIBUTIONS = {
+    "pdfplumber": "pdfplumber",
+    "tesseract": "pytesseract",
+    "pymupdf": "PyMuPDF",
+    "docling": "docling",
+    "marker": "marker-pdf",
+    "doctr": "python-doctr",
+    "extract_thinker": "extract-thinker",
+    "pdfminer": "pdfminer.six",
+    "pptx2md": "pptx2md",
+}
+
+@functools.lru_cache(maxsize=None)
+def engine_version(engine: str):
+    try:
+        return importlib.metadata.version(ENGINE_DISTRIBUTIONS[engine])
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+def hash_upload(fileobj):
+    """SHA-256 of an upload read in chunks; the file position is rewound afterwards."""
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+def result_cache_key(digest: str, engine: str, fn, params=None):
+    key = [digest, engine, engine_version(engine), fn.__name__, params or {}]
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+class ResultCache:
+    """Three-tier (memory LRU, disk, Redis) cache of JSON-serializable extraction results."""
+
+    def __init__(self, max_memory_mb: float, disk_dir: str = "", max_disk_mb: float = 0, redis_client=None, ttl: int = 0):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.redis = redis_client
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_stores = 0
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "redis_hits": 0, "misses": 0,
+                      "stores": 0, "memory_evictions": 0, "disk_evictions": 0, "disk_errors": 0, "redis_errors": 0}
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: str):
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, payload: bytes):
+        if len(payload) > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            self._memory[key] = payload
+            self._memory_bytes += len(payload)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.stats["memory_evictions"] += 1
+
+    def get(self, key: str):
+        """Return the cached result or None, promoting lower-tier hits into the upper tiers."""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return json.loads(payload)
+        tier = None
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                payload = path.read_bytes()
+                os.utime(path)  # keeps recently used entries last in line for disk eviction
+                tier = "disk"
+            except FileNotFoundError:
+                pass
+        if payload is None and self.redis is not None:
+            try:
+                payload = self.redis.get(f"pdfhub:result:{key}")
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logging.warning(f"Redis cache lookup failed: {e}")
+            if payload is not None:
+                tier = "redis"
+                self._store_disk(key, payload)
+        if payload is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats[f"{tier}_hits"] += 1
+        self._remember(key, payload)
+        return json.loads(payload)
+
+    def put(self, key: str, value):
+        payload = json.dumps(value).encode("utf-8")
+        self.stats["stores"] += 1
+        self._remember(key, payload)
+        try:
+            self._store_disk(key, payload)
+        except OSError as e:
+            self.stats["disk_errors"] += 1
+            logging.warning(f"Disk cache store failed: {e}")
+        if self.redis is not None:
+            try:
+                self.redis.set(f"pdfhub:result:{key}", payload, ex=self.ttl or None)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logging.warning(f"Redis cache store failed: {e}")
+
+    def _store_disk(self, key: str, payload: bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(exist_ok=True)
+        # pid too: the main threads of forked pool workers share one thread ident
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)  # atomic, readers never see a partial entry
+        self._disk_stores += 1
+        if self._disk_stores % 100 == 0:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete the least recently used disk entries until the tier fits its size limit."""
+        entries = []
+        for entry in self.disk_dir.glob("*/*.json"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # evicted by another worker process sharing the directory
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            self.stats["disk_evictions"] += 1
+
+    def status(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                "memory_entries": len(self._memory), "memory_mb": round(self._memory_bytes / (1024 * 1024), 2),
+                "disk": str(self.disk_dir) if self.disk_dir else None, "redis": self.redis is not None}
+
+def connect_redis(url: str):
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url)
+
+result_cache = ResultCache(RESULT_CACHE_MB, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MB, connect_redis(RESULT_CACHE_REDIS_URL), RESULT_CACHE_TTL)
+
+async def cache_mode(cache: str = Query("use", pattern="^(use|bypass|refresh)$",
+                                        description="use: read and write the cache, bypass: ignore it, refresh: recompute and overwrite")):
+    _page_cache_mode.set(cache)  # async, so it is set in the request's own context and reaches the engine threads
+    return cache
+
+async def run_cached(file: UploadFile, engine: str, fn, *args, params=None, cache: str = "use", runner=None,
+                     page_numbers=None):
+    """Return fn(source, *args) for an upload, answering from the result cache when possible.
+
+    `runner` is an async alternative to running fn on the engine's executor (e.g. page sharding) that gets
+    the upload's path; it must produce the same result as fn, since both share the cache entry.
+    A page selection is passed to fn as `page_numbers=` and becomes part of the cache key.
+    """
+    key = digest = None
+    kwargs = {} if page_numbers is None else {"page_numbers": page_numbers}
+    if cache != "bypass":
+        digest = await asyncio.to_thread(hash_upload, file.file)
+        key = result_cache_key(digest, engine, fn, with_pages(params, page_numbers))
+        if cache == "use":
+            cached = await asyncio.to_thread(result_cache.get, key)
+            if cached is not None:
+                logging.info(f"Result cache hit for {file.filename} ({engine})")
+                return cached
+    with await asyncio.to_thread(handle_file_upload, file) as upload:
+        async with admission.admit(engine, upload, page_numbers, dpi=(params or {}).get("dpi")):
+            if runner is not None:
+                result = await runner(upload.path)
+            else:
+                with known_digest(upload.source(engine), digest) as source:
+                    result = await run_engine(engine, fn, source, *args, **kwargs)
+        await observe_pages(engine, upload, page_numbers)
+    # engine failures propagate above, so only a call that completed cleanly is ever stored
+    if key is not None and result:
+        await asyncio.to_thread(result_cache.put, key, result)
+    return result
+
+@app.get("/cache")
+async def cache_status():
+    return {**result_cache.status(), "pages": page_cache.status(), "sink": result_sink.status()}
+
+@app.get("/engines")
+async def engines_status():
+    engines = engines_info()
+    for name, executor in engine_executors.items():
+        engines[name]["executor"] = executor.status()
+    return {"engines": engines, **model_registry.status(), "admission": admission.status()}
+
+##################################################################################################################
+# page-sharded extraction
+# Text-layer engines walk pages serially on one core. For long documents the page range is split into
+# contiguous shards that run on a process pool; every worker opens the document itself from its path,
+# so no page objects are pickled, and the shards are merged back in page order. Short documents stay
+# on the engine's own executor, where process start-up and re-opening the file would cost more.
+
+SHARD_MIN_PAGES = int(os.getenv("SHARD_MIN_PAGES", "64"))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+SHARDED_QUERY = Query(False, description="split long documents into page shards extracted in parallel")
+
+_shard_pool = None
+
+def shard_pool():
+    global _shard_pool
+    if _shard_pool is None:
+        _shard_pool = ProcessPoolExecutor(max_workers=SHARD_WORKERS)
+    return _shard_pool
+
+def count_pages(source):
+    with open_fitz(source) as doc:
+        return doc.page_count
+
+def plan_shards(page_count: int, workers: int):
+    """Split [0, page_count) into contiguous ranges, about two per worker so stragglers even out."""
+    size = max(1, -(-page_count // (workers * 2)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+async def extract_pages_sharded(engine: str, pdf_path: str, min_pages: int = None):
+    """Per-page texts of a document, extracted in parallel page shards when it is long enough."""
+    fn = functools.partial(call_with_page_cache, _page_cache_mode.get(), page_texts, PAGE_ITERATORS[engine])
+    min_pages = SHARD_MIN_PAGES if min_pages is None else min_pages
+    page_count = await asyncio.to_thread(count_pages, pdf_path)
+    if page_count < min_pages or SHARD_WORKERS <= 1:
+        return await run_engine(engine, fn, pdf_path)
+    shards = plan_shards(page_count, SHARD_WORKERS)
+    logging.info(f"Extracting {page_count} pages of {pdf_path} with {engine} in {len(shards)} shards")
+    # the whole sharded job counts as one request against the engine's concurrency cap
+    async with engine_executors[engine].slot():
+        futures = [shard_pool().submit(fn, pdf_path, range(start, end)) for start, end in shards]
+        try:
+            chunks = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        finally:
+            for future in futures:
+                future.cancel()
+    return [text for chunk in chunks for text in chunk]
+
+async def extract_text_sharded(engine: str, pdf_path: str):
+    """Sharded equivalent of extract_text_pymupdf / extract_text_pdfplumber, same output."""
+    texts = await extract_pages_sharded(engine, pdf_path)
+    if engine == "pdfplumber":
+        texts = [text for text in texts if text]
+    return "\n".join(texts).strip()
+
+async def extract_pdfminer_sharded(pdf_path: str, per_page: bool):
+    """Sharded equivalent of convert_pdf_to_txt_pages (per_page) or convert_pdf_to_txt_file."""
+    texts = await extract_pages_sharded("pdfminer", pdf_path)
+    return (texts if per_page else "".join(texts)), len(texts)
+
+##################################################################################################################
+# page iterators and page selection
+# Every PDF engine has a generator `iter_pages_<engine>(source, page_numbers=None)` that yields
+# (page number, text) for the selected 0-based pages in order, and parses no other page. The whole-document
+# functions, page shards, job chunks and streaming are built on these iterators, and the endpoints accept
+# `pages=1-5,20` and/or `max_pages=N` for cheap previews and targeted re-extraction.
+
+MAX_SELECTED_PAGES = int(os.getenv("MAX_SELECTED_PAGES", "100000"))
+PAGES_PATTERN = r"^\s*\d+\s*(-\s*\d+\s*)?(,\s*\d+\s*(-\s*\d+\s*)?)*$"
+
+def parse_page_selection(pages: str = None, max_pages: int = None):
+    """Sorted 0-based page numbers for `pages` (1-based, "1-5,20") and `max_pages`, or None for every page."""
+    if pages is None:
+        return None if max_pages is None else list(range(max_pages))
+    numbers = set()
+    for part in pages.split(","):
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range '{part.strip()}'")
+        if len(numbers) + last - first + 1 > MAX_SELECTED_PAGES:
+            raise ValueError(f"At most {MAX_SELECTED_PAGES} pages can be selected")
+        numbers.update(range(first - 1, last))
+    return sorted(numbers)[:max_pages]
+
+def page_selection(pages: str = Query(None, pattern=PAGES_PATTERN, description="1-based pages to extract, e.g. 1-5,20"),
+                   max_pages: int = Query(None, ge=1, le=MAX_SELECTED_PAGES, description="extract at most this many pages")):
+    try:
+        return parse_page_selection(pages, max_pages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def with_pages(params, page_numbers):
+    """Cache parameters for a page selection; whole documents keep their parameters (and cache entries)."""
+    return params if page_numbers is None else {**(params or {}), "pages": page_numbers}
+
+def selected_pages(page_numbers, page_count: int):
+    """The selected 0-based page numbers that exist in a document of page_count pages."""
+    return range(page_count) if page_numbers is None else [number for number in page_numbers if number < page_count]
+
+def page_runs(page_numbers):
+    """Group sorted 0-based page numbers into 1-based (first, last) runs of consecutive pages."""
+    runs = []
+    for number in page_numbers:
+        if runs and runs[-1][1] == number:
+            runs[-1][1] = number + 1
+        else:
+            runs.append([number + 1, number + 1])
+    return [tuple(run) for run in runs]
+
+def page_texts(iterator, source, page_numbers=None):
+    """Texts of the selected pages from a page iterator, in page order; known pages come from the page cache."""
+    return [text for _, text, _ in iter_cached_pages(iterator, source, page_numbers)]
+
+##################################################################################################################
+# page cache: per-page output shared across documents
+# Contracts and invoices repeat the same cover and terms pages across thousands of files. Each page is
+# fingerprinted by its content, independently of the file it sits in: SHA-256 of its content streams, its
+# boxes and rotation, and everything its resources reference (fonts, images; object numbers replaced by
+# the referenced objects' own digests). Scanned pages are therefore keyed by their image bytes. The
+# engines whose page output only depends on the page store it under fingerprint + engine + version +
+# parameters, and a later document only runs the engine on its novel pages. Lookups are exact, so
+# documents come out identical with the cache on or off; pages with annotations or form fields are never
+# cached. pdfplumber and pdfminer run in worker processes with a memory tier each, so PAGE_CACHE_DIR is
+# what lets them share pages. `cache=bypass` skips the page cache too, and `cache=refresh` overwrites it.
+
+PAGE_CACHE_MB = float(os.getenv("PAGE_CACHE_MB", "64"))  # in-process LRU size, 0 disables
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "")  # on-disk tier, shared by worker processes, disabled when empty
+PAGE_CACHE_DISK_MB = float(os.getenv("PAGE_CACHE_DISK_MB", "1024"))
+# PyMuPDF extracts a page faster than it is fingerprinted, so it is left out unless listed here
+PAGE_CACHE_ENGINES = parse_engine_list(os.getenv("PAGE_CACHE_ENGINES", "pdfplumber,pdfminer,tesseract,doctr"))
+
+PAGE_CACHE_ITERATORS = {  # page iterator -> engine, for the engines whose page output depends on the page alone
+    "iter_pages_pymupdf": "pymupdf",
+    "iter_pages_pdfplumber": "pdfplumber",
+    "iter_pages_pdfminer": "pdfminer",
+    "iter_pages_tesseract": "tesseract",
+    "iter_ocr_results": "tesseract",
+    "iter_pages_doctr": "doctr",
+}
+PDF_REFERENCE = re.compile(r"\b(\d+) (\d+) R\b")
+
+page_cache = ResultCache(PAGE_CACHE_MB, PAGE_CACHE_DIR, PAGE_CACHE_DISK_MB)
+_page_cache_mode = contextvars.ContextVar("page_cache_mode", default="use")
+
+def resolve_references(doc, source: str, memo: dict):
+    """PDF object source with every indirect reference replaced by the referenced object's digest."""
+    return PDF_REFERENCE.sub(lambda match: object_digest(doc, int(match.group(1)), memo), source)
+
+def object_digest(doc, xref: int, memo: dict):
+    """SHA-256 of a PDF object and everything it references, whatever the objects are numbered in this file."""
+    if xref not in memo:
+        memo[xref] = "cycle"
+        digest = hashlib.sha256(resolve_references(doc, doc.xref_object(xref, compressed=True), memo).encode())
+        if doc.xref_is_stream(xref):
+            digest.update(doc.xref_stream_raw(xref))
+        memo[xref] = digest.hexdigest()
+    return memo[xref]
+
+def page_resources(doc, xref: int):
+    """The page's /Resources entry as (type, value), inherited from the page tree when the page has none."""
+    kind, value = doc.xref_get_key(xref, "Resources")
+    while kind == "null":
+        parent_kind, parent = doc.xref_get_key(xref, "Parent")
+        if parent_kind != "xref":
+            break
+        xref = int(parent.split()[0])
+        kind, value = doc.xref_get_key(xref, "Resources")
+    return kind, value
+
+def page_fingerprint(doc, page, memo: dict):
+    """Content fingerprint of a PyMuPDF page, or None for pages with annotations or form fields."""
+    if page.first_annot is not None or page.first_widget is not None:
+        return None
+    kind, resources = page_resources(doc, page.xref)
+    digest = hashlib.sha256(page.read_contents())
+    digest.update(f"{tuple(page.mediabox)} {tuple(page.cropbox)} {page.rotation}".encode())
+    digest.update(resolve_references(doc, resources, memo).encode() if kind in ("xref", "dict", "array") else b"")
+    return digest.hexdigest()
+
+def page_fingerprints(source, page_numbers=None):
+    """{0-based page number: fingerprint or None} for the selected pages that exist."""
+    memo = {}
+    with open_fitz(source) as doc:
+        return {number: page_fingerprint(doc, doc[number], memo) for number in selected_pages(page_numbers, doc.page_count)}
+
+def page_cache_params(iterator):
+    """Keyword arguments an iterator (or a partial of one) runs with, defaults included."""
+    fn = iterator.func if isinstance(iterator, functools.partial) else iterator
+    params = {name: parameter.default for name, parameter in inspect.signature(fn).parameters.items()
+              if parameter.default is not inspect.Parameter.empty and name != "page_numbers"}
+    return {**params, **(iterator.keywords if isinstance(iterator, functools.partial) else {})}
+
+def iter_cached_pages(iterator, source, page_numbers=None):
+    """Yield (page number, value, cached) for iterator(source, page_numbers), running it only on unknown pages."""
+    fn = iterator.func if isinstance(iterator, functools.partial) else iterator
+    engine = PAGE_CACHE_ITERATORS.get(fn.__name__)
+    mode = _page_cache_mode.get()
+    fingerprints = None
+    if engine in PAGE_CACHE_ENGINES and mode != "bypass" and (PAGE_CACHE_MB > 0 or PAGE_CACHE_DIR):
+        try:
+            with stage("fingerprint"):
+                fingerprints = page_fingerprints(source, page_numbers)
+        except Exception as e:
+            logging.warning(f"Page fingerprinting failed for {source_name(source)}, extracting every page: {e}")
+    if fingerprints is None:
+        for number, value in iter_checkpointed_pages(iterator, source, page_numbers):
+            yield number, value, False
+        return
+    params = page_cache_params(iterator)
+    keys = {number: fingerprint and result_cache_key(fingerprint, engine, fn, params) for number, fingerprint in fingerprints.items()}
+    stored = {}
+    if mode == "use":
+        for number, key in keys.items():
+            value = page_cache.get(key) if key else None
+            if value is not None:
+                stored[number] = value
+    computed = iter_checkpointed_pages(iterator, source, [number for number in keys if number not in stored])
+    try:
+        for number, key in keys.items():
+            if number in stored:
+                yield number + 1, stored[number], True
+                continue
+            page, value = next(computed)
+            if key:
+                try:
+                    page_cache.put(key, value)
+                except Exception as e:  # the page was extracted; a failed store only costs a later hit
+                    logging.warning(f"Page cache store failed for page {page} of {source_name(source)}: {e}")
+            yield page, value, False
+    finally:
+        computed.close()
+
+def call_with_page_cache(mode: str, fn, *args, **kwargs):
+    """Run fn with a page cache mode, in a worker process where the request's context does not reach."""
+    _page_cache_mode.set(mode)
+    return fn(*args, **kwargs)
+
+##################################################################################################################
+# checkpoints: resumable extraction of very large documents
+# A 3,000-page OCR run that dies at page 2,900 (worker OOM, pod eviction) should not start over. For
+# documents of at least CHECKPOINT_MIN_PAGES pages, the checkpointed engines append each page to an NDJSON
+# file in CHECKPOINT_DIR as soon as it is extracted, keyed by the document's SHA-256, the engine, its version
+# and parameters. Marker and Docling convert pages in one pass, so they are run in chunks of
+# CHECKPOINT_CHUNK_PAGES and checkpointed per chunk. A retry of the same document reads the finished pages
+# back and resumes at the first missing one. Once the request or job that wrote a checkpoint succeeds, its
+# result holds every page and the checkpoint is deleted; abandoned ones expire after CHECKPOINT_TTL.
+# GET /checkpoints?document=<sha256> shows how many pages are done. Mount a volume at CHECKPOINT_DIR to
+# survive pod restarts.
+
+CHECKPOINT_DIR = Path(os.getenv("CHECKPOINT_DIR") or Path(tempfile.gettempdir()) / "pdfhub_checkpoints")
+CHECKPOINT_ENGINES = parse_engine_list(os.getenv("CHECKPOINT_ENGINES", "tesseract,doctr,marker,docling"))
+CHECKPOINT_MIN_PAGES = int(os.getenv("CHECKPOINT_MIN_PAGES", "32"))  # shorter documents are not checkpointed
+CHECKPOINT_CHUNK_PAGES = int(os.getenv("CHECKPOINT_CHUNK_PAGES", "16"))  # pages per Marker / Docling call
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(7 * 24 * 3600)))  # seconds an unfinished checkpoint is kept
+
+CHECKPOINT_ITERATORS = {**PAGE_CACHE_ITERATORS, "iter_pages_marker": "marker", "iter_pages_docling": "docling"}
+CHECKPOINT_CHUNKED = {"marker", "docling"}
+
+_checkpoint_keys = contextvars.ContextVar("checkpoint_keys", default=None)
+_known_digest = contextvars.ContextVar("known_digest", default=None)  # (engine input, SHA-256 of its bytes)
+
+class Checkpoint:
+    """Append-only record of the pages of one document extracted so far."""
+
+    def __init__(self, path: Path, header: dict):
+        self.path = path
+        self.values = {}  # 0-based page number -> value
+        self.done = set()
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short when the last run died
+                    if "page" in entry:
+                        self.values[entry["page"]] = entry["value"]
+                        self.done.add(entry["page"])
+                    self.done.update(entry.get("done", []))
+        self._file = open(path, "a", encoding="utf-8")
+        if not self._file.tell():
+            self._write(header)
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()  # on disk for the next attempt even if this process is killed right after
+
+    def add(self, number: int, value):
+        self.values[number] = value
+        self.done.add(number)
+        self._write({"page": number, "value": value})
+
+    def mark_done(self, numbers: list):
+        """Record pages that were converted without producing output of their own."""
+        numbers = [number for number in numbers if number not in self.done]
+        if numbers:
+            self.done.update(numbers)
+            self._write({"done": numbers})
+
+    def close(self):
+        self._file.close()
+
+class CheckpointStore:
+    """Checkpoint files in a local directory, one per document, engine and parameters."""
+
+    def __init__(self, directory: Path, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.stats = {"opened": 0, "resumed": 0, "pages_resumed": 0, "completed": 0, "expired": 0}
+
+    def _path(self, key: str):
+        return self.directory / f"{key}.ndjson"
+
+    def open(self, key: str, header: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prune()
+        checkpoint = Checkpoint(self._path(key), {**header, "key": key, "created_at": time.time()})
+        self.stats["opened"] += 1
+        if checkpoint.done:
+            self.stats["resumed"] += 1
+            self.stats["pages_resumed"] += len(checkpoint.done)
+            logging.info(f"Resuming {header['engine']} on document {header['document'][:12]} at "
+                         f"{len(checkpoint.done)}/{header['page_count']} pages")
+        return checkpoint
+
+    def discard(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+        self.stats["completed"] += 1
+
+    def prune(self):
+        """Delete checkpoints that have not been written to for longer than the TTL."""
+        for path in self.directory.glob("*.ndjson"):
+            try:
+                if time.time() - path.stat().st_mtime > self.ttl:
+                    path.unlink()
+                    self.stats["expired"] += 1
+            except FileNotFoundError:
+                pass
+
+    def list(self, document: str = None):
+        checkpoints = []
+        for path in sorted(self.directory.glob("*.ndjson")) if self.directory.exists() else []:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    header = json.loads(f.readline())
+                    if document and header.get("document") != document:
+                        continue
+                    done = set()
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        done.update([entry["page"]] if "page" in entry else entry.get("done", []))
+                updated_at = path.stat().st_mtime
+            except (FileNotFoundError, ValueError):
+                continue
+            checkpoints.append({**header, "pages_done": len(done), "updated_at": updated_at})
+        return checkpoints
+
+    def status(self):
+        return {**self.stats, "dir": str(self.directory)}
+
+checkpoint_store = CheckpointStore(CHECKPOINT_DIR, CHECKPOINT_TTL)
+
+@contextmanager
+def checkpointing():
+    """Delete the checkpoints completed inside the block once the whole block succeeds (outer blocks win)."""
+    if _checkpoint_keys.get() is not None:
+        yield
+        return
+    keys = set()
+    token = _checkpoint_keys.set(keys)
+    try:
+        yield
+    finally:
+        _checkpoint_keys.reset(token)
+    for key in keys:
+        checkpoint_store.discard(key)
+
+@contextmanager
+def known_digest(source, digest: str = None):
+    """Let checkpoints of `source` use the SHA-256 the request already computed instead of hashing the document again."""
+    token = _known_digest.set(None if digest is None else (source, digest))
+    try:
+        yield source
+    finally:
+        _known_digest.reset(token)
+
+def document_digest(source):
+    known = _known_digest.get()
+    if known is not None and known[0] is source:
+        return known[1]
+    with stage("checkpoint"), open_binary(source) as f:
+        return hash_upload(f)
+
+def iter_checkpointed_pages(iterator, source, page_numbers=None):
+    """Yield (page number, value) like iterator(source, page_numbers), recording every page in a checkpoint.
+
+    Pages are yielded in order as soon as they are recorded, so one failing page never holds back the pages before it.
+    """
+    fn = iterator.func if isinstance(iterator, functools.partial) else iterator
+    engine = CHECKPOINT_ITERATORS.get(fn.__name__)
+    page_count = 0
+    if engine in CHECKPOINT_ENGINES:
+        try:
+            page_count = count_pages(source)
+        except Exception:
+            pass  # not a PDF (Docling formats without pages), nothing to resume
+    if page_count < max(CHECKPOINT_MIN_PAGES, 1):
+        yield from iterator(source, page_numbers)
+        return
+    document = document_digest(source)
+    key = result_cache_key(document, engine, fn, page_cache_params(iterator))
+    checkpoint = checkpoint_store.open(key, {"document": document, "engine": engine, "page_count": page_count})
+    try:
+        numbers = deque(selected_pages(page_numbers, page_count))
+        pending = [number for number in numbers if number not in checkpoint.done]
+        size = CHECKPOINT_CHUNK_PAGES if engine in CHECKPOINT_CHUNKED else max(len(pending), 1)
+
+        def finished():
+            while numbers and numbers[0] in checkpoint.done:
+                number = numbers.popleft()
+                if number in checkpoint.values:  # done pages without output of their own are skipped
+                    yield number + 1, checkpoint.values[number]
+
+        yield from finished()
+        for start in range(0, len(pending), size):
+            chunk = pending[start:start + size]
+            for page, value in iterator(source, chunk):
+                checkpoint.add(page - 1, value)
+                yield from finished()
+            checkpoint.mark_done(chunk)
+            yield from finished()
+    finally:
+        checkpoint.close()
+    keys = _checkpoint_keys.get()
+    if keys is None:
+        checkpoint_store.discard(key)
+    else:
+        keys.add(key)
+
+@app.get("/checkpoints")
+async def checkpoints_status(document: str = Query(None, pattern="^[0-9a-f]{64}$", description="SHA-256 of the document")):
+    return {**checkpoint_store.status(), "checkpoints": await asyncio.to_thread(checkpoint_store.list, document)}
+
+##################################################################################################################
+# streaming: `stream=true` returns pages as they are extracted
+# A page iterator runs on a worker thread while it holds one of the engine's slots, and pushes pages through
+# a small bounded queue. The response sends each page as an NDJSON line or a Server-Sent Event, so the first
+# page arrives right away and the server never holds more than STREAM_BUFFER_PAGES pages. Streamed
+# responses bypass the result cache and are not saved as markdown.
+
+STREAM_BUFFER_PAGES = int(os.getenv("STREAM_BUFFER_PAGES", "4"))
+
+def stream_mode(stream: bool = Query(False, description="send pages as they are extracted"),
+                stream_format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="ndjson or sse (Server-Sent Events)")):
+    return stream_format if stream else None
+
+def format_stream_event(fmt: str, event: str, data: dict):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+async def iter_stream_pages(engine: str, iterator, *args):
+    """Run a page iterator on a worker thread under one of the engine's slots.
+
+    Yields lists of (page, text, seconds) with every page that is ready, so a fast engine is not held back by
+    one event-loop round trip and one socket write per page.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    room = threading.Semaphore(max(1, STREAM_BUFFER_PAGES))
+    stop = threading.Event()
+
+    def put(item):
+        while not room.acquire(timeout=0.1):
+            if stop.is_set():  # the client went away; stop instead of waiting for room forever
+                raise TimeoutError
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def produce():
+        try:
+            start = time.perf_counter()
+            for number, text in iterator(*args):
+                put((number, text, time.perf_counter() - start))
+                start = time.perf_counter()
+            put(None)
+        except TimeoutError:
+            pass
+        except Exception as e:
+            put(e)
+
+    async with engine_executors[engine].slot():
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        try:
+            while True:
+                items = [await queue.get()]
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+                for _ in items:
+                    room.release()
+                pages = [item for item in items if isinstance(item, tuple)]
+                if pages:
+                    yield pages
+                if isinstance(items[-1], Exception):
+                    raise items[-1]
+                if items[-1] is None:
+                    return
+        finally:
+            stop.set()
+            await asyncio.gather(producer, return_exceptions=True)
+
+async def stream_upload_pages(upload: SpooledUpload, engine: str, iterator, fmt: str, *args):
+    """Stream an upload's pages as NDJSON lines or SSE events, closing the upload when done."""
+    start, pages = time.perf_counter(), 0
+    try:
+        with upload:
+            async with admission.admit(engine, upload, args[0] if args else None):
+                async for batch in iter_stream_pages(engine, iterator, upload.source(engine), *args):
+                    pages += len(batch)
+                    yield "".join(format_stream_event(fmt, "page", {"page": number, "text": text, "seconds": round(seconds, 4)})
+                                  for number, text, seconds in batch)
+            PAGES_PROCESSED.inc(pages, engine=engine)
+    except Exception as e:
+        logging.error(f"Streaming {upload.filename} with {engine} failed after {pages} pages: {e}")
+        yield format_stream_event(fmt, "error", {"error": str(e.detail if isinstance(e, HTTPException) else e), "pages": pages})
+        return
+    yield format_stream_event(fmt, "done", {"pages": pages, "seconds": round(time.perf_counter() - start, 4)})
+
+async def stream_response(file: UploadFile, engine: str, iterator, fmt: str, *args):
+    upload = await asyncio.to_thread(handle_file_upload, file)
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream_upload_pages(upload, engine, iterator, fmt, *args), media_type=media_type,
+                             background=BackgroundTask(upload.close))
+
+# main functions and apis
+##################################################################################################################
+# 1. pdf plumber
+def iter_pages_pdfplumber(source, page_numbers=None):
+    """Yield (page number, text) with PDFPlumber, releasing each page's parsed objects once it is done."""
+    import pdfplumber
+    pages = None if page_numbers is None else [number + 1 for number in page_numbers]
+    with open_binary(source) as stream, pdfplumber.open(stream, pages=pages) as pdf:
+        for page in pdf.pages:
+            yield page.page_number, page.extract_text() or ""
+            page.flush_cache()
+            page.get_textmap.cache_clear()
+
+def extract_text_pdfplumber(source, page_numbers=None):
+    """Extract text from text-based PDFs using PDFPlumber."""
+    texts = []
+    try:
+        texts = [text for text in page_texts(iter_pages_pdfplumber, source, page_numbers) if text]
+        logging.info(f"Test extracted using pdfplumber from: {source_name(source)}")
+    except Exception as e:
+        logging.error(f"Error occur during text extraction with pdfplumber: {e}")
+        raise
+
+    return "\n".join(texts).strip()
+
+
+# api
+@app.post("/extract/pdfplumber", dependencies=[require_engine("pdfplumber")])
+async def pdfplumber_extraction(file: UploadFile = File(...), sharded: bool = SHARDED_QUERY, cache: str = Depends(cache_mode),
+                                save: bool = SAVE_QUERY, stream: str = Depends(stream_mode), page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "pdfplumber", iter_pages_pdfplumber, stream, page_numbers)
+    runner = functools.partial(extract_text_sharded, "pdfplumber") if sharded and page_numbers is None else None
+    text = await run_cached(file, "pdfplumber", extract_text_pdfplumber, cache=cache, runner=runner, page_numbers=page_numbers)
+    md_filename = result_sink.save(file.filename, text, "pdfplumber") if save and text else None
+    return {"text": text or "No text extracted", "method": "PDFPlumber", "saved_as": md_filename}
+
+##################################################################################################################
+#2. pytesseract
+# Pages are rendered one at a time with PyMuPDF and OCRed on a small thread pool (pytesseract runs the
+# tesseract binary in a subprocess, so threads overlap well). At most OCR_WINDOW rendered pages are alive
+# at once, so peak memory depends on the window and DPI rather than on the document length.
+# With preprocessing on (OCR_PREPROCESS or preprocess=true; off by default), pages are rendered in grayscale,
+# and each page goes through NumPy steps on the OCR threads before Tesseract sees it:
+#   - adaptive binarization with speckle removal;
+#   - deskew from projection profiles;
+#   - rescaling so text lines are about OCR_LINE_HEIGHT pixels tall;
+#   - cropping away borders and margins.
+# Blank pages, with fewer than OCR_BLANK_GLYPHS glyph-sized ink marks, never reach Tesseract then.
+# Tesseract gets the page segmentation mode, engine mode and resolution.
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WINDOW = int(os.getenv("OCR_WINDOW", "4"))  # pages rendered ahead of OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))  # concurrent tesseract processes per request
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "false").lower() in ("1", "true", "yes")
+OCR_PSM = int(os.getenv("OCR_PSM", "3"))  # tesseract --psm, 3 is fully automatic page segmentation
+OCR_OEM = int(os.getenv("OCR_OEM", "3"))  # tesseract --oem, 3 picks the best available engine
+OCR_LINE_HEIGHT = int(os.getenv("OCR_LINE_HEIGHT", "32"))  # target text line height in pixels, 0 keeps the scale
+OCR_BLANK_GLYPHS = int(os.getenv("OCR_BLANK_GLYPHS", "2"))  # pages with fewer glyph-sized ink marks are blank
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "5"))  # degrees searched by deskew, 0 disables it
+
+@dataclass(frozen=True)
+class OcrOptions:
+    preprocess: bool = OCR_PREPROCESS
+    psm: int = OCR_PSM
+    oem: int = OCR_OEM
+
+    def params(self):
+        return {"preprocess": self.preprocess, "psm": self.psm, "oem": self.oem}
+
+OCR_DEFAULTS = OcrOptions()
+
+def ocr_options(preprocess: bool = Query(OCR_PREPROCESS, description="binarize, deskew, rescale and crop pages before OCR"),
+                psm: int = Query(OCR_PSM, ge=0, le=13, description="tesseract page segmentation mode"),
+                oem: int = Query(OCR_OEM, ge=0, le=3, description="tesseract OCR engine mode")):
+    return OcrOptions(preprocess, psm, oem)
+
+def render_page(page, dpi: int, gray: bool = False):
+    """Rasterize a PyMuPDF page into a PIL image."""
+    import fitz
+    from PIL import Image
+    if gray:
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    pixmap = page.get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+def box_mean(values, radius: int):
+    """Mean over the (2 * radius + 1) square around every pixel, from an integral image; edges are replicated."""
+    import numpy as np
+    size = 2 * radius + 1
+    integral = np.zeros((values.shape[0] + size, values.shape[1] + size))
+    integral[1:, 1:] = np.pad(values, radius, mode="edge").cumsum(0).cumsum(1)
+    return (integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]) / size ** 2
+
+def binarize(gray, sensitivity: float = 0.15):
+    """Ink mask of a grayscale page: darker than its neighbourhood mean (Bradley), without isolated specks."""
+    window = max(gray.shape[1] // 32, 4)
+    ink = gray < box_mean(gray, window) * (1 - sensitivity)
+    return ink & (box_mean(ink, 1) > 2.5 / 9)  # keep pixels with at least two ink neighbours
+
+def ink_marks(ink):
+    """Pixel counts of the 8-connected ink marks (connected components) of a mask, from its horizontal runs."""
+    import numpy as np
+    edges = np.diff(np.pad(ink, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]  # exclusive, so a run touches the runs of the next row starting up to `end`
+    if not rows.size:
+        return np.zeros(0)
+    width = ink.shape[1] + 1
+    below = rows + 1
+    first = np.searchsorted(rows * width + ends, below * width + starts)
+    last = np.searchsorted(rows * width + starts, below * width + ends, side="right")
+    counts = np.maximum(last - first, 0)
+    a = np.repeat(np.arange(rows.size), counts)
+    b = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    labels = np.arange(rows.size)
+    while True:  # every run takes the smallest run index of its mark
+        low = np.minimum(labels[a], labels[b])
+        merged = labels.copy()
+        np.minimum.at(merged, a, low)
+        np.minimum.at(merged, b, low)
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            return np.bincount(labels, weights=ends - starts)
+        labels = merged
+
+def text_profile(ink, max_skew: float = OCR_MAX_SKEW):
+    """Skew angle (degrees) whose horizontal projection of the ink is sharpest, and that projection."""
+    import numpy as np
+    ys, xs = np.nonzero(ink)
+    best = (-1, 0.0, None)
+    for angle in np.arange(-max_skew, max_skew + 0.01, 0.25) if max_skew else [0.0]:
+        rows = np.rint(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+        profile = np.bincount(rows - rows.min())
+        score = float(np.dot(profile, profile))
+        if score > best[0]:
+            best = (score, float(angle), profile)
+    return best[1], best[2]
+
+def line_height(profile):
+    """Median height of the runs of text rows in a projection profile, 0 if there are none."""
+    import numpy as np
+    rows = np.concatenate(([0], (profile > 0.1 * profile.max()).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(rows))
+    heights = edges[1::2] - edges[::2]
+    heights = heights[heights > 2]
+    return float(np.median(heights)) if heights.size else 0
+
+def preprocess_page(image, dpi: int):
+    """Clean up a grayscale page for Tesseract; returns the binarized PIL image (None for a blank page) and its dpi."""
+    import numpy as np
+    from PIL import Image
+    gray = np.asarray(image)
+    step = max(1, gray.shape[1] // 1000)
+    ink = binarize(gray[::step, ::step])
+    # borders and scanner edges are rows/columns that are mostly ink; the text is what lies between them
+    ink &= ~((ink.mean(1) >= 0.5)[:, None] | (ink.mean(0) >= 0.5)[None, :])
+    # a glyph is one mark of dozens of pixels, noise and dust leave specks of a few; a single short line is enough
+    glyph_pixels = (dpi / step / 30) ** 2
+    if (ink_marks(ink) >= glyph_pixels).sum() < OCR_BLANK_GLYPHS:
+        return None, dpi
+    strokes = box_mean(ink, 2) > 0.5  # text strokes survive a 5x5 majority, noise and dust do not
+    if not strokes.any():
+        strokes = ink  # thin print that the majority wipes out
+    angle, profile = text_profile(strokes)
+    rows, columns = np.flatnonzero(strokes.any(1)), np.flatnonzero(strokes.any(0))
+    margin = 16
+    image = image.crop((max(columns[0] - margin, 0) * step, max(rows[0] - margin, 0) * step,
+                        min((columns[-1] + margin) * step, image.width), min((rows[-1] + margin) * step, image.height)))
+    height = line_height(profile) * step
+    scale = OCR_LINE_HEIGHT / height if OCR_LINE_HEIGHT and height else 1
+    scale = 1 if 0.8 < scale < 1.25 else min(max(scale, 0.5), 2)
+    if abs(angle) >= 0.25:
+        image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+    if scale != 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+    ink = binarize(np.asarray(image))
+    ink &= box_mean(ink, max(OCR_LINE_HEIGHT // 2, 8)) > 0.03  # dust far from any text line
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8)), round(dpi * scale)
+
+def ocr_page(number: int, image, render_seconds: float, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS):
+    import pytesseract
+    start = time.perf_counter()
+    if options.preprocess:
+        with stage("preprocess"):
+            prepared, dpi = preprocess_page(image, dpi)
+        image.close()
+        image = prepared
+    preprocess_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    if image is None:
+        text = ""
+    else:
+        with stage("ocr"):
+            text = pytesseract.image_to_string(image, config=f"--psm {options.psm} --oem {options.oem} --dpi {dpi}")
+        image.close()
+    return {"page": number + 1, "text": text, "blank": image is None, "render_seconds": round(render_seconds, 3),
+            "preprocess_seconds": round(preprocess_seconds, 3), "ocr_seconds": round(time.perf_counter() - start, 3)}
+
+def iter_ocr_pages(source, dpi: int = OCR_DPI, window: int = OCR_WINDOW, workers: int = OCR_WORKERS, page_numbers=None,
+                   options: OcrOptions = OCR_DEFAULTS, ocr=ocr_page):
+    """Yield OCR results page by page, in order, rendering the next pages while earlier ones are OCRed.
+
+    `page_numbers` (0-based) restricts OCR to those pages; by default every page is processed. `ocr` is
+    called as ocr_page is, on a pool thread, and its results are yielded.
+    """
+    window = max(window, 1)
+    with open_fitz(source) as doc, ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="ocr") as pool:
+        pending = deque()
+        for number in selected_pages(page_numbers, doc.page_count):
+            start = time.perf_counter()
+            with stage("render"):
+                image = render_page(doc[number], dpi, gray=options.preprocess)
+            pending.append(pool.submit(contextvars.copy_context().run, ocr, number, image,
+                                       time.perf_counter() - start, dpi, options))
+            del image
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_ocr_results(source, page_numbers=None, dpi: int = OCR_DPI, window: int = OCR_WINDOW, workers: int = OCR_WORKERS,
+                     options: OcrOptions = OCR_DEFAULTS):
+    """Yield (page number, OCR result) pairs, the shape the page cache stores."""
+    for page in iter_ocr_pages(source, dpi, window, workers, page_numbers, options):
+        yield page["page"], page
+
+def extract_pages_tesseract(source, dpi: int = OCR_DPI, window: int = OCR_WINDOW, workers: int = OCR_WORKERS,
+                            options: OcrOptions = OCR_DEFAULTS, page_numbers=None):
+    """OCR the selected (by default every) page with Tesseract, returning per-page text and timings."""
+    pages = []
+    ocr = functools.partial(iter_ocr_results, dpi=dpi, window=window, workers=workers, options=options)
+    try:
+        for number, page, cached in iter_cached_pages(ocr, source, page_numbers):
+            pages.append({"page": number, "text": page["text"], "blank": page["blank"], "cached": True} if cached else page)
+        logging.info(f"Text extracted using Tesseract OCR from: {source_name(source)} ({len(pages)} pages at {dpi} dpi)")
+    except Exception as e:
+        logging.error(f"Error extracting text with Tesseract: {e}")
+        raise
+    return pages
+
+def iter_pages_tesseract(source, page_numbers=None, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS):
+    """Yield (page number, text) from the OCR pipeline."""
+    for page in iter_ocr_pages(source, dpi, page_numbers=page_numbers, options=options):
+        yield page["page"], page["text"]
+
+def extract_text_tesseract(source, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS, page_numbers=None):
+    """Extract text from scanned PDFs using Tesseract OCR."""
+    pages = extract_pages_tesseract(source, dpi, options=options, page_numbers=page_numbers)
+    return "\n".join(page["text"] for page in pages).strip()
+
+#api
+@app.post("/extract/tesseract", dependencies=[require_engine("tesseract")])
+async def tesseract_extraction(file: UploadFile = File(...), dpi: int = Query(OCR_DPI, ge=50, le=600),
+                               options: OcrOptions = Depends(ocr_options),
+                               cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, stream: str = Depends(stream_mode),
+                               page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "tesseract", iter_pages_tesseract, stream, page_numbers, dpi, options)
+    pages = await run_cached(file, "tesseract", extract_pages_tesseract, dpi, OCR_WINDOW, OCR_WORKERS, options,
+                             params={"dpi": dpi, **options.params()}, cache=cache, page_numbers=page_numbers)
+    text = "\n".join(page["text"] for page in pages).strip()
+    md_filename = result_sink.save(file.filename, text, "tesseract") if save and text else None
+    timings = [{key: value for key, value in page.items() if key != "text"} for page in pages]
+    blank_pages = sum(page.get("blank", False) for page in pages)
+    return {"text": text or "No text extracted", "method": "Tesseract OCR", "dpi": dpi, **options.params(),
+            "blank_pages": blank_pages, "pages": timings, "saved_as": md_filename}
+
+##################################################################################################################
+# auto: hybrid text layer / OCR routing per page
+# A cheap PyMuPDF probe looks at each page's text layer, fonts and image coverage. Pages with a usable text
+# layer take the fast path; only pages that are essentially images go through the OCR pipeline.
+
+AUTO_MIN_CHARS = int(os.getenv("AUTO_MIN_CHARS", "50"))  # text layer shorter than this is not trusted
+AUTO_MIN_IMAGE_COVERAGE = float(os.getenv("AUTO_MIN_IMAGE_COVERAGE", "0.3"))  # fraction of the page
+
+def probe_page(page):
+    """Return the text layer of a page and the signals used to route it."""
+    import fitz  # PyMuPDF
+    text = page.get_text("text")
+    page_area = abs(page.rect) or 1
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    probe = {
+        "chars": len(text.strip()),
+        "image_coverage": round(min(1.0, covered / page_area), 3),
+        "fonts": len(page.get_fonts()),
+    }
+    return text, probe
+
+def route_page(probe: dict):
+    """Pick "text" or "ocr" for a probed page and explain why."""
+    if probe["chars"] >= AUTO_MIN_CHARS and probe["fonts"]:
+        return "text", f"text layer with {probe['chars']} characters"
+    if probe["image_coverage"] >= AUTO_MIN_IMAGE_COVERAGE:
+        return "ocr", f"{probe['chars']} characters of text, images cover {probe['image_coverage']:.0%} of the page"
+    return "text", f"{probe['chars']} characters of text and no significant images"
+
+def probe_pages_auto(source, page_numbers=None):
+    """Probe and route the selected pages, keeping the text layer of each; OCR pages are filled in later."""
+    pages = []
+    with open_fitz(source) as doc:
+        for number in selected_pages(page_numbers, doc.page_count):
+            text, probe = probe_page(doc[number])
+            path, reason = route_page(probe)
+            pages.append({"page": number + 1, "path": path, "reason": reason, **probe, "text": text})
+    return pages
+
+def merge_ocr_pages(pages: list, ocr_pages: list):
+    """Replace the text of the pages routed to OCR with their OCR results."""
+    by_page = {page["page"]: page for page in pages}
+    for result in ocr_pages:
+        by_page[result["page"]].update(text=result["text"], ocr_seconds=result.get("ocr_seconds"))
+    return pages
+
+def extract_pages_auto(source, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS, page_numbers=None):
+    """Extract each page from its text layer when usable, and with Tesseract OCR otherwise."""
+    pages = probe_pages_auto(source, page_numbers)
+    ocr_numbers = [page["page"] - 1 for page in pages if page["path"] == "ocr"]
+    if ocr_numbers:
+        merge_ocr_pages(pages, list(iter_ocr_pages(source, dpi, page_numbers=ocr_numbers, options=options)))
+    logging.info(f"Auto extraction of {source_name(source)}: {len(pages) - len(ocr_numbers)} text pages, {len(ocr_numbers)} OCR pages")
+    return pages
+
+#api
+@app.post("/extract/auto", dependencies=[require_engine("pymupdf"), require_engine("tesseract")])
+async def auto_extraction(file: UploadFile = File(...), dpi: int = Query(OCR_DPI, ge=50, le=600),
+                          options: OcrOptions = Depends(ocr_options),
+                          cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, page_numbers: list = Depends(page_selection)):
+    # the probe is a PyMuPDF call; only the pages routed to OCR take a Tesseract slot, admission and cache entry,
+    # the same ones /extract/tesseract uses for that page selection
+    pages = await run_cached(file, "pymupdf", probe_pages_auto, cache=cache, page_numbers=page_numbers)
+    ocr_numbers = [page["page"] - 1 for page in pages if page["path"] == "ocr"]
+    if ocr_numbers:
+        ocr_pages = await run_cached(file, "tesseract", extract_pages_tesseract, dpi, OCR_WINDOW, OCR_WORKERS, options,
+                                     params={"dpi": dpi, **options.params()}, cache=cache, page_numbers=ocr_numbers)
+        merge_ocr_pages(pages, ocr_pages)
+    logging.info(f"Auto extraction of {file.filename}: {len(pages) - len(ocr_numbers)} text pages, {len(ocr_numbers)} OCR pages")
+    text = "\n".join(page["text"] for page in pages).strip()
+    md_filename = result_sink.save(file.filename, text, "auto") if save and text else None
+    routing = [{key: value for key, value in page.items() if key != "text"} for page in pages]
+    return {"text": text or "No text extracted", "method": "Auto (text layer + OCR)", "text_pages": len(pages) - len(ocr_numbers),
+            "ocr_pages": len(ocr_numbers), "pages": routing, "saved_as": md_filename}
+
+##################################################################################################################
+#3. pymupdf        
+def iter_pages_pymupdf(source, page_numbers=None):
+    """Yield (page number, text) using PyMuPDF."""
+    with open_fitz(source) as doc:
+        for number in selected_pages(page_numbers, doc.page_count):
+            yield number + 1, doc[number].get_text("text")
+
+def extract_text_pymupdf(source, page_numbers=None):
+    """Extract text using PyMuPDF."""
+    texts = []
+    try:
+        texts = page_texts(iter_pages_pymupdf, source, page_numbers)
+        logging.info(f"Text extracting using PyMuPDF: {source_name(source)}")
+    except Exception as e:
+        logging.error(f"Error extracting text with PyMuPDF {e}")
+        raise
+    return "\n".join(texts).strip()
+#api
+@app.post("/extract/pymupdf", dependencies=[require_engine("pymupdf")])
+async def pymupdf_extraction(file: UploadFile = File(...), sharded: bool = SHARDED_QUERY, cache: str = Depends(cache_mode),
+                             save: bool = SAVE_QUERY, stream: str = Depends(stream_mode), page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "pymupdf", iter_pages_pymupdf, stream, page_numbers)
+    runner = functools.partial(extract_text_sharded, "pymupdf") if sharded and page_numbers is None else None
+    text = await run_cached(file, "pymupdf", extract_text_pymupdf, cache=cache, runner=runner, page_numbers=page_numbers)
+    md_filename = result_sink.save(file.filename, text, "pymupdf") if save and text else None
+    return {"text": text or "No text extracted", "method": "PyMuPDF", "saved_as": md_filename}
+    
+##################################################################################################################
+#docling
+# Docling configuration
+SUPPORTED_FORMATS = ["pdf", "pptx", "docx", "xlsx", "md", "csv", "png", "jpeg", "tiff"]
+
+def iter_pages_docling(temp_path: str, page_numbers=None):
+    """Yield (page number, markdown) using Docling, converting each run of selected pages in one pass.
+
+    Formats without pages (docx, md, csv, ...) come back as a single page 1.
+    """
+    converter = model_registry.get("docling")
+    for page_range in ([None] if page_numbers is None else page_runs(page_numbers)):
+        with stage("inference"):
+            result = converter.convert(temp_path, **({} if page_range is None else {"page_range": page_range}))
+        document = result.document
+        if not document.pages:
+            yield 1, document.export_to_markdown()
+            return
+        for number in sorted(document.pages):
+            yield number, document.export_to_markdown(page_no=number)
+
+def extract_text_docling(temp_path: str, filename: str, page_numbers=None):
+    """Extract text using Docling."""
+    logging.info(f"Starting docling extraction for file: {filename}")
+    file_ext = filename.split(".")[-1].lower()
+    if file_ext not in SUPPORTED_FORMATS:
+        logging.warning(f"Unsupported file format: {file_ext}")
+        return "Unsupported file format"
+    
+    text = "\n\n".join(page_texts(iter_pages_docling, temp_path, page_numbers))
+    logging.info(f"Successfully extracted text using Docling for file: {filename}")
+    return text
+#api
+@app.post("/extract/docling", dependencies=[require_engine("docling")])
+async def docling_extraction(file: UploadFile = File(...), cache: str = Depends(cache_mode), save: bool = SAVE_QUERY,
+                             page_numbers: list = Depends(page_selection)):
+    file_ext = file.filename.split(".")[-1].lower()
+    text = await run_cached(file, "docling", extract_text_docling, file.filename, params={"ext": file_ext}, cache=cache,
+                            page_numbers=page_numbers)
+    logging.info(f"File {file.filename} processed")
+    md_filename = result_sink.save(file.filename, text, "docling") if save and text and "Unsupported" not in text else None
+    return {"text": text, "method": "Docling", "saved_as": md_filename}
+
+##################################################################################################################
+# 5.  Marker text extraction
+MARKER_PAGE_SEPARATOR = re.compile(r"\n*\{(\d+)\}-{48}\n*")
+
+def marker_converter(models: dict, name: str, page_numbers=None):
+    """The shared converter for whole documents, or one restricted to the selected pages (same models)."""
+    from marker.converters.pdf import PdfConverter
+    from marker.converters.table import TableConverter
+    if page_numbers is None:
+        return models[name]
+    config = {**(MARKER_TEXT_CONFIG if name == "text_converter" else {}), "page_range": list(page_numbers)}
+    converter_class = PdfConverter if name == "text_converter" else TableConverter
+    return converter_class(artifact_dict=models["artifact_dict"], config=config)
+
+def iter_pages_marker(temp_path: str, page_numbers=None):
+    """Yield (page number, markdown) using Marker, converting only the selected pages."""
+    from marker.output import text_from_rendered
+    if page_numbers is not None:
+        # Marker rejects page ranges past the end of the document
+        page_numbers = list(selected_pages(page_numbers, count_pages(temp_path)))
+        if not page_numbers:
+            return
+    converter = marker_converter(model_registry.get("marker"), "text_converter", page_numbers)
+    with stage("inference"):
+        rendered = converter(temp_path)
+    text, _, _ = text_from_rendered(rendered)
+    parts = MARKER_PAGE_SEPARATOR.split(text)
+    if len(parts) == 1:
+        yield (page_numbers[0] + 1 if page_numbers else 1), text.strip()
+        return
+    for page_id, page_text in zip(parts[1::2], parts[2::2]):
+        yield int(page_id) + 1, page_text.strip()
+
+def extract_text_marker(temp_path: str, tables: str = "detect", page_numbers=None):
+    """Extract text and tables using Marker.
+
+    The table model runs on the pages where detect_table_pages finds a table (`tables="detect"`), on every
+    selected page (`"all"`) or not at all (`"none"`).
+    """
+    from marker.output import text_from_rendered
+    logging.info(f"Starting Marker extraction for file: {temp_path}")
+    models = model_registry.get("marker")
+    if page_numbers is not None:
+        page_numbers = list(selected_pages(page_numbers, count_pages(temp_path)))
+        if not page_numbers:
+            return "", ""
+    text = "\n\n".join(page_texts(iter_pages_marker, temp_path, page_numbers))
+    table_pages = detect_table_pages(temp_path, page_numbers) if tables == "detect" else page_numbers
+    table_text = ""
+    if tables != "none" and table_pages != []:
+        table_converter = marker_converter(models, "table_converter", table_pages)
+        with stage("inference"):
+            table_rendered = table_converter(temp_path)
+        table_text, _, _ = text_from_rendered(table_rendered)
+    logging.info(f"Marker extraction completed for file: {temp_path}")
+    
+    return text, table_text
+#api
+@app.post("/extract/marker", dependencies=[require_engine("marker")])
+async def marker_extraction(file: UploadFile = File(...), cache: str = Depends(cache_mode), save: bool = SAVE_QUERY,
+                            page_numbers: list = Depends(page_selection),
+                            tables: str = Query("detect", pattern="^(detect|all|none)$",
+                                                description="pages for the table model: detected table pages, all or none")):
+    params = None if tables == "detect" else {"tables": tables}
+    text, table_text = await run_cached(file, "marker", extract_text_marker, tables, params=params, cache=cache,
+                                        page_numbers=page_numbers)
+    logging.info(f"File {file.filename} processed")
+    
+    md_text = result_sink.save(file.filename, text, "marker_text") if save and text else None
+    md_table = result_sink.save(file.filename, table_text, "marker_table") if save and table_text else None
+    
+    return {
+        "text": text or "No text extracted",
+        "table_text": table_text or "No table extracted",
+        "saved_files": {"text": md_text, "table": md_table}
+    }
+##################################################################################################################
+# tables: cheap table-page detection and structured tables
+# Most pages of a long document have no table, and the table models are the expensive part. PyMuPDF's
+# find_tables (ruling lines and text alignment, no model) picks the candidate pages, after a near-free check
+# that a page draws enough vector lines for a ruled table. /extract/tables returns rows of cells plus
+# markdown, either straight from PyMuPDF or from Marker's table model run on the candidate pages only. The
+# Marker text endpoint uses the same detector for its table pass.
+
+TABLE_STRATEGY = os.getenv("TABLE_STRATEGY", "lines")  # find_tables strategy: "lines" (ruled) or "text"
+TABLE_MIN_DRAWINGS = int(os.getenv("TABLE_MIN_DRAWINGS", "4"))  # vector items a ruled table needs at least
+
+def table_markdown(rows):
+    """Markdown for a table given as rows of cells, the first row being the header."""
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    cells = [[" ".join(str(cell or "").split()).replace("|", "\\|") for cell in row] + [""] * (width - len(row)) for row in rows]
+    lines = ["| " + " | ".join(cells[0]) + " |", "|" + "---|" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in cells[1:]]
+    return "\n".join(lines)
+
+def page_may_have_table(page):
+    """Cheap pre-check: a ruled table needs vector lines, so pages without enough drawings are skipped."""
+    if TABLE_STRATEGY != "lines":
+        return True
+    return sum(len(path["items"]) for path in page.get_cdrawings()) >= TABLE_MIN_DRAWINGS
+
+def iter_table_pages(source, page_numbers=None, extract: bool = True):
+    """Yield (page number, tables) with PyMuPDF for the selected pages; tables are [] on pages without any."""
+    with open_fitz(source) as doc:
+        for number in selected_pages(page_numbers, doc.page_count):
+            page = doc[number]
+            found = []
+            if page_may_have_table(page):
+                found = page.find_tables(vertical_strategy=TABLE_STRATEGY, horizontal_strategy=TABLE_STRATEGY).tables
+            if not extract:
+                yield number + 1, found
+                continue
+            tables = []
+            for table in found:
+                rows = [[cell or "" for cell in row] for row in table.extract()]
+                tables.append({"page": number + 1, "bbox": [round(value, 1) for value in table.bbox],
+                               "rows": rows, "markdown": table_markdown(rows)})
+            yield number + 1, tables
+
+def detect_table_pages(source, page_numbers=None):
+    """0-based numbers of the selected pages on which PyMuPDF finds at least one table."""
+    with stage("detect"):
+        return [number - 1 for number, tables in iter_table_pages(source, page_numbers, extract=False) if tables]
+
+class TableHTMLParser(HTMLParser):
+    """Rows of cell texts from the <table> HTML that Marker renders (spans are not expanded)."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.rows.append([])
+        elif tag in ("td", "th"):
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self.cell is not None:
+            if not self.rows:
+                self.rows.append([])
+            self.rows[-1].append(" ".join("".join(self.cell).split()))
+            self.cell = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+def html_table_rows(html: str):
+    parser = TableHTMLParser()
+    parser.feed(html)
+    return [row for row in parser.rows if row]
+
+def iter_json_blocks(blocks):
+    for block in blocks or []:
+        yield block
+        yield from iter_json_blocks(getattr(block, "children", None))
+
+def extract_tables_pymupdf(source, page_numbers=None):
+    """Tables of the selected pages found by PyMuPDF."""
+    pages, tables = 0, []
+    for _, page_tables in iter_table_pages(source, page_numbers):
+        pages += 1
+        tables += page_tables
+    logging.info(f"PyMuPDF found {len(tables)} tables on {len({table['page'] for table in tables})} of {pages} pages")
+    return {"pages_scanned": pages, "table_pages": sorted({table["page"] for table in tables}), "tables": tables}
+
+def extract_tables_marker(temp_path: str, page_numbers=None):
+    """Tables from Marker's table model, run only on the pages where PyMuPDF detects a table."""
+    from marker.converters.table import TableConverter
+    candidates = detect_table_pages(temp_path, page_numbers)
+    pages = len(selected_pages(page_numbers, count_pages(temp_path)))
+    tables = []
+    if candidates:
+        models = model_registry.get("marker")
+        converter = TableConverter(artifact_dict=models["artifact_dict"], config={"page_range": candidates},
+                                   renderer="marker.renderers.json.JSONRenderer")
+        with stage("inference"):
+            rendered = converter(temp_path)
+        for block in iter_json_blocks(rendered.children):
+            if block.block_type == "Table":
+                rows = html_table_rows(block.html)
+                tables.append({"page": int(block.id.split("/")[2]) + 1, "bbox": [round(value, 1) for value in block.bbox],
+                               "rows": rows, "markdown": table_markdown(rows)})
+    logging.info(f"Marker extracted {len(tables)} tables from {len(candidates)} candidate pages of {pages}")
+    return {"pages_scanned": pages, "table_pages": [number + 1 for number in candidates], "tables": tables}
+
+TABLE_ENGINES = {
+    "pymupdf": extract_tables_pymupdf,
+    "marker": extract_tables_marker,
+}
+
+#api
+@app.post("/extract/tables", dependencies=[require_engine("pymupdf")])
+async def tables_extraction(file: UploadFile = File(...),
+                            engine: str = Query("pymupdf", pattern="^(pymupdf|marker)$",
+                                                description="pymupdf: detector only, marker: table model on detected pages"),
+                            cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, page_numbers: list = Depends(page_selection)):
+    if engine not in ENABLED_ENGINES:
+        raise HTTPException(status_code=404, detail=f"Engine '{engine}' is not enabled on this server")
+    await asyncio.to_thread(load_engine, engine)
+    result = await run_cached(file, engine, TABLE_ENGINES[engine], params={"strategy": TABLE_STRATEGY}, cache=cache,
+                              page_numbers=page_numbers)
+    markdown = "\n\n".join(f"Page {table['page']}\n\n{table['markdown']}" for table in result["tables"])
+    md_filename = result_sink.save(file.filename, markdown, f"{engine}_tables") if save and markdown else None
+    return {**result, "method": f"Tables ({engine})", "saved_as": md_filename}
+
+##################################################################################################################
+# layout: word boxes as a columnar table
+# Layout consumers want every word with its box, and a JSON list of per-word objects repeats every key for
+# every word. /extract/layout instead returns one column per field (page, x0, y0, x1, y1, text, size,
+# confidence, block, line; boxes in PDF points from the top-left corner) as an Arrow IPC stream or a Parquet
+# file. The engines' word lists are transposed straight into per-page columns, so no per-word dict is built
+# on our side. Without pyarrow the same columns go out as NDJSON, one line per page.
+
+LAYOUT_FORMAT = os.getenv("LAYOUT_FORMAT", "arrow")  # arrow, parquet or ndjson
+LAYOUT_PARQUET_COMPRESSION = os.getenv("LAYOUT_PARQUET_COMPRESSION", "zstd")
+LAYOUT_COLUMNS = ("page", "x0", "y0", "x1", "y1", "text", "size", "confidence", "block", "line")
+LAYOUT_TYPES = {"page": "int32", "x0": "float32", "y0": "float32", "x1": "float32", "y1": "float32", "text": "string",
+                "size": "float32", "confidence": "float32", "block": "int32", "line": "int32"}
+LAYOUT_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+}
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+def iter_layout_pymupdf(source, page_numbers=None):
+    """Yield (page number, word columns) with PyMuPDF; a word's size is the largest font size on its line."""
+    with open_fitz(source) as doc:
+        for number in selected_pages(page_numbers, doc.page_count):
+            page = doc[number]
+            textpage = page.get_textpage()  # shared, so block and line numbers agree between the two passes
+            words = page.get_text("words", textpage=textpage)
+            if not words:
+                continue
+            sizes = {}
+            for block in page.get_text("dict", textpage=textpage)["blocks"]:
+                for line_number, line in enumerate(block.get("lines", ())):
+                    sizes[block["number"], line_number] = max((span["size"] for span in line["spans"]), default=None)
+            x0, y0, x1, y1, text, block, line, _ = zip(*words)
+            yield number + 1, {"x0": x0, "y0": y0, "x1": x1, "y1": y1, "text": text,
+                               "size": list(map(sizes.get, zip(block, line))), "block": block, "line": line}
+
+def iter_layout_pdfplumber(source, page_numbers=None):
+    """Yield (page number, word columns) with PDFPlumber's word grouping."""
+    import pdfplumber
+    pages = None if page_numbers is None else [number + 1 for number in page_numbers]
+    with open_binary(source) as stream, pdfplumber.open(stream, pages=pages) as pdf:
+        for page in pdf.pages:
+            words = page.extract_words(extra_attrs=["size"])
+            if words:
+                yield page.page_number, {column: [word[key] for word in words] for column, key in
+                                         (("x0", "x0"), ("y0", "top"), ("x1", "x1"), ("y1", "bottom"), ("text", "text"),
+                                          ("size", "size"))}
+            page.flush_cache()
+            page.get_textmap.cache_clear()
+
+def ocr_words(number: int, image, render_seconds: float, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS):
+    """OCR one rendered page into word columns, boxes scaled from pixels to points."""
+    import numpy as np
+    import pytesseract
+    with stage("ocr"):
+        data = pytesseract.image_to_data(image, config=f"--psm {options.psm} --oem {options.oem} --dpi {dpi}",
+                                         output_type=pytesseract.Output.DICT)
+    image.close()
+    text = np.array(data["text"], dtype=object)
+    keep = (np.array(data["level"]) == 5) & (np.char.str_len(np.char.strip(text.astype(str))) > 0)
+    scale = 72 / dpi
+    left, top = np.array(data["left"])[keep] * scale, np.array(data["top"])[keep] * scale
+    return number + 1, {"x0": left.tolist(), "y0": top.tolist(),
+                        "x1": (left + np.array(data["width"])[keep] * scale).tolist(),
+                        "y1": (top + np.array(data["height"])[keep] * scale).tolist(), "text": text[keep].tolist(),
+                        "confidence": (np.array(data["conf"], dtype=float)[keep] / 100).tolist(),
+                        "block": np.array(data["block_num"])[keep].tolist(), "line": np.array(data["line_num"])[keep].tolist()}
+
+def iter_layout_tesseract(source, page_numbers=None, dpi: int = OCR_DPI, options: OcrOptions = OCR_DEFAULTS):
+    """Yield (page number, word columns) from the OCR pipeline.
+
+    Pages are OCRed as rendered (no preprocessing), since cropping and deskewing would move the boxes off
+    the page's coordinates.
+    """
+    options = OcrOptions(False, options.psm, options.oem)
+    for number, words in iter_ocr_pages(source, dpi, page_numbers=page_numbers, options=options, ocr=ocr_words):
+        if words["text"]:
+            yield number, words
+
+LAYOUT_ITERATORS = {
+    "pymupdf": iter_layout_pymupdf,
+    "pdfplumber": iter_layout_pdfplumber,
+    "tesseract": iter_layout_tesseract,
+}
+
+def extract_layout(source, engine: str, *args, page_numbers=None):
+    """Per-page word columns of the selected (by default every) page, as [page number, columns] pairs."""
+    pages = [[number, words] for number, words in LAYOUT_ITERATORS[engine](source, page_numbers, *args)]
+    logging.info(f"Word layout extracted with {engine} from: {source_name(source)} "
+                 f"({sum(len(words['text']) for _, words in pages)} words on {len(pages)} pages)")
+    return pages
+
+def layout_columns(pages):
+    """Concatenate per-page word columns into one list per LAYOUT_COLUMNS entry; missing columns are nulls."""
+    columns = {name: [] for name in LAYOUT_COLUMNS}
+    for number, words in pages:
+        count = len(words["text"])
+        columns["page"].extend(itertools.repeat(number, count))
+        for name in LAYOUT_COLUMNS[1:]:
+            values = words.get(name)
+            columns[name].extend(itertools.repeat(None, count) if values is None else values)
+    return columns
+
+def layout_table(pages):
+    import pyarrow as pa
+    columns = layout_columns(pages)
+    return pa.table({name: pa.array(columns[name], type=LAYOUT_TYPES[name]) for name in LAYOUT_COLUMNS})
+
+def serialize_layout(pages, fmt: str) -> bytes:
+    """Encode per-page word columns as an Arrow IPC stream, a Parquet file or NDJSON (one line per page)."""
+    if fmt == "ndjson":
+        lines = []
+        for number, words in pages:
+            line = {"page": number}
+            for name in LAYOUT_COLUMNS[1:]:
+                values = words.get(name)
+                if values is not None and LAYOUT_TYPES[name] == "float32":
+                    values = [None if value is None else round(value, 2) for value in values]
+                line[name] = values
+            lines.append(json.dumps(line, separators=(",", ":")))
+        return ("\n".join(lines) + "\n").encode() if lines else b""
+    import pyarrow as pa
+    table = layout_table(pages)
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression=LAYOUT_PARQUET_COMPRESSION)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+#api
+@app.post("/extract/layout", dependencies=[require_engine("pymupdf")])
+async def layout_extraction(file: UploadFile = File(...),
+                            engine: str = Query("pymupdf", pattern="^(pymupdf|pdfplumber|tesseract)$"),
+                            fmt: str = Query(LAYOUT_FORMAT, alias="format", pattern="^(arrow|parquet|ndjson)$",
+                                                description="arrow (IPC stream), parquet, or ndjson (one line of columns per page)"),
+                            dpi: int = Query(OCR_DPI, ge=50, le=600, description="tesseract only"),
+                            psm: int = Query(OCR_PSM, ge=0, le=13, description="tesseract page segmentation mode"),
+                            oem: int = Query(OCR_OEM, ge=0, le=3, description="tesseract OCR engine mode"),
+                            cache: str = Depends(cache_mode), page_numbers: list = Depends(page_selection)):
+    if engine not in ENABLED_ENGINES:
+        raise HTTPException(status_code=404, detail=f"Engine '{engine}' is not enabled on this server")
+    await asyncio.to_thread(load_engine, engine)
+    if fmt != "ndjson" and not HAS_PYARROW:
+        logging.warning(f"pyarrow is not installed, sending the {engine} layout as NDJSON instead of {fmt}")
+        fmt = "ndjson"
+    args, params = (), None
+    if engine == "tesseract":
+        args, params = (dpi, OcrOptions(False, psm, oem)), {"dpi": dpi, "psm": psm, "oem": oem}
+    pages = await run_cached(file, engine, extract_layout, engine, *args, params=params, cache=cache,
+                             page_numbers=page_numbers)
+    content = await asyncio.to_thread(serialize_layout, pages, fmt)
+    filename = f"{Path(file.filename or 'document').stem}_{engine}_layout.{fmt}"
+    return Response(content, media_type=LAYOUT_MEDIA_TYPES[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Layout-Format": fmt,
+                             "X-Layout-Words": str(sum(len(words["text"]) for _, words in pages))})
+
+##################################################################################################################
+# 6. doctr
+# The doctr predictor stays resident in the model registry. A render thread rasterizes pages with PyMuPDF
+# while the predictor runs batches of DOCTR_BATCH pages per call, so rendering overlaps inference and at
+# most two batches of rendered pages are alive at once. DOCTR_THREADS sizes torch's thread pool on CPU nodes.
+
+def iter_rendered_pages(source, page_numbers, dpi: int, ahead: int):
+    """Yield (page number, RGB array) for the selected pages while a thread renders up to `ahead` pages ahead."""
+    import numpy as np
+    rendered = Queue(maxsize=max(ahead, 1))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                rendered.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def render():
+        try:
+            with open_fitz(source) as doc:
+                for number in selected_pages(page_numbers, doc.page_count):
+                    with stage("render"):
+                        pixmap = doc[number].get_pixmap(dpi=dpi)
+                        image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+                    if not put((number, image)):
+                        return
+        except Exception as e:
+            put(e)
+            return
+        put(done)
+
+    renderer = threading.Thread(target=contextvars.copy_context().run, args=(render,), name="doctr-render", daemon=True)
+    renderer.start()
+    try:
+        while (item := rendered.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        renderer.join()
+
+def iter_pages_doctr(source, page_numbers=None, dpi: int = DOCTR_DPI, batch_size: int = DOCTR_BATCH):
+    """Yield (page number, text), running `batch_size` rendered pages through the predictor per call."""
+    predictor = model_registry.get("doctr")
+    pages = iter_rendered_pages(source, page_numbers, dpi, ahead=2 * batch_size)
+    try:
+        while batch := list(itertools.islice(pages, batch_size)):
+            with stage("inference"):
+                document = predictor([image for _, image in batch])
+            for (number, _), page in zip(batch, document.pages):
+                yield number + 1, page.render()
+    finally:
+        pages.close()
+
+def extract_text_doctr(source, dpi: int = DOCTR_DPI, batch_size: int = DOCTR_BATCH, page_numbers=None):
+    """Extract text from scanned PDFs with the resident doctr predictor."""
+    texts = page_texts(functools.partial(iter_pages_doctr, dpi=dpi, batch_size=batch_size), source, page_numbers)
+    logging.info(f"Text extracted using doctr from: {source_name(source)} ({len(texts)} pages at {dpi} dpi)")
+    return "\n\n".join(texts).strip()
+
+@app.post("/extract/doctr", dependencies=[require_engine("doctr")])
+async def doctr_extraction(file: UploadFile = File(...), dpi: int = Query(DOCTR_DPI, ge=50, le=600),
+                           batch_size: int = Query(DOCTR_BATCH, ge=1, le=64, description="pages per predictor call"),
+                           cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, stream: str = Depends(stream_mode),
+                           page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "doctr", iter_pages_doctr, stream, page_numbers, dpi, batch_size)
+    text = await run_cached(file, "doctr", extract_text_doctr, dpi, batch_size, params={"dpi": dpi}, cache=cache,
+                            page_numbers=page_numbers)
+    md_filename = result_sink.save(file.filename, text, "doctr") if save and text else None
+    return {"text": text or "No text extracted", "method": "doctr", "dpi": dpi, "saved_as": md_filename}
+
+##################################################################################################################
+# 7.  extract thinker
+# Field extraction reads the document text with PyMuPDF, or takes text a client already extracted, instead of
+# letting extract_thinker parse the PDF again. Pages are packed into chunks of up to THINKER_CHUNK_CHARS that
+# go to the LLM concurrently (THINKER_CONCURRENCY in flight, at most THINKER_RPM requests a minute), and each
+# field takes the value from the first chunk that found one. Extractors keep their LLM client in a pool,
+# contracts are built once per field list, and every chunk's answer is cached on (text hash, fields, model).
+
+load_dotenv()
+THINKER_MODEL = os.getenv("THINKER_MODEL", "gpt-4o")  # litellm model name; OPENAI_API_BASE points it at any OpenAI-compatible server
+THINKER_CHUNK_CHARS = int(os.getenv("THINKER_CHUNK_CHARS", "24000"))
+THINKER_CONCURRENCY = int(os.getenv("THINKER_CONCURRENCY", "4"))  # LLM calls in flight across all requests
+THINKER_RPM = float(os.getenv("THINKER_RPM", "0"))  # LLM requests per minute, 0 disables the limit
+
+@functools.lru_cache(maxsize=256)
+def create_dynamic_contract(fields: tuple):
+    """Contract class for a field list, built once per distinct list; a chunk may leave any field empty."""
+    from extract_thinker import Contract
+    attributes = {"__annotations__": {field: str | None for field in fields}}  # Explicit type annotations
+    attributes.update({field: None for field in fields})
+    attributes["__module__"] = __name__  # Required to avoid KeyError in Pydantic
+    return type("DynamicInvoiceContract", (Contract,), attributes)
+
+class RateLimiter:
+    """Spaces calls at least 60 / per_minute seconds apart across threads; 0 disables the limit."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60 / per_minute if per_minute > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+class ExtractorPool:
+    """extract_thinker Extractors with their LLM client loaded, reused across calls.
+
+    An Extractor keeps per-call state, so each one serves one call at a time; the pool grows to the
+    number of concurrent calls.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def extractor(self):
+        with self._lock:
+            extractor = self._idle.pop() if self._idle else None
+        if extractor is None:
+            from extract_thinker import Extractor, DocumentLoaderData
+            extractor = Extractor(document_loader=DocumentLoaderData())
+            extractor.load_llm(self.model)
+        try:
+            yield extractor
+        finally:
+            with self._lock:
+                self._idle.append(extractor)
+
+model_registry.register("extract_thinker", lambda: ExtractorPool(THINKER_MODEL))
+thinker_limiter = RateLimiter(THINKER_RPM)
+thinker_pool = ThreadPoolExecutor(max_workers=THINKER_CONCURRENCY, thread_name_prefix="thinker")
+
+def chunk_texts(texts: list, limit: int = THINKER_CHUNK_CHARS):
+    """Pack page texts into chunks of at most `limit` characters, splitting only pages longer than that."""
+    chunks, current = [], ""
+    for text in texts:
+        for start in range(0, len(text), limit):
+            piece = text[start:start + limit]
+            if not piece.strip():
+                continue
+            if current and len(current) + len(piece) + 2 > limit:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def extract_chunk_thinker(chunk: str, fields: tuple):
+    """Ask the LLM for `fields` in one chunk of text, answering from the result cache when possible."""
+    key = result_cache_key(hashlib.sha256(chunk.encode()).hexdigest(), "extract_thinker", extract_chunk_thinker,
+                           {"fields": list(fields), "model": THINKER_MODEL})
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    thinker_limiter.wait()
+    with model_registry.get("extract_thinker").extractor() as extractor:
+        result = extractor.extract([{"content": chunk}], create_dynamic_contract(fields))
+    values = {field: getattr(result, field, None) for field in fields}
+    result_cache.put(key, values)
+    return values
+
+def extract_fields_thinker(texts: list, field_list: list):
+    """Extract fields from document text, given as a list of page texts, with one LLM call per chunk."""
+    fields = tuple(field_list)
+    chunks = chunk_texts(texts)
+    with stage("inference"):
+        results = list(thinker_pool.map(functools.partial(extract_chunk_thinker, fields=fields), chunks))
+    logging.info(f"Thinker extraction of {len(fields)} fields from {len(chunks)} chunks")
+    return {field: next((result[field] for result in results if result.get(field)), None) for field in fields}
+
+def extract_text_thinker(source, field_list: list, page_numbers=None):
+    """Extract user-specified fields from the given PDF file."""
+    logging.info(f"Starting Thinker extraction for file: {source_name(source)}")
+    extracted_data = extract_fields_thinker(page_texts(iter_pages_pymupdf, source, page_numbers), field_list)
+    logging.info(f"Thinker extraction completed for file: {source_name(source)}")
+    return extracted_data
+
+@app.post("/extract/extract_thinker", dependencies=[require_engine("extract_thinker")])
+async def thinker_extraction(file: UploadFile = File(None), fields: list[str] = ["Insert field You want to extract"],
+                             text: str = Form(None, description="document text already extracted by another engine, instead of a file"),
+                             cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, page_numbers: list = Depends(page_selection)):
+    """Extract user-specified fields from a PDF, or from its already extracted text, using extract_thinker."""
+    params = {"fields": fields, "model": THINKER_MODEL}
+    if text is not None:
+        key = None
+        extracted_data = None
+        if cache != "bypass":
+            key = result_cache_key(hashlib.sha256(text.encode()).hexdigest(), "extract_thinker", extract_fields_thinker, params)
+            extracted_data = await asyncio.to_thread(result_cache.get, key) if cache == "use" else None
+        if extracted_data is None:
+            extracted_data = await run_engine("extract_thinker", extract_fields_thinker, [text], fields)
+            if key is not None and extracted_data:
+                await asyncio.to_thread(result_cache.put, key, extracted_data)
+    elif file is not None:
+        extracted_data = await run_cached(file, "extract_thinker", extract_text_thinker, fields, params=params, cache=cache,
+                                          page_numbers=page_numbers)
+    else:
+        raise HTTPException(status_code=400, detail="Send a PDF `file` or its extracted `text`")
+    filename = file.filename if file is not None else "text"
+    logging.info(f"File {filename} processed")
+    md_filename = result_sink.save(filename, str(extracted_data), "extract_thinker") if save and extracted_data else None
+    return {"extracted_data": extracted_data or "No data extracted", "method": "extract_thinker", "saved_as": md_filename}
+##################################################################################################################
+# 8. pdfminer
+
+def iter_pages_pdfminer(source, page_numbers=None):
+    """Yield (page number, text) using pdfminer, each page ending with its form feed."""
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfpage import PDFPage
+    wanted = None if page_numbers is None else set(page_numbers)
+    last = max(wanted, default=-1) if wanted is not None else None
+    rsrcmgr = PDFResourceManager()
+    retstr = StringIO()
+    device = TextConverter(rsrcmgr, retstr, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    try:
+        with open_binary(source) as file:
+            for number, page in enumerate(PDFPage.get_pages(file)):
+                if wanted is not None and number not in wanted:
+                    if number > last:
+                        break
+                    continue
+                interpreter.process_page(page)
+                yield number + 1, retstr.getvalue()
+                retstr.seek(0)
+                retstr.truncate(0)
+    finally:
+        device.close()
+
+def convert_pdf_to_txt_file(source, page_numbers=None):
+    """Extracts full text from a PDF file using pdfminer."""
+    logging.info(f"Starting full pdf text extraction for {source_name(source)}")
+    texts = page_texts(iter_pages_pdfminer, source, page_numbers)
+    text = "".join(texts)
+    logging.info(f"Completed full PDF extraction. Extracted {len(text)} characters from {len(texts)} pages.")
+    return text, len(texts)
+
+def convert_pdf_to_txt_pages(source, page_numbers=None):
+    """Extracts text from a PDF file page by page using pdfminer."""
+    logging.info(f"Starting per-page PDF text extraction for {source_name(source)}")
+    texts = page_texts(iter_pages_pdfminer, source, page_numbers)
+    logging.info(f"Completed per-page PDF extraction. Extracted text from {len(texts)} pages.")
+    return texts, len(texts)
+
+@app.post("/extract/pdfminer/pages", dependencies=[require_engine("pdfminer")])
+async def extract_pdfminer_pages(file: UploadFile = File(...), sharded: bool = SHARDED_QUERY, cache: str = Depends(cache_mode),
+                                 save: bool = SAVE_QUERY, stream: str = Depends(stream_mode), page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "pdfminer", iter_pages_pdfminer, stream, page_numbers)
+    runner = functools.partial(extract_pdfminer_sharded, per_page=True) if sharded and page_numbers is None else None
+    texts, nb_pages = await run_cached(file, "pdfminer", convert_pdf_to_txt_pages, cache=cache, runner=runner,
+                                       page_numbers=page_numbers)
+    md_filename = result_sink.save(file.filename, "\n".join(texts), "pdfminer") if save and texts else None
+    return {"text": texts or "No text extracted", "pages": nb_pages, "method": "PDFMiner", "saved_as": md_filename}
+
+@app.post("/extract/pdfminer_full", dependencies=[require_engine("pdfminer")])
+async def extract_pdfminer_full(file: UploadFile = File(...), sharded: bool = SHARDED_QUERY, cache: str = Depends(cache_mode),
+                                save: bool = SAVE_QUERY, stream: str = Depends(stream_mode), page_numbers: list = Depends(page_selection)):
+    if stream:
+        return await stream_response(file, "pdfminer", iter_pages_pdfminer, stream, page_numbers)
+    runner = functools.partial(extract_pdfminer_sharded, per_page=False) if sharded and page_numbers is None else None
+    text, nb_pages = await run_cached(file, "pdfminer", convert_pdf_to_txt_file, cache=cache, runner=runner,
+                                      page_numbers=page_numbers)
+    md_filename = result_sink.save(file.filename, text, "pdfminer") if save and text else None
+    return {"text": text or "No text extracted", "pages": nb_pages, "method": "PDFMiner", "saved_as": md_filename}
+
+PAGE_ITERATORS = {
+    "pymupdf": iter_pages_pymupdf,
+    "pdfplumber": iter_pages_pdfplumber,
+    "pdfminer": iter_pages_pdfminer,
+    "tesseract": iter_pages_tesseract,
+    "docling": iter_pages_docling,
+    "marker": iter_pages_marker,
+    "doctr": iter_pages_doctr,
+}
+
+##################################################################################################################
+
+OUTPUT_FOLDER = Path(os.getcwd()) / "output"
+
+OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+
+def convert_pptx_file(temp_pptx_path: str, stem: str, disable_image: bool = False):
+    """Convert a PPTX file to markdown with pptx2md and return the markdown and its output path."""
+    from pptx2md import convert, ConversionConfig
+    output_md_path = OUTPUT_FOLDER / f"{stem}.md"
+    image_dir = OUTPUT_FOLDER / stem / "images"
+    
+    if not disable_image:
+        image_dir.mkdir(parents=True, exist_ok=True)
+    
+    config = ConversionConfig(
+        pptx_path=Path(temp_pptx_path),
+        output_path=output_md_path,
+        image_dir=image_dir if not disable_image else None,
+        disable_notes=False,
+        enable_slides=True,
+        disable_image=disable_image
+    )
+    
+    convert(config)
+    
+    # Read generated markdown content
+    with open(output_md_path, "r", encoding="utf-8") as f:
+        md_content = f.read()
+    return md_content, output_md_path
+
+@app.post("/extract/pptx2md", dependencies=[require_engine("pptx2md")])
+async def convert_pptx_to_md(file: UploadFile = File(...), disable_image: bool = False):
+    logging.info(f"Processing PPTX file: {file.filename}")
+    if not file.filename.endswith('.pptx'):
+        logging.error("Invalid file format. Only .pptx files are supported.")
+        return {"error": "Only .pptx files are supported."}
+    
+    try:
+        with await asyncio.to_thread(handle_file_upload, file) as upload:
+            async with admission.admit("pptx2md", upload):
+                md_content, output_md_path = await run_engine("pptx2md", convert_pptx_file, upload.path, Path(file.filename).stem, disable_image)
+
+        logging.info(f"PPTX conversion successfull. Markdown saved at {output_md_path}")
+        
+        return {
+            "markdown_content": md_content,
+            "filename": output_md_path.name
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error processing PPTX file: {str(e)}")
+        return {"error": str(e)}
+
+
+##################################################################################################################
+
+# Comparison mode: the selected engines run concurrently on their own executors from one shared copy of
+# the upload. Each engine has a timeout and its failures are reported in its own entry, so one slow or
+# broken engine cannot hold back or crash the whole comparison.
+
+COMPARE_TIMEOUT = float(os.getenv("COMPARE_TIMEOUT", "300"))
+
+COMPARE_ENGINES = {
+    "pdfplumber": ("pdfplumber", extract_text_pdfplumber),
+    "tesseract": ("tesseract", extract_text_tesseract),
+    "pymupdf": ("pymupdf", extract_text_pymupdf),
+    "docling": ("docling", extract_text_docling),
+    "marker": ("marker", extract_text_marker),
+    "doctr": ("doctr", extract_text_doctr),
+    "pdfminer_full": ("pdfminer", convert_pdf_to_txt_file),
+    "pdfminer_pages": ("pdfminer", convert_pdf_to_txt_pages),
+    "extract_thinker": ("extract_thinker", extract_text_thinker),
+}
+# extract_thinker calls a paid LLM and needs a field list, so it only runs when asked for explicitly
+COMPARE_DEFAULT = [name for name in COMPARE_ENGINES if name != "extract_thinker"]
+
+def measured_call(fn, *args):
+    """Run fn and report its wall time, plus CPU time and peak RSS where they can be attributed to it.
+
+    In a process-pool worker the call has the process to itself, so the worker's CPU time and peak RSS are
+    the call's own. Thread-pool engines share the API process with every other engine of the comparison and
+    do their work on helper threads, subprocesses (tesseract) or torch threads, so they only get the API
+    process's peak RSS, reported as process_peak_rss_mb, and no CPU time.
+    """
+    isolated = multiprocessing.parent_process() is not None
+    process = psutil.Process()
+    peak_rss = [process.memory_info().rss]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        result = fn(*args)
+    finally:
+        done.set()
+        sampler.join()
+    peak_rss_mb = round(max(peak_rss[0], process.memory_info().rss) / (1024 * 1024), 1)
+    stats = {"wall_seconds": round(time.perf_counter() - wall_start, 3)}
+    if isolated:
+        stats.update(cpu_seconds=round(time.process_time() - cpu_start, 3), peak_rss_mb=peak_rss_mb)
+    else:
+        stats["process_peak_rss_mb"] = peak_rss_mb
+    return result, stats
+
+def format_compare_result(name: str, result):
+    """Normalize each engine's return value into a response entry with a `text` field."""
+    if name == "marker":
+        text, table_text = result
+        return {"text": text, "table_text": table_text}
+    if name == "pdfminer_full":
+        text, nb_pages = result
+        return {"text": text, "pages": nb_pages}
+    if name == "pdfminer_pages":
+        texts, nb_pages = result
+        return {"text": "\n".join(texts), "page_texts": texts, "pages": nb_pages}
+    if name == "extract_thinker":
+        return {"text": str(result), "extracted_data": result}
+    return {"text": result}
+
+def compare_params(name: str, filename: str, fields, page_numbers=None):
+    """Cache parameters matching the ones used by the single-engine endpoints, so they share entries."""
+    if name == "docling":
+        return with_pages({"ext": filename.split(".")[-1].lower()}, page_numbers)
+    if name == "extract_thinker":
+        return with_pages({"fields": fields, "model": THINKER_MODEL}, page_numbers)
+    return with_pages(None, page_numbers)
+
+def engine_args(name: str, upload: SpooledUpload, fields):
+    """Arguments of COMPARE_ENGINES[name]'s function for an upload."""
+    if name == "docling":
+        return upload.path, upload.filename
+    if name == "extract_thinker":
+        return upload.source("extract_thinker"), fields
+    return (upload.source(COMPARE_ENGINES[name][0]),)
+
+def engine_function(name: str, page_numbers=None):
+    """COMPARE_ENGINES[name]'s function, bound to a page selection when there is one."""
+    fn = COMPARE_ENGINES[name][1]
+    if page_numbers is None:
+        return fn
+    return functools.partial(fn, page_numbers=page_numbers)
+
+async def run_compare_engine(name: str, upload: SpooledUpload, fields, timeout: float, cache_key=None, page_numbers=None,
+                             digest: str = None):
+    engine = COMPARE_ENGINES[name][0]
+    fn = engine_function(name, page_numbers)
+    filename = upload.filename
+    if engine not in ENABLED_ENGINES:
+        return {"status": "disabled"}
+    if name == "extract_thinker" and not fields:
+        return {"status": "error", "error": "extract_thinker needs the `fields` query parameter"}
+    args = engine_args(name, upload, fields)
+    try:
+        await asyncio.to_thread(load_engine, engine)
+        async with admission.admit(engine, upload, page_numbers):
+            with known_digest(args[0], digest):
+                result, stats = await asyncio.wait_for(run_engine(engine, measured_call, fn, *args), timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Engine {name} timed out after {timeout}s on {filename}")
+        return {"status": "timeout", "error": f"no result within {timeout}s"}
+    except HTTPException as e:
+        return {"status": "rejected", "error": e.detail}
+    except Exception as e:
+        logging.error(f"Engine {name} failed on {filename}: {e}")
+        return {"status": "error", "error": str(e)}
+    await observe_pages(engine, upload, page_numbers)
+    if cache_key is not None and result:
+        await asyncio.to_thread(result_cache.put, cache_key, result)
+    return {"status": "ok", **format_compare_result(name, result), **stats}
+
+@app.post("/extract/all")
+async def extract_all(file: UploadFile = File(...),
+                      engines: str = Query(None, description="comma separated engines to compare, e.g. pymupdf,pdfplumber"),
+                      timeout: float = Query(COMPARE_TIMEOUT, gt=0, description="per-engine timeout in seconds"),
+                      fields: list[str] = Query(None, description="fields for extract_thinker"),
+                      cache: str = Depends(cache_mode), save: bool = SAVE_QUERY, page_numbers: list = Depends(page_selection)):
+    selected = [name.strip() for name in engines.split(",") if name.strip()] if engines else COMPARE_DEFAULT
+    unknown = [name for name in selected if name not in COMPARE_ENGINES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown engines {unknown}, expected any of {list(COMPARE_ENGINES)}")
+
+    start = time.perf_counter()
+    keys, results, digest = {}, {}, None
+    if cache != "bypass":
+        digest = await asyncio.to_thread(hash_upload, file.file)
+        for name in selected:
+            engine, fn = COMPARE_ENGINES[name]
+            keys[name] = result_cache_key(digest, engine, fn, compare_params(name, file.filename, fields, page_numbers))
+            cached = await asyncio.to_thread(result_cache.get, keys[name]) if cache == "use" else None
+            if cached is not None:
+                results[name] = {"status": "ok", "cached": True, **format_compare_result(name, cached)}
+
+    pending = [name for name in selected if name not in results]
+    if pending:
+        with await asyncio.to_thread(handle_file_upload, file) as upload:
+            outcomes = await asyncio.gather(*(run_compare_engine(name, upload, fields, timeout, keys.get(name), page_numbers, digest)
+                                              for name in pending))
+        results.update(zip(pending, outcomes))
+    results = {name: results[name] for name in selected}
+    logging.info(f"Compared {len(selected)} engines on {file.filename} in {time.perf_counter() - start:.2f}s")
+
+    # Save all results
+    md_files = {}
+    for method, result in results.items():
+        text = result.get("text")
+        if save and text and "Unsupported" not in text:
+            md_files[method] = result_sink.save(file.filename, text, method)
+
+    return {"results": results, "saved_files": md_files, "wall_seconds": round(time.perf_counter() - start, 3)}
+
+##################################################################################################################
+# jobs: asynchronous extraction for documents that outlive a request timeout
+# POST /jobs stores the upload and queues the job by priority; a fixed pool of workers runs it on the engine's
+# executor. Page-capable engines run in chunks of JOB_CHUNK_PAGES, which gives pages done/total progress and
+# lets cancellation take effect between chunks. Other engines report no page progress, and cancelling
+# them abandons the call. The in-process backend serves a single node. With JOBS_REDIS_URL set,
+# queue, records, uploads and results live in Redis, so any node's workers can pick up and report a job.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "64"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))  # seconds a finished job and its result are kept
+JOB_CHUNK_PAGES = int(os.getenv("JOB_CHUNK_PAGES", "8"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOBS_REDIS_URL = os.getenv("JOBS_REDIS_URL")
+JOB_PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+JOB_FINISHED = {"done", "failed", "cancelled"}
+
+# engines whose jobs run in page chunks through their page iterator
+JOB_PAGE_ENGINES = {"pymupdf", "pdfplumber", "pdfminer_full", "pdfminer_pages", "tesseract", "doctr"}
+
+def assemble_job_pages(name: str, texts: list):
+    """Combine per-page texts into the same result the engine's whole-document function returns."""
+    if name == "pdfplumber":
+        texts = [text for text in texts if text]
+    if name == "pdfminer_full":
+        return "".join(texts), len(texts)
+    if name == "pdfminer_pages":
+        return texts, len(texts)
+    if name == "doctr":
+        return "\n\n".join(texts).strip()
+    return "\n".join(texts).strip()
+
+class JobCancelled(Exception):
+    pass
+
+class LocalJobBackend:
+    """Single-node job store: records, spooled uploads and results in memory, a bounded priority queue."""
+
+    def __init__(self, max_queue: int, ttl: int):
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.jobs = {}
+        self._uploads = {}
+        self._results = {}
+        self._cancelled = set()
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+
+    def queued(self):
+        return sum(job["status"] == "queued" for job in self.jobs.values())
+
+    async def submit(self, job: dict, upload: SpooledUpload):
+        if self.queued() >= self.max_queue:
+            upload.close()
+            raise HTTPException(status_code=429, detail="Job queue is full, retry later",
+                                headers={"Retry-After": str(max(1, round(JOB_POLL_SECONDS * self.max_queue)))})
+        self.jobs[job["id"]] = job
+        self._uploads[job["id"]] = upload
+        self._queue.put_nowait((JOB_PRIORITIES[job["priority"]], next(self._seq), job["id"]))
+
+    async def next_job(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] == "queued":
+                return job_id
+
+    async def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def update(self, job_id: str, **fields):
+        self.jobs[job_id].update(fields)
+
+    async def open_upload(self, job_id: str):
+        return self._uploads.pop(job_id)
+
+    async def cancel(self, job_id: str):
+        """Cancel a job; returns True when it was still queued and will never run."""
+        self._cancelled.add(job_id)
+        return self.jobs[job_id]["status"] == "queued"
+
+    async def is_cancelled(self, job_id: str):
+        return job_id in self._cancelled
+
+    async def finish(self, job_id: str, status: str, result=None, error=None):
+        self.jobs[job_id].update(status=status, error=error, finished_at=time.time())
+        if result is not None:
+            self._results[job_id] = result
+        self._cancelled.discard(job_id)
+        upload = self._uploads.pop(job_id, None)
+        if upload is not None:
+            upload.close()
+
+    async def store_finished(self, job: dict, result):
+        self.jobs[job["id"]] = job
+        self._results[job["id"]] = result
+
+    async def result(self, job_id: str):
+        return self._results.get(job_id)
+
+    async def expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job["status"] in JOB_FINISHED and now - job["finished_at"] > self.ttl]:
+            del self.jobs[job_id]
+            self._results.pop(job_id, None)
+
+    async def depth(self):
+        return self.queued()
+
+    async def status(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"backend": "local", "max_queue": self.max_queue, "jobs": counts}
+
+class RedisJobBackend:
+    """Multi-node job store in Redis: a sorted-set queue scored by priority then submit time."""
+
+    QUEUE = "pdfhub:jobs:queue"
+
+    def __init__(self, redis, max_queue: int, ttl: int):
+        self.redis = redis
+        self.max_queue = max_queue
+        self.ttl = ttl
+
+    def _key(self, job_id: str, part: str = ""):
+        return f"pdfhub:job:{job_id}{part}"
+
+    async def submit(self, job: dict, upload: SpooledUpload):
+        with upload:
+            if await asyncio.to_thread(self.redis.zcard, self.QUEUE) >= self.max_queue:
+                raise HTTPException(status_code=429, detail="Job queue is full, retry later",
+                                    headers={"Retry-After": str(max(1, round(JOB_POLL_SECONDS * self.max_queue)))})
+            await asyncio.to_thread(self.redis.set, self._key(job["id"], ":file"), upload.read_bytes())
+        await self.update_record(job)
+        score = JOB_PRIORITIES[job["priority"]] * 10**13 + time.time() * 1000
+        await asyncio.to_thread(self.redis.zadd, self.QUEUE, {job["id"]: score})
+
+    async def next_job(self):
+        while True:
+            popped = await asyncio.to_thread(self.redis.zpopmin, self.QUEUE, 1)
+            if popped:
+                member = popped[0][0]
+                return member.decode() if isinstance(member, bytes) else member
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def get(self, job_id: str):
+        raw = await asyncio.to_thread(self.redis.get, self._key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    async def update_record(self, job: dict, ttl: int = None):
+        await asyncio.to_thread(self.redis.set, self._key(job["id"]), json.dumps(job), ex=ttl)
+
+    async def update(self, job_id: str, **fields):
+        job = await self.get(job_id)
+        job.update(fields)
+        await self.update_record(job)
+
+    async def open_upload(self, job_id: str):
+        data = await asyncio.to_thread(self.redis.get, self._key(job_id, ":file"))
+        if data is None:
+            raise RuntimeError("upload is missing from Redis")
+        job = await self.get(job_id)
+        return SpooledUpload.from_fileobj(BytesIO(data), job["filename"], int(UPLOAD_MEMORY_MB * 1024 * 1024))
+
+    async def cancel(self, job_id: str):
+        """Cancel a job; returns True when it was still queued and will never run."""
+        await asyncio.to_thread(self.redis.set, self._key(job_id, ":cancel"), b"1", ex=self.ttl)
+        return bool(await asyncio.to_thread(self.redis.zrem, self.QUEUE, job_id))
+
+    async def is_cancelled(self, job_id: str):
+        return await asyncio.to_thread(self.redis.get, self._key(job_id, ":cancel")) is not None
+
+    async def finish(self, job_id: str, status: str, result=None, error=None):
+        if result is not None:
+            await asyncio.to_thread(self.redis.set, self._key(job_id, ":result"), json.dumps(result), ex=self.ttl)
+        job = await self.get(job_id)
+        job.update(status=status, error=error, finished_at=time.time())
+        await self.update_record(job, ttl=self.ttl)
+        await asyncio.to_thread(self.redis.delete, self._key(job_id, ":file"), self._key(job_id, ":cancel"))
+
+    async def store_finished(self, job: dict, result):
+        await asyncio.to_thread(self.redis.set, self._key(job["id"], ":result"), json.dumps(result), ex=self.ttl)
+        await self.update_record(job, ttl=self.ttl)
+
+    async def result(self, job_id: str):
+        raw = await asyncio.to_thread(self.redis.get, self._key(job_id, ":result"))
+        return json.loads(raw) if raw is not None else None
+
+    async def expire(self):
+        pass  # finished records and results carry a Redis TTL
+
+    async def depth(self):
+        return await asyncio.to_thread(self.redis.zcard, self.QUEUE)
+
+    async def status(self):
+        return {"backend": "redis", "max_queue": self.max_queue, "queued": await asyncio.to_thread(self.redis.zcard, self.QUEUE)}
+
+def create_job_backend():
+    if JOBS_REDIS_URL:
+        return RedisJobBackend(connect_redis(JOBS_REDIS_URL), JOB_QUEUE_SIZE, JOB_RESULT_TTL)
+    return LocalJobBackend(JOB_QUEUE_SIZE, JOB_RESULT_TTL)
+
+job_backend = create_job_backend()
+
+async def run_job_call(engine: str, fn, *args):
+    """run_engine for background work: wait for a slot instead of giving up when the engine is saturated."""
+    while True:
+        try:
+            return await run_engine(engine, fn, *args)
+        except HTTPException as e:
+            if e.status_code not in (429, 503):
+                raise
+            await asyncio.sleep(int(e.headers["Retry-After"]))
+
+async def run_job_pages(job_id: str, name: str, engine: str, upload: SpooledUpload, page_numbers=None):
+    page_count = await asyncio.to_thread(count_pages, upload.source("pymupdf"))
+    numbers = list(selected_pages(page_numbers, page_count))
+    total = len(numbers)
+    await job_backend.update(job_id, progress={"done": 0, "total": total})
+    fn = functools.partial(page_texts, PAGE_ITERATORS[engine])
+    checkpointed = engine in CHECKPOINT_ENGINES and page_count >= CHECKPOINT_MIN_PAGES
+    digest = await asyncio.to_thread(lambda: upload.sha256) if checkpointed else None  # once, not per chunk
+    texts = []
+    for start in range(0, total, JOB_CHUNK_PAGES):
+        if await job_backend.is_cancelled(job_id):
+            raise JobCancelled()
+        end = min(start + JOB_CHUNK_PAGES, total)
+        with known_digest(upload.path, digest) as source:
+            texts += await run_job_call(engine, fn, source, numbers[start:end])
+        await job_backend.update(job_id, progress={"done": end, "total": total})
+    return assemble_job_pages(name, texts)
+
+async def run_job_whole(job_id: str, name: str, engine: str, fn, args):
+    call = asyncio.ensure_future(run_job_call(engine, fn, *args))
+    while not call.done():
+        await asyncio.wait({call}, timeout=JOB_POLL_SECONDS)
+        if not call.done() and await job_backend.is_cancelled(job_id):
+            call.cancel()  # the engine call itself cannot be interrupted; its result is discarded
+            raise JobCancelled()
+    return call.result()
+
+async def run_job(job_id: str):
+    job = await job_backend.get(job_id)
+    name = job["engine"]
+    engine = COMPARE_ENGINES[name][0]
+    if await job_backend.is_cancelled(job_id):
+        await job_backend.finish(job_id, "cancelled")
+        return
+    await job_backend.update(job_id, status="running", started_at=time.time())
+    _page_cache_mode.set(job.get("cache", "use"))
+    logging.info(f"Job {job_id} started: {name} on {job['filename']}")
+    try:
+        with checkpointing(), await job_backend.open_upload(job_id) as upload:
+            await asyncio.to_thread(load_engine, engine)
+            async with admission.admit(engine, upload, job["pages"], background=True):
+                if name in JOB_PAGE_ENGINES:
+                    result = await run_job_pages(job_id, name, engine, upload, job["pages"])
+                else:
+                    result = await run_job_whole(job_id, name, engine, engine_function(name, job["pages"]),
+                                                 engine_args(name, upload, job["fields"]))
+            await observe_pages(engine, upload, job["pages"])
+    except JobCancelled:
+        logging.info(f"Job {job_id} cancelled")
+        await job_backend.finish(job_id, "cancelled")
+        return
+    except Exception as e:
+        logging.error(f"Job {job_id} failed: {e}")
+        await job_backend.finish(job_id, "failed", error=str(e.detail if isinstance(e, HTTPException) else e))
+        return
+    if job["cache_key"] is not None and result:
+        await asyncio.to_thread(result_cache.put, job["cache_key"], result)
+    await job_backend.finish(job_id, "done", result=format_compare_result(name, result))
+    logging.info(f"Job {job_id} done in {time.time() - job['created_at']:.2f}s")
+
+async def job_worker():
+    """Background task that runs queued jobs one at a time."""
+    while True:
+        while admission.draining:  # queued jobs are left to the process that replaces this one
+            await asyncio.sleep(1)
+        job_id = await job_backend.next_job()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            logging.error(f"Job worker error on {job_id}: {e}")
+
+async def expire_jobs():
+    """Background task that drops finished jobs after JOB_RESULT_TTL."""
+    while True:
+        await asyncio.sleep(min(60, max(1, JOB_RESULT_TTL)))
+        await job_backend.expire()
+
+async def public_job(job: dict):
+    view = {key: value for key, value in job.items() if key != "cache_key"}
+    if job["status"] not in JOB_FINISHED and await job_backend.is_cancelled(job["id"]):
+        view["status"] = "cancelling"
+    return view
+
+def check_compare_engine(name: str, fields):
+    """Reject an unknown or disabled COMPARE_ENGINES name, or extract_thinker without fields."""
+    if name not in COMPARE_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine '{name}', expected any of {list(COMPARE_ENGINES)}")
+    if COMPARE_ENGINES[name][0] not in ENABLED_ENGINES:
+        raise HTTPException(status_code=404, detail=f"Engine '{name}' is not enabled on this server")
+    if name == "extract_thinker" and not fields:
+        raise HTTPException(status_code=400, detail="extract_thinker needs the `fields` query parameter")
+
+async def get_job_or_404(job_id: str):
+    job = await job_backend.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job '{job_id}'")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...),
+                     engine: str = Query(..., description=f"one of {list(COMPARE_ENGINES)}"),
+                     priority: str = Query("normal", pattern="^(high|normal|low)$"),
+                     fields: list[str] = Query(None, description="fields for extract_thinker"),
+                     cache: str = Depends(cache_mode), page_numbers: list = Depends(page_selection)):
+    check_compare_engine(engine, fields)
+    job = {"id": uuid.uuid4().hex, "engine": engine, "filename": file.filename, "priority": priority,
+           "fields": fields, "pages": page_numbers, "status": "queued", "progress": {"done": 0, "total": None}, "error": None,
+           "cached": False, "created_at": time.time(), "started_at": None, "finished_at": None, "cache_key": None,
+           "cache": cache}
+    if cache != "bypass":
+        digest = await asyncio.to_thread(hash_upload, file.file)
+        job["cache_key"] = result_cache_key(digest, COMPARE_ENGINES[engine][0], COMPARE_ENGINES[engine][1],
+                                            compare_params(engine, file.filename, fields, page_numbers))
+        cached = await asyncio.to_thread(result_cache.get, job["cache_key"]) if cache == "use" else None
+        if cached is not None:
+            job.update(status="done", cached=True, finished_at=time.time())
+            await job_backend.store_finished(job, format_compare_result(engine, cached))
+            return await public_job(job)
+
+    upload = await asyncio.to_thread(handle_file_upload, file)
+    await job_backend.submit(job, upload)
+    logging.info(f"Job {job['id']} queued: {engine} on {file.filename} ({priority} priority)")
+    return await public_job(job)
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return await public_job(await get_job_or_404(job_id))
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await get_job_or_404(job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail={"status": job["status"], "error": job["error"]})
+    return {"job_id": job_id, "engine": job["engine"], **(await job_backend.result(job_id))}
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await get_job_or_404(job_id)
+    if job["status"] in JOB_FINISHED:
+        return await public_job(job)
+    if await job_backend.cancel(job_id):
+        await job_backend.finish(job_id, "cancelled")
+    return await public_job(await job_backend.get(job_id))
+
+@app.get("/jobs")
+async def jobs_status():
+    return await job_backend.status()
+
+##################################################################################################################
+# batch: many documents per request
+# Files (or the PDFs inside ZIP archives, decompressed one entry at a time) stream through one engine with at
+# most `concurrency` documents in flight. Each finished document becomes one NDJSON line as soon as it is
+# done, so the response starts before the batch ends and memory holds only the documents in flight.
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ENTRY_MB = float(os.getenv("BATCH_MAX_ENTRY_MB", "512"))  # refuse larger (or zip-bomb) entries
+
+def detach_upload_file(file: UploadFile):
+    """Take over an upload's spooled file; FastAPI closes form files before a streamed response is sent."""
+    fileobj, file.file = file.file, BytesIO()
+    fileobj.seek(0)
+    return fileobj
+
+def iter_batch_uploads(fileobjs: list, formats: set):
+    """Yield (name, SpooledUpload or the exception that prevented reading it) for each document in the batch."""
+    memory_limit = int(UPLOAD_MEMORY_MB * 1024 * 1024)
+    for filename, fileobj in fileobjs:
+        if not filename.lower().endswith(".zip"):
+            upload = SpooledUpload.from_fileobj(fileobj, filename, memory_limit)
+            UPLOAD_BYTES.inc(upload.size)
+            yield filename, upload
+            continue
+        fileobj.seek(0, os.SEEK_END)
+        UPLOAD_BYTES.inc(fileobj.tell())
+        fileobj.seek(0)
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            yield filename, e
+            continue
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or Path(info.filename).suffix.lower().lstrip(".") not in formats:
+                    continue
+                name = f"{filename}/{info.filename}"
+                if info.file_size > BATCH_MAX_ENTRY_MB * 1024 * 1024:
+                    yield name, ValueError(f"entry is larger than {BATCH_MAX_ENTRY_MB} MB uncompressed")
+                    continue
+                try:
+                    with archive.open(info) as entry:
+                        upload = SpooledUpload.from_fileobj(entry, Path(info.filename).name, memory_limit)
+                except Exception as e:
+                    yield name, e
+                    continue
+                yield name, upload
+
+async def extract_batch_document(name: str, display_name: str, upload: SpooledUpload, fields, cache: str, save: bool,
+                                 page_numbers=None):
+    engine, fn = COMPARE_ENGINES[name]
+    start = time.perf_counter()
+    with upload:
+        cache_key, result, digest = None, None, None
+        if cache != "bypass":
+            digest = await asyncio.to_thread(lambda: upload.sha256)
+            cache_key = result_cache_key(digest, engine, fn, compare_params(name, upload.filename, fields, page_numbers))
+            result = await asyncio.to_thread(result_cache.get, cache_key) if cache == "use" else None
+        cached = result is not None
+        if not cached:
+            try:
+                async with admission.admit(engine, upload, page_numbers, background=True):
+                    args = engine_args(name, upload, fields)
+                    with known_digest(args[0], digest):
+                        result = await run_job_call(engine, engine_function(name, page_numbers), *args)
+            except Exception as e:
+                logging.error(f"Batch document {display_name} failed with {name}: {e}")
+                return {"filename": display_name, "status": "error", "error": str(e.detail if isinstance(e, HTTPException) else e)}
+            if cache_key is not None and result:
+                await asyncio.to_thread(result_cache.put, cache_key, result)
+            await observe_pages(engine, upload, page_numbers)
+    line = {"filename": display_name, "status": "ok", "cached": cached, **format_compare_result(name, result),
+            "seconds": round(time.perf_counter() - start, 3)}
+    if save and line["text"]:
+        line["saved_as"] = result_sink.save(display_name.replace("/", "_"), line["text"], name)
+    return line
+
+async def stream_batch(name: str, fileobjs: list, concurrency: int, fields, cache: str, save: bool, page_numbers=None):
+    formats = set(SUPPORTED_FORMATS) if name == "docling" else {"pdf"}
+    finished = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def process(display_name, upload):
+        try:
+            line = await extract_batch_document(name, display_name, upload, fields, cache, save, page_numbers)
+        finally:
+            slots.release()
+        await finished.put(line)
+
+    async def produce():
+        documents = iter_batch_uploads(fileobjs, formats)
+        try:
+            while True:
+                await slots.acquire()  # read the next document only once there is room to run it
+                item = await asyncio.to_thread(next, documents, None)
+                if item is None:
+                    break
+                display_name, upload = item
+                if isinstance(upload, Exception):
+                    slots.release()
+                    await finished.put({"filename": display_name, "status": "error", "error": str(upload)})
+                    continue
+                task = asyncio.create_task(process(display_name, upload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            await finished.put(None)
+
+    start, count = time.perf_counter(), 0
+    producer = asyncio.create_task(produce())
+    try:
+        while (line := await finished.get()) is not None:
+            count += 1
+            yield json.dumps(line) + "\n"
+        await producer
+    finally:
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+        for _, fileobj in fileobjs:
+            fileobj.close()
+        elapsed = time.perf_counter() - start
+        logging.info(f"Batch of {count} documents with {name} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.1f} docs/s)")
+
+@app.post("/extract/batch")
+async def extract_batch(files: list[UploadFile] = File(..., description="PDFs and/or ZIP archives of PDFs"),
+                        engine: str = Query("pymupdf", description=f"one of {list(COMPARE_ENGINES)}"),
+                        concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=64, description="documents in flight"),
+                        fields: list[str] = Query(None, description="fields for extract_thinker"),
+                        save: bool = SAVE_QUERY,
+                        cache: str = Depends(cache_mode), page_numbers: list = Depends(page_selection)):
+    check_compare_engine(engine, fields)
+    await asyncio.to_thread(load_engine, COMPARE_ENGINES[engine][0])
+    fileobjs = [(file.filename, detach_upload_file(file)) for file in files]
+    return StreamingResponse(stream_batch(engine, fileobjs, concurrency, fields, cache, save, page_numbers),
+                             media_type="application/x-ndjson")
+
+##################################################################################################################
+# /metrics
+
+@app.middleware("http")
+async def observe_requests(request, call_next):
+    timings = StageTimings()
+    token = _request_timings.set(timings)  # call_next runs the endpoint in a copy of this context
+    HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        _request_timings.reset(token)
+        HTTP_IN_FLIGHT.inc(-1)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(route=path, method=request.method, status=status)
+        HTTP_SECONDS.observe(time.perf_counter() - timings.start, route=path)
+    response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+if tracer is not None:
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app)
+    except ImportError:
+        pass
+
+async def observe_pages(engine: str, upload: SpooledUpload, page_numbers=None):
+    """Count the extracted pages of a PDF towards pdfhub_pages_processed_total."""
+    if not upload.filename.lower().endswith(".pdf"):
+        return
+    try:
+        page_count = await asyncio.to_thread(count_pages, upload.source("pymupdf"))
+        PAGES_PROCESSED.inc(len(selected_pages(page_numbers, page_count)), engine=engine)
+    except Exception as e:
+        logging.warning(f"Could not count pages of {upload.filename}: {e}")
+
+@app.get("/metrics")
+async def metrics():
+    for name, executor in engine_executors.items():
+        ENGINE_IN_FLIGHT.set(executor.in_flight, engine=name)
+        ENGINE_QUEUED.set(executor.waiting, engine=name)
+    JOBS_QUEUED.set(await job_backend.depth())
+    stats = result_cache.status()
+    for outcome in ("memory_hits", "disk_hits", "redis_hits", "misses"):
+        RESULT_CACHE_LOOKUPS.set(stats[outcome], outcome=outcome)
+    stats = page_cache.status()
+    for outcome in ("memory_hits", "disk_hits", "misses"):
+        PAGE_CACHE_LOOKUPS.set(stats[outcome], outcome=outcome)
+    PROCESS_RSS.set(psutil.Process().memory_info().rss)
+    ADMISSION_RESERVED.set(admission.reserved_mb * 1024 * 1024)
+    lines = [line for metric in Metric.registry for line in metric.render()]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+##################################################################################################################
+# admission control
+# Concurrency caps count calls, not memory: ten 500-page scans fit the caps of one worker but not its RAM.
+# Before an engine call, the upload's page count and page sizes are read from the PDF page tree (no page is
+# parsed) and the engine's cost model turns them into the call's predicted peak memory and CPU time. Calls
+# reserve their predicted memory against the process budget, ADMISSION_MEMORY_MB, less what resident models
+# hold. A call that does not fit yet waits in line, first come first served, for up to ADMISSION_MAX_WAIT
+# seconds; one that could never fit is refused with 413; a full line, or one holding more predicted CPU time
+# than could finish within the wait, answers 429 with Retry-After. Jobs and batch documents wait as long as
+# it takes. API_MAX_CALLS / API_MAX_RSS_MB recycle the API process itself: it stops admitting (503) and lets
+# running calls finish. Under a supervisor that starts a replacement (gunicorn or uvicorn --workers, detected
+# from the parent's command line; systemd, Kubernetes or uvicorn.run(workers=...), with API_RECYCLE_EXIT=true) it
+# then stops. Otherwise, as with a plain `python main1.py`, `uvicorn main1:app` or `uvicorn --reload` (whose
+# reloader does not restart a child that exits), exiting would take the service down, so it recycles in place:
+# engine process pools are replaced, resident models are dropped, and admission reopens.
+
+ADMISSION_MEMORY_MB = float(os.getenv("ADMISSION_MEMORY_MB", "0"))  # 0 = 70% of RAM / WEB_CONCURRENCY, <0 = off
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))  # calls waiting for memory
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "300"))  # seconds a request may wait for memory
+API_MAX_CALLS = int(os.getenv("API_MAX_CALLS", "0"))  # engine calls before the process recycles, 0 = never
+API_MAX_RSS_MB = float(os.getenv("API_MAX_RSS_MB", "0"))  # resident memory that recycles the process, 0 = no limit
+API_RECYCLE_EXIT = os.getenv("API_RECYCLE_EXIT", "auto").lower()  # true: exit, false: recycle in place, auto: detect
+
+def supervised():
+    """Whether a process that exits is replaced: API_RECYCLE_EXIT, or a gunicorn / uvicorn --workers parent."""
+    if API_RECYCLE_EXIT != "auto":
+        return API_RECYCLE_EXIT in ("1", "true", "yes")
+    try:
+        parent = psutil.Process().parent()
+        command = parent.cmdline() if parent is not None else []
+    except psutil.Error:
+        return False
+    if any("gunicorn" in part for part in command):
+        return True
+    # uvicorn's --workers supervisor restarts a worker that exits; its --reload one spawns the same kind of child
+    # but never restarts it, and --reload wins over --workers
+    if multiprocessing.parent_process() is None or "--reload" in command:
+        return False
+    workers = os.getenv("WEB_CONCURRENCY", "1")  # uvicorn's default for --workers
+    for i, part in enumerate(command):
+        if part == "--workers" and i + 1 < len(command):
+            workers = command[i + 1]
+        elif part.startswith("--workers="):
+            workers = part.split("=", 1)[1]
+    return workers.isdigit() and int(workers) > 1
+
+@dataclass
+class EngineCost:
+    base_mb: float  # per call: parser state, model activations, tesseract processes
+    page_mb: float  # per selected page, held until the call returns
+    raster_pages: int  # page bitmaps alive at once
+    dpi: int  # their default resolution
+    page_seconds: float  # CPU seconds per page
+
+ENGINE_COSTS = {
+    "pymupdf": EngineCost(20, 0.05, 0, 0, 0.005),
+    "pdfplumber": EngineCost(80, 0.5, 0, 0, 0.15),
+    "pdfminer": EngineCost(60, 0.3, 0, 0, 0.05),
+    "tesseract": EngineCost(100 * OCR_WORKERS, 0.01, OCR_WINDOW + OCR_WORKERS, OCR_DPI, 1.5),
+    "doctr": EngineCost(300, 0.05, 2 * DOCTR_BATCH, DOCTR_DPI, 1.0),
+    "marker": EngineCost(1000, 1.5, 8, 192, 3.0),
+    "docling": EngineCost(800, 1.0, 4, 144, 2.0),
+    "extract_thinker": EngineCost(50, 0.02, 0, 0, 0.01),
+    "pptx2md": EngineCost(100, 0.5, 0, 0, 0.1),
+}
+RASTER_COPIES = 2  # the rendered pixmap and the PIL image made from it
+NON_PDF_PAGE_BYTES = 50 * 1024  # other formats count as one letter-size page per 50 KB
+
+def apply_engine_costs(value: str):
+    """Override cost models from a string such as "marker=1500:2:6" (base_mb:page_mb:page_seconds)."""
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, costs = item.split("=")
+        cost = ENGINE_COSTS[name.strip()]
+        for field, number in zip(("base_mb", "page_mb", "page_seconds"), costs.split(":")):
+            if number:
+                setattr(cost, field, float(number))
+
+apply_engine_costs(os.getenv("ADMISSION_COSTS", ""))
+
+if ADMISSION_MEMORY_MB == 0:
+    ADMISSION_MEMORY_MB = 0.7 * psutil.virtual_memory().total / (1024 * 1024) / int(os.getenv("WEB_CONCURRENCY", "1"))
+
+@dataclass
+class CallCost:
+    pages: int
+    mb: float
+    seconds: float
+
+def estimate_cost(engine: str, upload: SpooledUpload, page_numbers=None, dpi: int = None):
+    """Predict the peak memory and CPU time of `engine` on the selected pages of an upload."""
+    model = ENGINE_COSTS[engine]
+    sizes = upload.page_sizes
+    if sizes is None:
+        sizes = [(612, 792)] * max(1, upload.size // NON_PDF_PAGE_BYTES)
+    sizes = [sizes[number] for number in selected_pages(page_numbers, len(sizes))]
+    mb = model.base_mb + model.page_mb * len(sizes)
+    if model.raster_pages and sizes:
+        pixels = max(width * height for width, height in sizes) * ((dpi or model.dpi) / 72) ** 2
+        mb += min(model.raster_pages, len(sizes)) * pixels * 3 * RASTER_COPIES / (1024 * 1024)
+    return CallCost(len(sizes), round(mb, 1), round(model.page_seconds * len(sizes), 2))
+
+class AdmissionController:
+    """Reserves the predicted memory of engine calls against the process budget, queueing calls that do not fit yet."""
+
+    def __init__(self, budget_mb: float, max_queue: int, max_wait: float):
+        self.budget_mb = budget_mb
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.reserved_mb = 0.0
+        self.running = 0
+        self.calls = 0
+        self.draining = False
+        self.max_rss_mb = API_MAX_RSS_MB  # raised when recycling in place leaves more than that resident
+        self._stopping = False
+        self._waiters = deque()  # [mb, seconds, future], in arrival order
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "too_large": 0, "timed_out": 0}
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        ADMISSIONS.inc(outcome=outcome)
+
+    def _fits(self, mb: float):
+        return self.reserved_mb + mb <= self.budget_mb - model_registry.resident_mb()
+
+    def retry_after(self, seconds: float = 0):
+        """Seconds until the predicted CPU time queued ahead (plus `seconds`) has run."""
+        queued = sum(waiter[1] for waiter in self._waiters if not waiter[2].done())
+        return max(1, round((queued + seconds) / (os.cpu_count() or 1)))
+
+    @asynccontextmanager
+    async def admit(self, engine: str, upload: SpooledUpload, page_numbers=None, dpi: int = None, background: bool = False):
+        """Hold a reservation for one engine call; `background` work waits for memory however long it takes."""
+        if self.draining:
+            raise HTTPException(status_code=503, detail="This worker is restarting, retry later", headers={"Retry-After": "5"})
+        cost = CallCost(0, 0.0, 0.0)
+        if self.budget_mb > 0:
+            cost = await asyncio.to_thread(estimate_cost, engine, upload, page_numbers, dpi)
+            await self._reserve(engine, upload.filename, cost, background)
+        self.running += 1
+        try:
+            yield cost
+        finally:
+            self.running -= 1
+            self.reserved_mb -= cost.mb
+            self.calls += 1
+            self._recycle_if_needed()
+            self._wake()
+
+    async def _reserve(self, engine: str, filename: str, cost: CallCost, background: bool):
+        if cost.mb > self.budget_mb:
+            self._count("too_large")
+            raise HTTPException(status_code=413, detail=f"{cost.pages} pages with {engine} need about {cost.mb:.0f} MB, "
+                                                        f"more than this server's {self.budget_mb:.0f} MB budget")
+        if not self._waiters and self._fits(cost.mb):
+            self.reserved_mb += cost.mb
+            self._count("admitted")
+            return
+        if not background:
+            backlog = sum(waiter[1] for waiter in self._waiters) / (os.cpu_count() or 1)
+            if len(self._waiters) >= self.max_queue or backlog > self.max_wait:
+                self._count("rejected")
+                logging.warning(f"Admission refused {filename} ({engine}, {cost.mb:.0f} MB): {len(self._waiters)} calls "
+                                f"waiting, {self.reserved_mb:.0f} of {self.budget_mb:.0f} MB reserved")
+                raise HTTPException(status_code=429, detail="Server memory is fully booked, retry later",
+                                    headers={"Retry-After": str(self.retry_after(cost.seconds))})
+        waiter = [cost.mb, cost.seconds, asyncio.get_running_loop().create_future()]
+        self._waiters.append(waiter)
+        self._count("queued")
+        wait_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter[2], None if background else self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter[2].done() and not waiter[2].cancelled():
+                self.reserved_mb -= cost.mb  # granted just as the wait ended
+            self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self._count("timed_out")
+                raise HTTPException(status_code=503, detail="Timed out waiting for server memory, retry later",
+                                    headers={"Retry-After": str(self.retry_after(cost.seconds))})
+            raise
+        finally:
+            record_stage("admission", time.perf_counter() - wait_start)
+
+    def _wake(self):
+        """Grant waiting calls, in order, while the head of the line fits."""
+        while self._waiters and not self.draining:
+            mb, _, future = self._waiters[0]
+            if future.done():  # gave up waiting
+                self._waiters.popleft()
+                continue
+            if not self._fits(mb):
+                return
+            self._waiters.popleft()
+            self.reserved_mb += mb
+            future.set_result(None)
+
+    def _recycle_if_needed(self):
+        if not self.draining:
+            if API_MAX_CALLS and self.calls >= API_MAX_CALLS:
+                self.draining = True
+                logging.warning(f"Recycling this worker after {self.calls} engine calls")
+            elif self.max_rss_mb and current_rss_mb() > self.max_rss_mb:
+                self.draining = True
+                logging.warning(f"Recycling this worker at {current_rss_mb():.0f} MB resident (limit {self.max_rss_mb:.0f} MB)")
+        if self.draining and self.running == 0 and not self._stopping:
+            if supervised():
+                self._stopping = True
+                logging.warning("Worker drained, stopping it for a fresh process")
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            logging.warning("Worker drained and not supervised, recycling its engine pools and models in place")
+            for executor in engine_executors.values():
+                executor.recycle("the API worker's limit")
+            model_registry.clear()
+            self.calls = 0
+            self.draining = False
+            if self.max_rss_mb and current_rss_mb() > self.max_rss_mb:
+                # do not drain again on every call for memory that only a fresh process gives back
+                self.max_rss_mb = current_rss_mb() + API_MAX_RSS_MB / 2
+                logging.warning(f"{current_rss_mb():.0f} MB still resident after recycling in place, next recycle at "
+                                f"{self.max_rss_mb:.0f} MB; run under a supervisor or set API_RECYCLE_EXIT=true to restart instead")
+
+    def status(self):
+        return {"budget_mb": round(self.budget_mb, 1), "reserved_mb": round(self.reserved_mb, 1),
+                "models_mb": round(model_registry.resident_mb(), 1), "running": self.running,
+                "waiting": sum(not waiter[2].done() for waiter in self._waiters), "calls": self.calls,
+                "draining": self.draining, **self.stats}
+
+admission = AdmissionController(ADMISSION_MEMORY_MB, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT)
+
+##################################################################################################################
+# profiling
+# `profile=true` on any extraction request (with the X-Profile-Token admin token or from a PROFILE_ALLOWLIST
+# address) runs each engine call of that request under a profiler inside the engine's worker thread or
+# process. PROFILE_SAMPLE_RATE profiles that fraction of all requests. Artifacts are cProfile pstats files
+# (`profile_format=pstats`) or collapsed stacks for flamegraph tools (`collapsed`, from a low-overhead
+# stack sampler). They are listed and downloaded by request id under /profiles. Page-sharded calls are not
+# profiled. When profiling is off, a request costs one query-string lookup and an engine call one
+# context-variable read.
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_ALLOWLIST = {host.strip() for host in os.getenv("PROFILE_ALLOWLIST", "").split(",") if host.strip()}
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_FORMAT = os.getenv("PROFILE_SAMPLE_FORMAT", "collapsed")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # stack sampler period in seconds
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR") or Path(tempfile.gettempdir()) / "pdfhub_profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))  # newest artifacts kept on disk
+PROFILE_SUFFIXES = {"pstats": "prof", "collapsed": "folded"}
+
+@dataclass
+class ProfileRequest:
+    request_id: str
+    format: str
+    sampled: bool
+
+    def artifact_path(self, engine: str):
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        return str(PROFILE_DIR / f"{self.request_id}.{time.time_ns()}.{engine}.{PROFILE_SUFFIXES[self.format]}")
+
+_request_profile = contextvars.ContextVar("request_profile", default=None)
+
+class StackSampler:
+    """Sampling profiler for one thread: counts its collapsed call stacks every `interval` seconds."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.counts.items())
+
+def profiled_call(path: str, fmt: str, fn, *args, **kwargs):
+    """Run fn under cProfile or the stack sampler in the current worker and save the profile to `path`."""
+    if fmt == "pstats":
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            profiler.dump_stats(path)
+    sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+    try:
+        with sampler:
+            return fn(*args, **kwargs)
+    finally:
+        sampler.write(path)
+
+def profile_allowed(request):
+    token = request.headers.get("x-profile-token")
+    if PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+    return request.client is not None and request.client.host in PROFILE_ALLOWLIST
+
+def require_profile_access(request: Request):
+    if not profile_allowed(request):
+        raise HTTPException(status_code=403, detail="Profiling needs the X-Profile-Token admin token or an allowlisted client")
+
+def prune_profiles():
+    artifacts = sorted(PROFILE_DIR.glob("*.*"), key=lambda path: path.stat().st_mtime)
+    for path in artifacts[:max(0, len(artifacts) - PROFILE_KEEP)]:
+        path.unlink(missing_ok=True)
+
+class ProfileMiddleware:
+    """Plain ASGI middleware (no extra task per request) that turns on profiling for a request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        requested = scope["type"] == "http" and b"profile=" in scope["query_string"]
+        if not requested and not (PROFILE_SAMPLE_RATE > 0 and scope["type"] == "http" and random.random() < PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        requested = request.query_params.get("profile", "").lower() in ("1", "true", "yes")
+        fmt = request.query_params.get("profile_format", "pstats") if requested else PROFILE_SAMPLE_FORMAT
+        if requested and not profile_allowed(request):
+            response = JSONResponse(status_code=403, content={"detail": "Profiling needs the X-Profile-Token admin token or an allowlisted client"})
+            return await response(scope, receive, send)
+        if fmt not in PROFILE_SUFFIXES:
+            response = JSONResponse(status_code=400, content={"detail": f"profile_format must be one of {list(PROFILE_SUFFIXES)}"})
+            return await response(scope, receive, send)
+
+        profile = ProfileRequest(uuid.uuid4().hex, fmt, sampled=not requested)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", profile.request_id.encode())]
+            await send(message)
+
+        token = _request_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_profile.reset(token)
+        logging.info(f"Profiled request {profile.request_id} ({fmt}, {'sampled' if profile.sampled else 'requested'}): {scope['path']}")
+        await asyncio.to_thread(prune_profiles)
+
+app.add_middleware(ProfileMiddleware)
+
+@app.get("/profiles/{request_id}", dependencies=[Depends(require_profile_access)])
+async def list_profiles(request_id: str = FastAPIPath(..., pattern="^[0-9a-f]{32}$")):
+    artifacts = sorted(path.name for path in PROFILE_DIR.glob(f"{request_id}.*"))
+    if not artifacts:
+        raise HTTPException(status_code=404, detail=f"No profiles for request '{request_id}'")
+    return {"request_id": request_id, "artifacts": [f"/profiles/{request_id}/{name}" for name in artifacts]}
+
+@app.get("/profiles/{request_id}/{name}", dependencies=[Depends(require_profile_access)])
+async def download_profile(request_id: str = FastAPIPath(..., pattern="^[0-9a-f]{32}$"), name: str = FastAPIPath(...)):
+    path = PROFILE_DIR / name
+    if not name.startswith(f"{request_id}.") or path.name != name or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"No profile '{name}'")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+@app.get("/supported-formats")
+async def supported_formats():
+    return {"supported_formats": SUPPORTED_FORMATS}
+##################################################################################################################
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="PDF Extraction HUB API server")
+    parser.add_argument("--engines", default="", help="comma separated engines to serve, e.g. pymupdf,pdfplumber (default: all)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8006)
+    args = parser.parse_args()
+
+    parse_engine_list(args.engines)  # fail fast on typos
+    if args.engines:
+        os.environ["PDF_HUB_ENGINES"] = args.engines
+    uvicorn.run("main1:app", host=args.host, port=args.port)
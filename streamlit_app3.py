@@ -49,9 +49,9 @@ PDF_TYPES = ["Normal", "Scanned", "Mixed"]
 
 METHODS = {
     "Normal": ["PyMuPDF (fitz)", "PDFPlumber","docling","arker"],
-    "Scanned": ["Tesseract OCR","doctr"],
-    "Mixed": ["PyMuPDF", "PDFMiner", "Tesseract OCR", "Docling", "Marker", "doctr"],
-    "All": ["PyMuPDF (fitz)", "PDFPlumber", "Tesseract OCR", "PyMuPDF", "docling", "Marker", "doctr"]
+    "Scanned": ["Tesseract OCR","Doctr"],
+    "Mixed": ["Auto", "PyMuPDF", "PDFMiner", "Tesseract OCR", "Docling", "Marker", "Doctr"],
+    "All": ["PyMuPDF (fitz)", "PDFPlumber", "Tesseract OCR", "PyMuPDF", "docling", "Marker", "Doctr"]
 }
 
 # API call function
@@ -102,7 +102,9 @@ with st.sidebar:
     method_options = {
         "PDFPlumber": "pdf_normal",
         "Tesseract OCR": "pdf_scanned",
+        "Doctr": "pdf_scanned, pdf_mixed",
         "PyMuPDF": "pdf_mixed",
+        "Auto": "pdf_mixed, pdf_scanned",
         "Docling": "pdf_normal,pdf_mixed,pptx",
         "Marker": "pdf_normal, pdf_mixed",
         "Extract_Thinker": "pdf_normal",
@@ -120,7 +122,9 @@ with st.sidebar:
     method_info = {
         "PDFPlumber": "Best for: Digital PDFs with selectable text",
         "Tesseract OCR": "Best for: Scanned PDFs/image-based documents",
+        "Doctr": "Best for: Scanned PDFs, deep-learning OCR",
         "PyMuPDF": "Best for: Mixed PDFs with text and images",
+        "Auto": "Best for: Mixed PDFs, OCRs only the scanned pages",
         "Docling": "Best for: Office documents (DOCX, PPTX, XLSX)",
         "Marker": "Best for: PDF processing",
         "Extract_Thinker": "Best to chit-chat with your doc",
@@ -162,7 +166,9 @@ if uploaded_file:
                     endpoints = {
                         "PDFPlumber": "/extract/pdfplumber",
                         "Tesseract OCR": "/extract/tesseract",
+                        "Doctr": "/extract/doctr",
                         "PyMuPDF": "/extract/pymupdf",
+                        "Auto": "/extract/auto",
                         "Docling": "/extract/docling",
                         "Marker": "/extract/marker",
                         "Extract_Thinker": "/extract/extract_thinker",
@@ -191,16 +197,9 @@ if uploaded_file:
                 elif method == "Extract_Thinker" and "extracted_data" in result:
                     st.json(result["extracted_data"])
 
-                # Save extracted text
-                output_folder = "output_folder"
-                os.makedirs(output_folder, exist_ok=True)
-                output_file = os.path.join(output_folder, f"{uploaded_file.name.rsplit('.', 1)[0]}_{method.replace(' ', '_')}.md")
-
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(extracted_text)
-                
-                with open(output_file, "rb") as f:
-                    st.download_button("⬇️ Download Extracted Text", f, file_name=output_file, mime="text/plain")
+                # Offer the extracted text for download straight from memory
+                output_file = f"{uploaded_file.name.rsplit('.', 1)[0]}_{method.replace(' ', '_')}.md"
+                st.download_button("⬇️ Download Extracted Text", extracted_text, file_name=output_file, mime="text/plain")
                 
                 st.success("✅ Processing completed successfully!")
 
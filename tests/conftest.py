@@ -0,0 +1,55 @@
+"""Shared fixtures: main1 imported once in a scratch working directory, a client, sample documents and a fake Tesseract."""
+
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+@pytest.fixture(scope="session")
+def main1():
+    with benchmark.app_workdir() as (main1, workdir):
+        main1.JOB_WORKERS = 1  # jobs start one at a time, so their priority order is observable
+        yield main1
+
+@pytest.fixture(scope="session")
+def client(main1):
+    from fastapi.testclient import TestClient
+    with TestClient(main1.app) as client:
+        yield client
+
+@pytest.fixture
+def text_pdf(tmp_path):
+    """Path of a 6-page digital PDF."""
+    return benchmark.make_text_pdf(str(tmp_path / "sample.pdf"), 6)
+
+@pytest.fixture
+def fresh_cache(main1, monkeypatch):
+    monkeypatch.setattr(main1, "result_cache", main1.ResultCache(64))
+    return main1.result_cache
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Replace Tesseract with a digest of the page image; `calls` lists every OCRed image and `fail_on` raises."""
+    import pytesseract
+
+    class FakeOcr:
+        calls = []
+        fail_on = None  # raise on this call number (0-based)
+
+        def image_to_string(self, image, config=""):
+            if len(self.calls) == self.fail_on:
+                self.fail_on = None
+                raise RuntimeError("tesseract was killed")
+            text = hashlib.sha256(image.tobytes()).hexdigest()[:16]
+            self.calls.append(text)
+            return text
+
+    fake = FakeOcr()
+    fake.calls = []
+    monkeypatch.setattr(pytesseract, "image_to_string", fake.image_to_string)
+    return fake
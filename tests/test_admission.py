@@ -0,0 +1,64 @@
+import asyncio
+import signal
+
+import pytest
+
+def one_call(main1, admission):
+    async def call():
+        async with admission.admit("pymupdf", None):
+            pass
+    asyncio.run(call())
+
+@pytest.fixture
+def kills(main1, monkeypatch):
+    kills = []
+    monkeypatch.setattr(main1, "API_MAX_CALLS", 1)
+    monkeypatch.setattr(main1.os, "kill", lambda pid, sig: kills.append(sig))
+    return kills
+
+def test_unsupervised_worker_recycles_in_place(main1, kills, monkeypatch):
+    monkeypatch.setattr(main1, "API_RECYCLE_EXIT", "auto")
+    admission = main1.AdmissionController(0, 8, 10)
+    executor = main1.engine_executors["pdfplumber"]
+    executor.pool()
+    recycled = executor.recycled
+    one_call(main1, admission)
+    assert kills == []
+    assert executor.recycled == recycled + 1 and executor._pool is None
+    assert not admission.draining and admission.calls == 0
+    one_call(main1, admission)  # admits again
+    assert kills == []
+
+def test_supervised_worker_stops(main1, kills, monkeypatch):
+    monkeypatch.setattr(main1, "API_RECYCLE_EXIT", "true")
+    admission = main1.AdmissionController(0, 8, 10)
+    one_call(main1, admission)
+    assert kills == [signal.SIGTERM] and admission.draining
+    with pytest.raises(main1.HTTPException) as refused:
+        one_call(main1, admission)
+    assert refused.value.status_code == 503
+
+class FakeProcess:
+    command = []
+
+    def parent(self):
+        parent = FakeProcess()
+        parent.cmdline = lambda: self.command
+        return parent
+
+@pytest.mark.parametrize("command, spawned, expected", [
+    (["python", "-m", "uvicorn", "main1:app", "--reload"], True, False),
+    (["uvicorn", "main1:app", "--workers", "4", "--reload"], True, False),
+    (["uvicorn", "main1:app", "--workers", "4"], True, True),
+    (["uvicorn", "main1:app", "--workers=2"], True, True),
+    (["uvicorn", "main1:app", "--workers", "1"], True, False),
+    (["gunicorn", "-k", "uvicorn.workers.UvicornWorker", "main1:app"], False, True),
+    (["bash"], False, False),
+])
+def test_supervised_only_under_a_restarting_parent(main1, monkeypatch, command, spawned, expected):
+    monkeypatch.setattr(main1, "API_RECYCLE_EXIT", "auto")
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(FakeProcess, "command", command)
+    monkeypatch.setattr(main1.psutil, "Process", FakeProcess)
+    monkeypatch.setattr(main1.multiprocessing, "parent_process", lambda: object() if spawned else None)
+    assert main1.supervised() is expected
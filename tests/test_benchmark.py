@@ -0,0 +1,56 @@
+import argparse
+import json
+import random
+
+import pytest
+
+import benchmark
+
+def reference_levenshtein(a: str, b: str):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def test_levenshtein_matches_the_textbook_distance():
+    rng = random.Random(0)
+    for _ in range(200):
+        a = "".join(rng.choice("abc ") for _ in range(rng.randrange(0, 150)))
+        b = "".join(rng.choice("abc ") for _ in range(rng.randrange(0, 150)))
+        assert benchmark.levenshtein(a, b) == reference_levenshtein(a, b)
+
+def test_character_error_rate_ignores_layout_whitespace():
+    assert benchmark.character_error_rate("hello\n  world", "hello world") == 0
+    assert benchmark.character_error_rate("hallo world", "hello world") == pytest.approx(1 / 11)
+    assert benchmark.character_error_rate("", "") == 0
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert [benchmark.percentile(values, fraction) for fraction in (0.5, 0.95, 1.0)] == [50, 95, 100]
+    assert benchmark.percentile([7], 0.95) == 7
+
+def write_results(path, **changes):
+    row = {"engine": "pymupdf", "kind": "text", "pages_per_sec": 100.0, "p95_ms": 20.0, "peak_rss_mb": 200.0, "cer": 0.01}
+    with open(path, "w") as f:
+        json.dump({"results": [{**row, **changes}, {"engine": "tesseract", "kind": "scanned", "error": "not installed"}]}, f)
+    return str(path)
+
+@pytest.mark.parametrize("changes, regressed", [
+    ({"pages_per_sec": 95.0, "p95_ms": 21.0}, False),
+    ({"pages_per_sec": 80.0}, True),
+    ({"p95_ms": 30.0}, True),
+    ({"peak_rss_mb": 260.0}, True),
+    ({"cer": 0.05}, True),
+])
+def test_compare_flags_regressions_beyond_the_threshold(tmp_path, capsys, changes, regressed):
+    args = argparse.Namespace(baseline=write_results(tmp_path / "old.json"), candidate=write_results(tmp_path / "new.json", **changes),
+                              threshold=0.1, cer_threshold=0.02)
+    if regressed:
+        with pytest.raises(SystemExit, match="1 regressions"):
+            benchmark.cmd_compare(args)
+    else:
+        benchmark.cmd_compare(args)
+    assert "pymupdf" in capsys.readouterr().out
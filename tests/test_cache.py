@@ -0,0 +1,70 @@
+import pytest
+
+def post(client, path, pdf_bytes, **params):
+    return client.post(path, params=params, files={"file": ("sample.pdf", pdf_bytes)})
+
+def test_hit_does_not_touch_the_upload(main1, client, text_pdf, fresh_cache, monkeypatch):
+    pdf_bytes = open(text_pdf, "rb").read()
+    first = post(client, "/extract/pymupdf", pdf_bytes)
+    assert first.status_code == 200
+    uploads = []
+    handle_file_upload = main1.handle_file_upload
+    monkeypatch.setattr(main1, "handle_file_upload", lambda file: uploads.append(file.filename) or handle_file_upload(file))
+    second = post(client, "/extract/pymupdf", pdf_bytes)
+    assert second.json()["text"] == first.json()["text"]
+    assert uploads == []
+    assert fresh_cache.stats["hits"] == 1
+
+def test_bypass_and_refresh_recompute(main1, client, text_pdf, fresh_cache, monkeypatch):
+    pdf_bytes = open(text_pdf, "rb").read()
+    post(client, "/extract/pymupdf", pdf_bytes)
+    uploads = []
+    handle_file_upload = main1.handle_file_upload
+    monkeypatch.setattr(main1, "handle_file_upload", lambda file: uploads.append(file.filename) or handle_file_upload(file))
+    assert post(client, "/extract/pymupdf", pdf_bytes, cache="bypass").status_code == 200
+    assert post(client, "/extract/pymupdf", pdf_bytes, cache="refresh").status_code == 200
+    assert len(uploads) == 2
+    assert fresh_cache.stats["hits"] == 0
+
+def test_failed_extraction_is_not_cached(main1, client, text_pdf, fresh_cache, monkeypatch):
+    pdf_bytes = open(text_pdf, "rb").read()
+    iter_pages = main1.iter_pages_pymupdf
+
+    def dies_on_page_3(source, page_numbers=None):
+        for number, text in iter_pages(source, page_numbers):
+            if number == 3:
+                raise RuntimeError("worker died")
+            yield number, text
+
+    monkeypatch.setattr(main1, "iter_pages_pymupdf", dies_on_page_3)
+    with pytest.raises(RuntimeError):
+        post(client, "/extract/pymupdf", pdf_bytes)
+    assert fresh_cache.stats["stores"] == 0
+    monkeypatch.setattr(main1, "iter_pages_pymupdf", iter_pages)
+    retry = post(client, "/extract/pymupdf", pdf_bytes)
+    assert retry.status_code == 200
+    assert "Page 6" in retry.json()["text"]
+    assert fresh_cache.stats["hits"] == 0
+
+def store_keys(disk_dir, count=300):
+    import main1
+    cache = main1.ResultCache(0, disk_dir, 64)
+    for i in range(count):
+        cache.put(f"{i % 10:064x}", {"text": "x" * 1000, "i": i})
+    return cache.stats["disk_errors"]
+
+def test_worker_processes_share_the_disk_tier(main1, tmp_path):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("fork")) as pool:
+        errors = list(pool.map(store_keys, [str(tmp_path)] * 4))
+    assert errors == [0, 0, 0, 0]
+    assert len(list(tmp_path.glob("*/*.json"))) == 10 and not list(tmp_path.glob("*/*.tmp"))
+
+def test_failed_disk_store_is_logged_not_raised(main1, tmp_path, caplog):
+    cache = main1.ResultCache(1, tmp_path)
+    key = "ab" * 32
+    (tmp_path / "ab").write_text("a file where the entry's directory should be")
+    cache.put(key, {"text": "kept in memory"})
+    assert cache.stats["disk_errors"] == 1 and "Disk cache store failed" in caplog.text
+    assert cache.get(key) == {"text": "kept in memory"}
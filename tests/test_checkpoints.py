@@ -0,0 +1,57 @@
+import pytest
+
+@pytest.fixture
+def checkpoints(main1, tmp_path, monkeypatch):
+    """Checkpoint every document of 4+ pages into a scratch store, with the page cache out of the way."""
+    monkeypatch.setattr(main1, "CHECKPOINT_MIN_PAGES", 4)
+    monkeypatch.setattr(main1, "PAGE_CACHE_ENGINES", set())
+    monkeypatch.setattr(main1, "checkpoint_store", main1.CheckpointStore(tmp_path / "checkpoints", 3600))
+    return main1.checkpoint_store
+
+def ocr(main1, pdf_path):
+    return main1.extract_pages_tesseract(pdf_path, 50, workers=1, options=main1.OcrOptions(False, 3, 3))
+
+def test_retry_resumes_at_the_first_missing_page(main1, text_pdf, checkpoints, fake_ocr):
+    clean = [page["text"] for page in ocr(main1, text_pdf)]
+    assert checkpoints.list() == []
+    fake_ocr.calls.clear()
+    fake_ocr.fail_on = 4
+    with pytest.raises(RuntimeError):
+        ocr(main1, text_pdf)
+    [checkpoint] = checkpoints.list()
+    assert checkpoint["pages_done"] == 4
+    fake_ocr.calls.clear()
+    assert [page["text"] for page in ocr(main1, text_pdf)] == clean
+    assert len(fake_ocr.calls) == 2
+    assert checkpoints.stats["resumed"] == 1
+    assert checkpoints.list() == []
+
+def test_short_documents_are_not_checkpointed(main1, tmp_path, checkpoints, fake_ocr):
+    import benchmark
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "short.pdf"), 3)
+    fake_ocr.fail_on = 1
+    with pytest.raises(RuntimeError):
+        ocr(main1, pdf_path)
+    assert checkpoints.stats["opened"] == 0
+
+def test_pages_are_yielded_as_soon_as_they_are_recorded(main1, text_pdf, checkpoints, fake_ocr):
+    import functools
+    iterator = functools.partial(main1.iter_ocr_results, dpi=50, window=1, workers=1, options=main1.OcrOptions(False, 3, 3))
+    pages = main1.iter_checkpointed_pages(iterator, text_pdf)
+    assert next(pages)[0] == 1
+    assert len(fake_ocr.calls) < 6
+    assert [number for number, _ in pages] == [2, 3, 4, 5, 6]
+
+def test_upload_digest_is_reused(main1, text_pdf, checkpoints, fake_ocr, monkeypatch):
+    import asyncio
+    import io
+    from fastapi import UploadFile
+    hashed = []
+    hash_upload = main1.hash_upload
+    monkeypatch.setattr(main1, "hash_upload", lambda fileobj: hashed.append(fileobj) or hash_upload(fileobj))
+    fake_ocr.fail_on = 2
+    upload = UploadFile(io.BytesIO(open(text_pdf, "rb").read()), filename="sample.pdf")
+    with pytest.raises(RuntimeError):
+        asyncio.run(main1.run_cached(upload, "tesseract", main1.extract_pages_tesseract, 50, 1, 1, main1.OcrOptions(False, 3, 3)))
+    [checkpoint] = checkpoints.list()
+    assert len(hashed) == 1 and checkpoint["document"] == hash_upload(open(text_pdf, "rb"))
@@ -0,0 +1,44 @@
+import time
+
+def compare(client, pdf_path, **params):
+    with open(pdf_path, "rb") as f:
+        response = client.post("/extract/all", params=params, files={"file": ("sample.pdf", f.read())})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+def test_selected_engines_match_their_own_functions(main1, client, text_pdf, fresh_cache):
+    results = compare(client, text_pdf, engines="pymupdf,pdfplumber,pdfminer_full")
+    assert list(results) == ["pymupdf", "pdfplumber", "pdfminer_full"]
+    assert results["pymupdf"]["text"] == main1.extract_text_pymupdf(text_pdf)
+    assert results["pdfplumber"]["text"] == main1.extract_text_pdfplumber(text_pdf)
+    assert results["pdfminer_full"]["pages"] == 6
+    # process-pool engines have the worker to themselves; thread-pool ones only get the API process's peak
+    assert {"wall_seconds", "cpu_seconds", "peak_rss_mb"} <= results["pdfplumber"].keys()
+    assert {"wall_seconds", "process_peak_rss_mb"} <= results["pymupdf"].keys() and "cpu_seconds" not in results["pymupdf"]
+
+def test_a_failing_engine_does_not_fail_the_others(client, text_pdf, fresh_cache, fake_ocr):
+    fake_ocr.fail_on = 0
+    results = compare(client, text_pdf, engines="tesseract,pymupdf")
+    assert results["tesseract"]["status"] == "error" and "tesseract was killed" in results["tesseract"]["error"]
+    assert results["pymupdf"]["status"] == "ok"
+
+def test_a_slow_engine_times_out_alone(main1, client, text_pdf, fresh_cache, monkeypatch):
+    def slow(source, page_numbers=None):
+        time.sleep(2)
+        return "late"
+
+    monkeypatch.setitem(main1.COMPARE_ENGINES, "pymupdf", ("pymupdf", slow))
+    results = compare(client, text_pdf, engines="pymupdf,pdfminer_full", timeout=0.5)
+    assert results["pymupdf"]["status"] == "timeout"
+    assert results["pdfminer_full"]["status"] == "ok"
+
+def test_second_comparison_is_answered_from_the_cache(client, text_pdf, fresh_cache):
+    first = compare(client, text_pdf, engines="pymupdf,pdfminer_pages")
+    second = compare(client, text_pdf, engines="pymupdf,pdfminer_pages")
+    assert all(second[name].get("cached") for name in second)
+    assert {name: result["text"] for name, result in first.items()} == {name: result["text"] for name, result in second.items()}
+
+def test_unknown_engine_is_rejected(client, text_pdf):
+    with open(text_pdf, "rb") as f:
+        response = client.post("/extract/all", params={"engines": "pymupdf,nope"}, files={"file": ("sample.pdf", f.read())})
+    assert response.status_code == 400
@@ -0,0 +1,70 @@
+import hashlib
+import threading
+
+import pytest
+
+import benchmark
+
+class FakePage:
+    def __init__(self, text):
+        self.text = text
+
+    def render(self):
+        return self.text
+
+class FakePredictor:
+    """Stands in for doctr's ocr_predictor: each page's text is a digest of its image; `batches` lists the call sizes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, images):
+        self.batches.append(len(images))
+        return type("Document", (), {"pages": [FakePage(digest(image)) for image in images]})
+
+def digest(image):
+    return hashlib.sha256(image.tobytes()).hexdigest()[:16]
+
+@pytest.fixture
+def predictor(main1, monkeypatch):
+    fake = FakePredictor()
+    get = main1.model_registry.get
+    monkeypatch.setattr(main1.model_registry, "get", lambda name: fake if name == "doctr" else get(name))
+    return fake
+
+@pytest.fixture
+def page_digests(tmp_path):
+    """A 7-page PDF and the digest of every page rendered at 72 dpi."""
+    import fitz
+    import numpy as np
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "doc.pdf"), 7)
+    with fitz.open(pdf_path) as doc:
+        digests = []
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=72)
+            digests.append(digest(np.frombuffer(pixmap.samples, dtype=np.uint8)))
+    return pdf_path, digests
+
+def test_pages_go_through_the_predictor_in_batches(main1, predictor, page_digests):
+    pdf_path, digests = page_digests
+    pages = list(main1.iter_pages_doctr(pdf_path, dpi=72, batch_size=3))
+    assert pages == [(number + 1, text) for number, text in enumerate(digests)]
+    assert predictor.batches == [3, 3, 1]
+
+def test_selected_pages_only_are_rendered(main1, predictor, page_digests):
+    pdf_path, digests = page_digests
+    text = main1.extract_text_doctr(pdf_path, dpi=72, batch_size=4, page_numbers=[1, 5])
+    assert text == "\n\n".join([digests[1], digests[5]])
+    assert predictor.batches == [2]
+
+def test_closing_early_stops_the_render_thread(main1, predictor, page_digests):
+    pdf_path, _ = page_digests
+    pages = main1.iter_pages_doctr(pdf_path, dpi=72, batch_size=1)
+    next(pages)
+    pages.close()
+    assert not any(thread.name == "doctr-render" for thread in threading.enumerate())
+
+def test_render_errors_reach_the_caller(main1, predictor, tmp_path):
+    with pytest.raises(Exception):
+        list(main1.iter_pages_doctr(str(tmp_path / "missing.pdf"), dpi=72))
+    assert predictor.batches == []
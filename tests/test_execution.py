@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+def executor(main1):
+    return main1.EngineExecutor("pymupdf", main1.EngineProfile("thread", 1, 1))
+
+def fails():
+    raise ValueError("engine error")
+
+def test_slot_released_when_the_call_fails(main1):
+    engine = executor(main1)
+
+    async def run():
+        with pytest.raises(ValueError):
+            await engine.run(fails)
+        await asyncio.sleep(0)
+        return await engine.run(sum, [1, 2])
+
+    assert asyncio.run(run()) == 3
+    assert engine.in_flight == 0 and not engine._slots.locked()
+    engine.shutdown()
+
+def test_slot_released_when_submit_fails(main1):
+    engine = executor(main1)
+    engine.pool().shutdown()
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await engine.run(sum, [1, 2])
+
+    asyncio.run(run())
+    assert engine.in_flight == 0 and not engine._slots.locked()
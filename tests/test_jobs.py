@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import benchmark
+
+def wait_finished(main1, client, job_ids, timeout=60):
+    finished, deadline = {}, time.monotonic() + timeout
+    while len(finished) < len(job_ids) and time.monotonic() < deadline:
+        for job_id in job_ids:
+            job = client.get(f"/jobs/{job_id}").json()
+            if job_id not in finished and job["status"] in main1.JOB_FINISHED:
+                finished[job_id] = job
+                if job["status"] == "done":
+                    job["text"] = client.get(f"/jobs/{job_id}/result").json()["text"]
+        time.sleep(0.05)
+    return finished
+
+@pytest.mark.parametrize("backend", ["local", "redis"])
+def test_jobs_run_by_priority_and_expire(main1, tmp_path, monkeypatch, backend):
+    from fastapi.testclient import TestClient
+    if backend == "redis":
+        monkeypatch.setattr(main1, "job_backend", main1.RedisJobBackend(benchmark.LocalRedis(), main1.JOB_QUEUE_SIZE, 1))
+    else:
+        monkeypatch.setattr(main1, "job_backend", main1.LocalJobBackend(main1.JOB_QUEUE_SIZE, 1))
+    monkeypatch.setattr(main1, "JOB_CHUNK_PAGES", 3)
+    submitted = threading.Event()  # the first job waits until every job is queued
+    iter_pages = main1.iter_pages_pymupdf
+
+    def gated(source, page_numbers=None):
+        submitted.wait(30)
+        yield from iter_pages(source, page_numbers)
+
+    monkeypatch.setitem(main1.PAGE_ITERATORS, "pymupdf", gated)
+    with TestClient(main1.app) as client:  # job workers take from the backend that is set when the app starts
+        run_jobs(main1, client, tmp_path, submitted)
+
+def run_jobs(main1, client, tmp_path, submitted):
+    pdf_bytes = open(benchmark.make_text_pdf(str(tmp_path / "long.pdf"), 12), "rb").read()
+    expected = client.post("/extract/pymupdf", params={"cache": "bypass"}, files={"file": ("long.pdf", pdf_bytes)}).json()["text"]
+
+    jobs = [client.post("/jobs", params={"engine": "pymupdf", "priority": "high" if i % 3 == 2 else "low", "cache": "bypass"},
+                        files={"file": ("long.pdf", pdf_bytes)}).json() for i in range(6)]
+    cancelled = jobs[-2]["id"]
+    client.delete(f"/jobs/{cancelled}")
+    submitted.set()
+    finished = wait_finished(main1, client, [job["id"] for job in jobs])
+
+    assert finished[cancelled]["status"] == "cancelled"
+    done = [job for job in finished.values() if job["status"] == "done"]
+    assert len(done) == 5 and all(job["text"] == expected for job in done)
+    assert finished[jobs[0]["id"]]["progress"] == {**finished[jobs[0]["id"]]["progress"], "done": 12, "total": 12}
+    started = [job["priority"] for job in sorted(done, key=lambda job: job["started_at"])][1:]  # the first starts at once
+    assert started == sorted(started, key=main1.JOB_PRIORITIES.get)
+
+    time.sleep(1.5)
+    asyncio.run(main1.job_backend.expire())
+    assert client.get(f"/jobs/{jobs[0]['id']}").status_code == 404
@@ -0,0 +1,48 @@
+import io
+import json
+
+import pytest
+
+@pytest.fixture
+def layout(main1, text_pdf):
+    return main1.extract_layout(text_pdf, "pymupdf")
+
+def test_pymupdf_words_have_boxes_and_font_sizes(main1, text_pdf, layout):
+    import fitz
+    with fitz.open(text_pdf) as doc:
+        words = [word for page in doc for word in page.get_text("words")]
+    assert [number for number, _ in layout] == list(range(1, 7))
+    columns = main1.layout_columns(layout)
+    assert columns["text"] == [word[4] for word in words]
+    assert all(x0 < x1 and y0 < y1 for x0, y0, x1, y1 in zip(columns["x0"], columns["y0"], columns["x1"], columns["y1"]))
+    assert all(size and size > 0 for size in columns["size"]) and set(columns["confidence"]) == {None}
+
+def test_pdfplumber_finds_the_same_words(main1, text_pdf, layout):
+    assert main1.layout_columns(main1.extract_layout(text_pdf, "pdfplumber"))["text"] == main1.layout_columns(layout)["text"]
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_arrow_and_parquet_round_trip(main1, layout, fmt):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    data = main1.serialize_layout(layout, fmt)
+    table = pq.read_table(io.BytesIO(data)) if fmt == "parquet" else pa.ipc.open_stream(data).read_all()
+    assert table.column_names == list(main1.LAYOUT_COLUMNS)
+    assert str(table.schema.field("x0").type) == "float" and str(table.schema.field("page").type) == "int32"
+    expected = main1.layout_columns(layout)
+    assert table.column("text").to_pylist() == expected["text"]
+    assert table.column("page").to_pylist() == expected["page"]
+
+def test_ndjson_is_one_line_of_columns_per_page(main1, layout):
+    lines = main1.serialize_layout(layout, "ndjson").decode().splitlines()
+    assert len(lines) == len(layout)
+    first = json.loads(lines[0])
+    assert first["page"] == 1 and first["text"] == list(layout[0][1]["text"])
+    assert first["x0"] == [round(value, 2) for value in layout[0][1]["x0"]] and first["confidence"] is None
+
+def test_endpoint_returns_the_selected_pages(client, text_pdf, fresh_cache):
+    pa = pytest.importorskip("pyarrow")
+    with open(text_pdf, "rb") as f:
+        response = client.post("/extract/layout", params={"format": "arrow", "pages": "2-3"}, files={"file": ("sample.pdf", f.read())})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/vnd.apache.arrow.stream")
+    assert set(pa.ipc.open_stream(response.content).read_all().column("page").to_pylist()) == {2, 3}
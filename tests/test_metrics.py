@@ -0,0 +1,47 @@
+import os
+import re
+from pathlib import Path
+
+def sample(text: str, name: str, **labels):
+    """Value of one sample in a Prometheus text exposition, 0 when it is absent."""
+    label_text = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    pattern = "^" + re.escape(f"{name}{{{label_text}}}" if labels else name) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+def test_histogram_buckets_are_cumulative(main1):
+    histogram = main1.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1))
+    main1.Metric.registry.remove(histogram)
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, engine='say "hi"')
+    lines = histogram.render()
+    assert lines[2:] == [
+        'test_seconds_bucket{engine="say \\"hi\\"",le="0.1"} 1',
+        'test_seconds_bucket{engine="say \\"hi\\"",le="1"} 2',
+        'test_seconds_bucket{engine="say \\"hi\\"",le="+Inf"} 3',
+        'test_seconds_sum{engine="say \\"hi\\""} 5.55',
+        'test_seconds_count{engine="say \\"hi\\""} 3',
+    ]
+
+def test_request_updates_engine_page_and_byte_counters(client, text_pdf, fresh_cache):
+    before = client.get("/metrics").text
+    response = client.post("/extract/pymupdf", files={"file": ("sample.pdf", Path(text_pdf).read_bytes())})
+    assert response.status_code == 200
+    after = client.get("/metrics").text
+    for name, labels, delta in [
+        ("pdfhub_engine_calls_total", {"engine": "pymupdf", "outcome": "ok"}, 1),
+        ("pdfhub_engine_seconds_count", {"engine": "pymupdf"}, 1),
+        ("pdfhub_pages_processed_total", {"engine": "pymupdf"}, 6),
+        ("pdfhub_upload_bytes_total", {}, os.path.getsize(text_pdf)),
+        ("pdfhub_http_requests_total", {"method": "POST", "route": "/extract/pymupdf", "status": 200}, 1),
+    ]:
+        assert sample(after, name, **labels) - sample(before, name, **labels) == delta, name
+    assert "# TYPE pdfhub_engine_in_flight gauge" in after
+
+def test_response_carries_stage_timings(client, text_pdf, fresh_cache):
+    response = client.post("/extract/pymupdf", params={"cache": "bypass"},
+                           files={"file": ("sample.pdf", Path(text_pdf).read_bytes())})
+    timings = response.json()["timings"]
+    assert {"upload", "queue", "engine", "total"} <= timings.keys()
+    assert timings["total"] >= timings["engine"]
+    assert response.headers["Server-Timing"].split(", ")[-1].startswith("total;dur=")
@@ -0,0 +1,102 @@
+import pytest
+
+import benchmark
+
+def scanned_pages(main1, tmp_path, texts, dpi=150):
+    import fitz
+    pdf_path = benchmark.make_noisy_scan(str(tmp_path / "scan.pdf"), texts, dpi, seed=1)
+    with fitz.open(pdf_path) as doc:
+        return [main1.render_page(page, dpi, gray=True) for page in doc]
+
+def test_noisy_blank_page_is_blank(main1, tmp_path):
+    [page] = scanned_pages(main1, tmp_path, [""])
+    assert main1.preprocess_page(page, 150)[0] is None
+
+def test_text_page_is_not_blank(main1, tmp_path):
+    [page] = scanned_pages(main1, tmp_path, [benchmark.SAMPLE_TEXT * 3])
+    image, dpi = main1.preprocess_page(page, 150)
+    assert image is not None and image.mode == "L"
+
+def test_single_short_line_is_not_blank(main1, tmp_path):
+    import fitz
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Hello page 1", fontsize=11)
+    assert main1.preprocess_page(main1.render_page(doc[0], 200, gray=True), 200)[0] is not None
+    [page] = scanned_pages(main1, tmp_path, ["Hello page 1"], dpi=200)
+    assert main1.preprocess_page(page, 200)[0] is not None
+
+def test_ink_marks_are_connected_components(main1):
+    import numpy as np
+    ink = np.zeros((6, 8), dtype=bool)
+    ink[0, 0:3] = ink[1, 3] = ink[2, 2:4] = True  # one diagonal-connected mark of 6 pixels
+    ink[4:6, 6:8] = True  # a separate 2x2 mark
+    sizes = main1.ink_marks(ink)
+    assert sorted(sizes[sizes > 0]) == [4, 6]
+
+def test_blank_pages_skip_ocr(main1, tmp_path, fake_ocr):
+    pdf_path = benchmark.make_noisy_scan(str(tmp_path / "scan.pdf"), [benchmark.SAMPLE_TEXT, ""], 150, seed=1)
+    pages = main1.extract_pages_tesseract(pdf_path, 150, workers=1, options=main1.OcrOptions(True, 3, 3))
+    assert [page["blank"] for page in pages] == [False, True]
+    assert len(fake_ocr.calls) == 1
+
+def test_auto_takes_a_tesseract_slot_only_for_scanned_pages(main1, client, fresh_cache, tmp_path, fake_ocr, monkeypatch):
+    pdf_path = benchmark.make_mixed_pdf(str(tmp_path / "mixed.pdf"), 6, scanned_every=3)
+    engines = []
+    run_engine = main1.run_engine
+
+    async def recording_run_engine(engine, fn, *args, **kwargs):
+        engines.append((engine, fn.__name__, kwargs.get("page_numbers")))
+        return await run_engine(engine, fn, *args, **kwargs)
+
+    monkeypatch.setattr(main1, "run_engine", recording_run_engine)
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    response = client.post("/extract/auto", files={"file": ("mixed.pdf", data)})
+    assert response.status_code == 200
+    body = response.json()
+    ocr_numbers = [page["page"] - 1 for page in body["pages"] if page["path"] == "ocr"]
+    assert body["ocr_pages"] == len(ocr_numbers) == len(fake_ocr.calls) > 0
+    assert engines == [("pymupdf", "probe_pages_auto", None), ("tesseract", "extract_pages_tesseract", ocr_numbers)]
+
+    tesseract = client.post("/extract/tesseract", params={"pages": ",".join(str(n + 1) for n in ocr_numbers)},
+                            files={"file": ("mixed.pdf", data)})
+    assert tesseract.status_code == 200 and len(fake_ocr.calls) == len(ocr_numbers)  # answered from the auto call's entry
+
+    engines.clear()
+    text = client.post("/extract/auto", files={"file": ("text.pdf", benchmark.make_tagged_pdf("text only", 3))})
+    assert text.json()["ocr_pages"] == 0 and [engine for engine, _, _ in engines] == ["pymupdf"]
+
+@pytest.mark.parametrize("window, workers", [(1, 1), (3, 2)])
+def test_pipeline_keeps_at_most_a_window_of_pages_rendered(main1, tmp_path, monkeypatch, window, workers):
+    import threading
+    import time
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "doc.pdf"), 8)
+    lock = threading.Lock()
+    alive, peak, widths = [0], [0], []
+    render_page = main1.render_page
+
+    def counting_render(page, dpi, gray=False):
+        with lock:
+            alive[0] += 1
+            peak[0] = max(peak[0], alive[0])
+        return render_page(page, dpi, gray)
+
+    def slow_ocr(number, image, render_seconds, dpi, options):
+        time.sleep(0.02)
+        widths.append(image.width)
+        with lock:
+            alive[0] -= 1
+        return {"page": number + 1, "text": f"page {number + 1}", "render_seconds": render_seconds}
+
+    monkeypatch.setattr(main1, "render_page", counting_render)
+    pages = list(main1.iter_ocr_pages(pdf_path, 100, window, workers, ocr=slow_ocr))
+    assert [page["page"] for page in pages] == list(range(1, 9))
+    assert peak[0] <= window
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        assert set(widths) == {(doc[0].rect * fitz.Matrix(100 / 72, 100 / 72)).irect.width}  # rendered at the requested dpi
+
+def test_pages_report_their_timings(main1, text_pdf, fake_ocr):
+    pages = main1.extract_pages_tesseract(text_pdf, 100, window=2, workers=2, page_numbers=[1, 3, 4])
+    assert [page["page"] for page in pages] == [2, 4, 5] and len(fake_ocr.calls) == 3
+    assert all({"render_seconds", "preprocess_seconds", "ocr_seconds"} <= page.keys() for page in pages)
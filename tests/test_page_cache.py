@@ -0,0 +1,49 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import benchmark
+
+EXTRACTORS = {"pymupdf": "extract_text_pymupdf", "pdfplumber": "extract_text_pdfplumber", "pdfminer": "convert_pdf_to_txt_file"}
+
+@pytest.fixture
+def documents(tmp_path):
+    """Two contracts sharing three boilerplate pages at different positions."""
+    return benchmark.make_boilerplate_docs(str(tmp_path), 2, 3, 2, seed=0)
+
+@pytest.fixture
+def page_cache(main1, monkeypatch):
+    monkeypatch.setattr(main1, "page_cache", main1.ResultCache(64))
+    monkeypatch.setattr(main1, "PAGE_CACHE_ENGINES", {"pymupdf", "pdfplumber", "pdfminer"})
+    return main1.page_cache
+
+@pytest.mark.parametrize("engine", list(EXTRACTORS))
+def test_output_is_identical_with_a_warm_page_cache(main1, documents, page_cache, engine):
+    extract = getattr(main1, EXTRACTORS[engine])
+    uncached = main1.call_with_page_cache("bypass", extract, documents[1])
+    assert page_cache.stats["stores"] == 0
+    main1.call_with_page_cache("use", extract, documents[0])
+    assert main1.call_with_page_cache("use", extract, documents[1]) == uncached
+    assert page_cache.stats["hits"] == 3
+
+def test_failed_store_does_not_fail_the_extraction(main1, documents, page_cache, monkeypatch, caplog):
+    def full_disk(key, value):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(page_cache, "put", full_disk)
+    expected = main1.call_with_page_cache("bypass", main1.extract_text_pdfplumber, documents[0])
+    assert main1.call_with_page_cache("use", main1.extract_text_pdfplumber, documents[0]) == expected
+    assert "Page cache store failed" in caplog.text
+
+def extract_with_shared_dir(cache_dir, documents):
+    import main1
+    main1.page_cache = main1.ResultCache(0, cache_dir, 64)
+    return [main1.call_with_page_cache("refresh", main1.extract_text_pdfplumber, path) for path in documents * 3]
+
+def test_worker_processes_share_boilerplate_pages(main1, documents, tmp_path):
+    expected = [main1.call_with_page_cache("bypass", main1.extract_text_pdfplumber, path) for path in documents] * 3
+    cache_dir = str(tmp_path / "pages")
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("fork")) as pool:
+        results = list(pool.map(extract_with_shared_dir, [cache_dir] * 4, [documents] * 4))
+    assert results == [expected] * 4
@@ -0,0 +1,25 @@
+import pytest
+
+@pytest.mark.parametrize("engine", ["pymupdf", "pdfplumber", "pdfminer"])
+@pytest.mark.parametrize("selection", [(None, 2), ("1-2,5", None), ("2,6-9", 1)])
+def test_selection_matches_full_extraction(main1, text_pdf, engine, selection):
+    iterator = main1.PAGE_ITERATORS[engine]
+    full = [text for _, text in iterator(text_pdf)]
+    page_numbers = main1.parse_page_selection(*selection)
+    pages = list(iterator(text_pdf, page_numbers))
+    expected = [number for number in page_numbers if number < len(full)]
+    assert [number for number, _ in pages] == [number + 1 for number in expected]
+    assert [text for _, text in pages] == [full[number] for number in expected]
+
+def test_endpoint_extracts_only_selected_pages(client, text_pdf, fresh_cache):
+    pdf_bytes = open(text_pdf, "rb").read()
+    response = client.post("/extract/pymupdf", params={"pages": "2,4"}, files={"file": ("sample.pdf", pdf_bytes)})
+    text = response.json()["text"]
+    assert "Page 2" in text and "Page 4" in text
+    assert "Page 1" not in text and "Page 3" not in text
+    response = client.post("/extract/pdfplumber", params={"max_pages": 1}, files={"file": ("sample.pdf", pdf_bytes)})
+    assert "Page 1" in response.json()["text"] and "Page 2" not in response.json()["text"]
+
+def test_invalid_selection_is_rejected(client, text_pdf):
+    response = client.post("/extract/pymupdf", params={"pages": "3-1"}, files={"file": ("sample.pdf", open(text_pdf, "rb").read())})
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+import pstats
+
+import pytest
+
+import benchmark
+
+TOKEN = {"X-Profile-Token": "secret"}
+
+@pytest.fixture
+def profiling(main1, tmp_path, monkeypatch):
+    monkeypatch.setattr(main1, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(main1, "PROFILE_ALLOWLIST", set())
+    monkeypatch.setattr(main1, "PROFILE_DIR", tmp_path)
+    return tmp_path
+
+def post(client, params, headers=None):
+    return client.post(benchmark.ENGINE_ENDPOINTS["pymupdf"], params={"cache": "bypass", **params}, headers=headers,
+                       files={"file": ("doc.pdf", benchmark.make_tagged_pdf("profiled", 2))})
+
+@pytest.mark.parametrize("token", [None, "secret", "wrong"], ids=["disabled", "no token", "wrong token"])
+def test_profiling_needs_the_token(main1, client, profiling, monkeypatch, token):
+    if token is None:
+        monkeypatch.setattr(main1, "PROFILE_TOKEN", None)
+    headers = {"X-Profile-Token": "wrong"} if token == "wrong" else None
+    assert post(client, {"profile": "true"}, headers).status_code == 403
+    assert client.get(f"/profiles/{'0' * 32}", headers=headers).status_code == 403
+    assert list(profiling.iterdir()) == []
+
+@pytest.mark.parametrize("fmt", ["pstats", "collapsed"])
+def test_profiled_request_can_be_downloaded(main1, client, profiling, tmp_path, fmt):
+    response = post(client, {"profile": "true", "profile_format": fmt}, TOKEN)
+    assert response.status_code == 200
+    request_id = response.headers["X-Request-ID"]
+    artifacts = client.get(f"/profiles/{request_id}", headers=TOKEN).json()["artifacts"]
+    assert len(artifacts) == 1 and artifacts[0].endswith(f".pymupdf.{main1.PROFILE_SUFFIXES[fmt]}")
+    download = client.get(artifacts[0], headers=TOKEN)
+    assert download.status_code == 200
+    if fmt == "pstats":
+        (tmp_path / "downloaded.prof").write_bytes(download.content)
+        stats = pstats.Stats(str(tmp_path / "downloaded.prof"))
+        assert any(name == "extract_text_pymupdf" for _, _, name in stats.stats)
+    else:
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in download.text.splitlines())
+
+def test_unprofiled_request_has_no_artifact(client, profiling):
+    response = post(client, {}, TOKEN)
+    assert response.status_code == 200 and "X-Request-ID" not in response.headers
+    assert list(profiling.iterdir()) == []
+
+def test_unknown_profile_is_404(client, profiling):
+    assert client.get(f"/profiles/{'0' * 32}", headers=TOKEN).status_code == 404
+    assert client.get(f"/profiles/{'0' * 32}/{'0' * 32}.1.pymupdf.prof", headers=TOKEN).status_code == 404
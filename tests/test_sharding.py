@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+import benchmark
+
+@pytest.fixture
+def sharded(main1, monkeypatch):
+    """Shard documents of 4 pages or more over 2 workers; the returned list records every shard submitted."""
+    monkeypatch.setattr(main1, "SHARD_MIN_PAGES", 4)
+    monkeypatch.setattr(main1, "SHARD_WORKERS", 2)
+    submitted = []
+    shard_pool = main1.shard_pool
+
+    class RecordingPool:
+        def submit(self, fn, path, pages):
+            submitted.append(pages)
+            return shard_pool().submit(fn, path, pages)
+
+    monkeypatch.setattr(main1, "shard_pool", RecordingPool)
+    return submitted
+
+@pytest.mark.parametrize("page_count, workers", [(1, 4), (7, 2), (64, 4), (5, 8)])
+def test_shards_cover_every_page_once_in_order(main1, page_count, workers):
+    shards = main1.plan_shards(page_count, workers)
+    assert [page for start, end in shards for page in range(start, end)] == list(range(page_count))
+    assert len(shards) <= 2 * workers
+
+@pytest.mark.parametrize("engine, serial", [("pymupdf", "extract_text_pymupdf"), ("pdfplumber", "extract_text_pdfplumber")])
+def test_sharded_text_matches_serial(main1, tmp_path, sharded, engine, serial):
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "long.pdf"), 9)
+    assert asyncio.run(main1.extract_text_sharded(engine, pdf_path)) == getattr(main1, serial)(pdf_path)
+    assert sorted(page for pages in sharded for page in pages) == list(range(9)) and len(sharded) > 1
+
+def test_sharded_pdfminer_matches_serial(main1, tmp_path, sharded):
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "long.pdf"), 9)
+    assert asyncio.run(main1.extract_pdfminer_sharded(pdf_path, per_page=True)) == main1.convert_pdf_to_txt_pages(pdf_path)
+    assert asyncio.run(main1.extract_pdfminer_sharded(pdf_path, per_page=False)) == main1.convert_pdf_to_txt_file(pdf_path)
+
+def test_short_documents_are_not_sharded(main1, text_pdf, sharded, monkeypatch):
+    monkeypatch.setattr(main1, "SHARD_MIN_PAGES", 64)
+    assert asyncio.run(main1.extract_text_sharded("pymupdf", text_pdf)) == main1.extract_text_pymupdf(text_pdf)
+    assert sharded == []
+
+def test_endpoint_sharded_output_is_unchanged(client, tmp_path, fresh_cache, sharded):
+    with open(benchmark.make_text_pdf(str(tmp_path / "long.pdf"), 9), "rb") as f:
+        data = f.read()
+    texts = [client.post("/extract/pymupdf", params={"sharded": sharded_mode, "cache": "bypass"},
+                         files={"file": ("long.pdf", data)}).json()["text"] for sharded_mode in ("false", "true")]
+    assert texts[0] == texts[1] and sharded
@@ -0,0 +1,38 @@
+def test_save_is_written_after_flush(main1, tmp_path):
+    sink = main1.ResultSink("local", tmp_path, "none", 0, 0, 16)
+    name = sink.save("report v2.pdf", "some text", "pymupdf")
+    sink.flush()
+    assert name.startswith("report_v2.pdf_pymupdf_")
+    assert (tmp_path / name).read_text(encoding="utf-8") == "# Extracted Text (pymupdf)\n\nsome text"
+    sink.close()
+
+def test_cas_stores_each_text_once(main1, tmp_path):
+    import json
+    sink = main1.ResultSink("cas", tmp_path, "gzip", 0, 0, 16)
+    names = {sink.save(f"doc{i}.pdf", "same text", "pymupdf") for i in range(3)}
+    sink.flush()
+    assert len(names) == 1 and len(list(tmp_path.glob("objects/*/*.md.gz"))) == 1
+    assert sink.stats["written"] == 1 and sink.stats["deduplicated"] == 2
+    index = [json.loads(line) for line in (tmp_path / "index.ndjson").read_text().splitlines()]
+    assert [entry["filename"] for entry in index] == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+    sink.close()
+
+def test_text_is_not_kept_by_default(client, text_pdf):
+    response = client.post("/extract/pymupdf", files={"file": ("sample.pdf", open(text_pdf, "rb").read())})
+    assert response.json()["saved_as"] is None
+
+def test_cas_index_forgets_pruned_objects(main1, tmp_path):
+    import json
+    import os
+    sink = main1.ResultSink("cas", tmp_path, "none", 0, 3600, 16)
+    old = sink.save("old.pdf", "old text", "pymupdf")
+    sink.save("old-again.pdf", "old text", "pymupdf")
+    sink.flush()
+    os.utime(tmp_path / old, (0, 0))  # saved long ago
+    new = sink.save("new.pdf", "new text", "pymupdf")
+    sink.flush()
+    sink.prune()
+    assert not (tmp_path / old).exists() and (tmp_path / new).exists()
+    index = [json.loads(line) for line in (tmp_path / "index.ndjson").read_text().splitlines()]
+    assert [entry["filename"] for entry in index] == ["new.pdf"]
+    sink.close()
@@ -0,0 +1,40 @@
+import pytest
+
+import benchmark
+
+ROWS = [[f"row {r} col {c}" for c in range(4)] for r in range(6)]
+TABLE_PAGES = [2, 7, 8]
+
+@pytest.fixture
+def sparse_pdf(tmp_path):
+    """Path of a 10-page text PDF whose pages TABLE_PAGES (0-based) hold one ruled table each."""
+    import fitz
+    text = fitz.open(benchmark.make_text_pdf(str(tmp_path / "text.pdf"), 10))
+    benchmark.make_table_pdf(str(tmp_path / "tables.pdf"), [ROWS] * len(TABLE_PAGES))
+    tables = fitz.open(str(tmp_path / "tables.pdf"))
+    doc = fitz.open()
+    for number in range(10):
+        source, position = (tables, TABLE_PAGES.index(number)) if number in TABLE_PAGES else (text, number)
+        doc.insert_pdf(source, from_page=position, to_page=position)
+    doc.save(str(tmp_path / "doc.pdf"))
+    return str(tmp_path / "doc.pdf")
+
+def test_detector_finds_exactly_the_table_pages(main1, sparse_pdf):
+    assert main1.detect_table_pages(sparse_pdf) == TABLE_PAGES
+    assert main1.detect_table_pages(sparse_pdf, [0, 1, 2, 3]) == [2]
+
+def test_cells_of_every_table_are_extracted(main1, sparse_pdf):
+    result = main1.extract_tables_pymupdf(sparse_pdf)
+    assert result["pages_scanned"] == 10
+    assert result["table_pages"] == [number + 1 for number in TABLE_PAGES]
+    assert [table["page"] for table in result["tables"]] == result["table_pages"]
+    assert all(table["rows"] == ROWS for table in result["tables"])
+    assert result["tables"][0]["markdown"].splitlines()[0] == "| " + " | ".join(ROWS[0]) + " |"
+
+def test_endpoint_returns_tables_of_the_selected_pages(client, sparse_pdf, fresh_cache):
+    with open(sparse_pdf, "rb") as f:
+        response = client.post("/extract/tables", params={"pages": "6-10"}, files={"file": ("doc.pdf", f.read())})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["pages_scanned"] == 5 and body["table_pages"] == [8, 9]
+    assert all(table["rows"] == ROWS for table in body["tables"])
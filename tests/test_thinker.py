@@ -0,0 +1,69 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+import benchmark
+
+TRUTH = {"Invoice": "INV-0042", "Total": "1234.50", "Supplier": "ACME-Corp"}
+
+class FakeExtractor:
+    """Answers like the mock LLM server: a field's value when the chunk states "<field>: <value>", else None."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def extract(self, content, contract):
+        chunk = content[0]["content"]
+        self.calls.append(chunk)
+        values = {field: (re.search(rf"{field}: (\S+)", chunk) or [None, None])[1] for field in contract}
+        return type("Result", (), values)
+
+@pytest.fixture
+def llm(main1, fresh_cache, monkeypatch):
+    """Replace the LLM behind the extractor pool; the returned list holds every chunk sent to it."""
+    calls = []
+    lock = threading.Lock()
+
+    class FakePool:
+        @contextmanager
+        def extractor(self):
+            with lock:
+                yield FakeExtractor(calls)
+
+    get = main1.model_registry.get
+    monkeypatch.setattr(main1.model_registry, "get", lambda name: FakePool() if name == "extract_thinker" else get(name))
+    monkeypatch.setattr(main1, "create_dynamic_contract", lambda fields: fields)
+    with ThreadPoolExecutor(2) as pool:  # an app shutdown in another test closes the module's pool for good
+        monkeypatch.setattr(main1, "thinker_pool", pool)
+        yield calls
+
+def test_chunks_pack_pages_and_split_long_ones(main1):
+    assert main1.chunk_texts(["a" * 5, "b" * 5, "c" * 5], limit=10) == ["a" * 5, "b" * 5, "c" * 5]
+    assert main1.chunk_texts(["a" * 4, "b" * 4], limit=10) == ["aaaa\n\nbbbb"]
+    assert main1.chunk_texts(["a", "b", " ", "c"], limit=10) == ["a\n\nb\n\nc"]
+    assert main1.chunk_texts(["x" * 25], limit=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+def test_fields_come_from_the_chunks_that_state_them(main1, llm):
+    filler = benchmark.SAMPLE_TEXT * (main1.THINKER_CHUNK_CHARS // len(benchmark.SAMPLE_TEXT) // 2)
+    texts = [filler] * 6
+    for number, (field, value) in zip([0, 3, 5], TRUTH.items()):
+        texts[number] = f"{field}: {value}\n{filler}"
+    chunks = main1.chunk_texts(texts)
+    assert len(chunks) > 1
+    assert main1.extract_fields_thinker(texts, list(TRUTH)) == TRUTH
+    assert sorted(llm) == sorted(chunks)
+    assert main1.extract_fields_thinker(texts, list(TRUTH)) == TRUTH
+    assert len(llm) == len(chunks)  # every chunk's answer was cached
+
+def test_pdf_fields_are_read_from_the_text_layer(main1, llm, tmp_path):
+    import fitz
+    pdf_path = benchmark.make_text_pdf(str(tmp_path / "doc.pdf"), 5)
+    with fitz.open(pdf_path) as doc:
+        for number, (field, value) in zip([0, 2, 4], TRUTH.items()):
+            doc[number].insert_text((72, 60), f"{field}: {value}", fontsize=10)
+        doc.saveIncr()
+    assert main1.extract_text_thinker(pdf_path, list(TRUTH)) == TRUTH
+    assert main1.extract_text_thinker(pdf_path, ["Total"], page_numbers=[0, 1]) == {"Total": None}
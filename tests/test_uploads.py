@@ -0,0 +1,43 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import benchmark
+
+@pytest.mark.parametrize("memory_mb", [32, 0], ids=["in memory", "spooled"])
+@pytest.mark.parametrize("engine", ["pymupdf", "pdfplumber"])
+def test_same_named_uploads_get_their_own_text(main1, client, tmp_path, monkeypatch, engine, memory_mb):
+    monkeypatch.setattr(main1, "UPLOAD_MEMORY_MB", memory_mb)
+    monkeypatch.setattr(main1, "UPLOAD_DIR", str(tmp_path))
+    documents = [(f"document-{i:04d}", benchmark.make_tagged_pdf(f"document-{i:04d}", 2)) for i in range(8)]
+
+    def post(tag, data):
+        response = client.post(benchmark.ENGINE_ENDPOINTS[engine], params={"cache": "bypass"},
+                               files={"file": ("same_name.pdf", data)})
+        return response.status_code == 200 and tag in json.dumps(response.json())
+
+    with ThreadPoolExecutor(8) as pool:
+        assert all(pool.map(lambda doc: post(*doc), documents))
+    assert os.listdir(tmp_path) == []
+
+def test_batch_extracts_every_document_of_a_zip(client):
+    import io
+    import zipfile
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for i in range(5):
+            zf.writestr(f"doc_{i}.pdf", benchmark.make_tagged_pdf(f"document-{i}", 2))
+    response = client.post("/extract/batch", params={"engine": "pymupdf", "cache": "bypass"},
+                           files=[("files", ("docs.zip", archive.getvalue()))])
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 5 and all(line["status"] == "ok" for line in lines)
+
+@pytest.mark.parametrize("engine", ["pymupdf", "pdfplumber", "pdfminer"])
+def test_stream_sends_every_page_then_done(client, text_pdf, engine):
+    response = client.post(benchmark.ENGINE_ENDPOINTS[engine], params={"stream": "true"},
+                           files={"file": ("sample.pdf", open(text_pdf, "rb").read())})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["page"] for line in lines[:-1]] == list(range(1, 7))
+    assert lines[-1]["event"] == "done"